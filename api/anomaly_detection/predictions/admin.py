@@ -2,7 +2,8 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
-from anomaly_detection.predictions.models import Metric, MetricPredictionProgress, Predictor
+from anomaly_detection.predictions.models import (BackfillRun, Forecast, IngestJob, Metric, MetricPredictionProgress,
+                                                  Predictor)
 
 
 @admin.register(Metric)
@@ -27,28 +28,108 @@ class MetricAdmin(admin.ModelAdmin):
 
 @admin.register(Predictor)
 class PredictorAdmin(admin.ModelAdmin):
-    list_display = ('id', 'region', 'last_training_date')
+    list_display = ('id', 'region', 'engine', 'last_training_date', 'untrainable', 'scored_count', 'stale_at')
     search_fields = ['region__name']
-    list_filter = ['region', 'last_training_date']
+    list_filter = ['engine', 'untrainable', 'region', 'last_training_date', 'stale_at']
     ordering = ['-last_training_date']
     fieldsets = (
         (_('General'), {
-            'fields': ['region', 'last_training_date', 'weights']
+            'fields': ['region', 'last_training_date', 'engine', 'weights_size', 'weights_version']
         }),
         (_('Predictions'), {
-            'fields': ['yearly_seasonality', 'trend']
+            'fields': ['training_window_days', 'untrainable', 'trainable_from', 'parameters', 'yearly_seasonality',
+                       'trend']
+        }),
+        (_('Residuals'), {
+            'fields': ['scored_count', 'mean_abs_error', 'outside_rate', 'stale_at']
+        }),
+    )
+    readonly_fields = ['weights_size', 'weights_version', 'training_window_days', 'untrainable', 'trainable_from',
+                       'parameters', 'yearly_seasonality', 'trend', 'scored_count', 'mean_abs_error', 'outside_rate']
+
+    @admin.display(description=_('Weights size (bytes)'))
+    def weights_size(self, obj):
+        return len(obj.weights) if obj.weights is not None else None
+
+
+@admin.register(Forecast)
+class ForecastAdmin(admin.ModelAdmin):
+    list_display = ('id', 'predictor', 'date', 'yhat')
+    list_filter = ['date']
+    ordering = ['-date']
+    raw_id_fields = ['predictor']
+    fieldsets = (
+        (_('General'), {
+            'fields': ['predictor', 'date']
+        }),
+        (_('Values'), {
+            'fields': ['yhat', 'yhat_lower', 'yhat_upper']
         }),
     )
-    readonly_fields = ['yearly_seasonality', 'trend']
 
 
 @admin.register(MetricPredictionProgress)
 class MetricPredictionProgressAdmin(admin.ModelAdmin):
-    list_display = ('id', 'date', 'success_percentage')
+    list_display = ('id', 'date', 'total', 'predicted', 'success_percentage')
     list_filter = ['date']
     ordering = ['-date']
     fieldsets = (
         (_('General'), {
-            'fields': ['date', 'success_percentage']
+            'fields': ['date', 'total', 'predicted', 'success_percentage']
+        }),
+        (_('Tiles'), {
+            'fields': ['tiles_seeded_at']
+        }),
+    )
+
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'date', 'mode', 'status', 'inserted', 'updated', 'predicted', 'failed',
+                    'created_at')
+    list_filter = ['status', 'date']
+    ordering = ['-created_at']
+    fieldsets = (
+        (_('General'), {
+            'fields': ['filename', 'date', 'mode', 'status', 'error']
+        }),
+        (_('Rows'), {
+            'fields': ['parsed', 'inserted', 'updated', 'predicted', 'failed']
+        }),
+        (_('Dates'), {
+            'fields': ['created_at', 'started_at', 'finished_at']
         }),
     )
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(BackfillRun)
+class BackfillRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'from_date', 'to_date', 'region', 'status', 'percentage_display', 'eta', 'created_at')
+    list_filter = ['status']
+    ordering = ['-created_at']
+    raw_id_fields = ['region']
+    fieldsets = (
+        (_('General'), {
+            'fields': ['from_date', 'to_date', 'region', 'status']
+        }),
+        (_('Progress'), {
+            'fields': ['chunk_size', 'concurrency', 'total_chunks', 'queued_chunks', 'done_chunks', 'failed_chunks',
+                       'predicted', 'percentage_display', 'eta']
+        }),
+        (_('Failures'), {
+            'fields': ['failed_predictor_ids']
+        }),
+        (_('Dates'), {
+            'fields': ['created_at', 'finished_at']
+        }),
+    )
+    readonly_fields = ['chunk_size', 'concurrency', 'total_chunks', 'queued_chunks', 'done_chunks', 'failed_chunks',
+                       'failed_predictor_ids', 'predicted', 'percentage_display', 'eta', 'created_at', 'finished_at']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('predictor_ids')
+
+    @admin.display(description=_('Percentage'))
+    def percentage_display(self, obj):
+        return f"{obj.percentage:.1%}"
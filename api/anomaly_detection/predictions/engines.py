@@ -0,0 +1,97 @@
+from collections import defaultdict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from anomaly_detection.predictions.inference import VectorizedPredictor
+from anomaly_detection.predictions.seasonal import ENGINE as SEASONAL, SeasonalPredictor, fit_seasonal_many
+from anomaly_detection.predictions.training import TrainingResult, fit_prophet
+
+
+PROPHET = 'prophet'
+
+# Class that predicts from the parameters of the predictors of every engine.
+PREDICTOR_CLASSES = {
+    PROPHET: VectorizedPredictor,
+    SEASONAL: SeasonalPredictor,
+}
+
+
+def default_engine() -> str:
+    """
+    The engine used to train the new predictors, unless the region overrides it.
+    """
+    return getattr(settings, 'PREDICTOR_ENGINE', PROPHET)
+
+
+def engine_for_region(region_code: str) -> str:
+    """
+    The engine used to train the new predictors of a region (see `PREDICTOR_ENGINE_BY_REGION`).
+    """
+    return getattr(settings, 'PREDICTOR_ENGINE_BY_REGION', {}).get(region_code, default_engine())
+
+
+def engine_of(parameters: Dict[str, Any]) -> str:
+    """
+    The engine that fitted the parameters. Prophet parameters have no engine, as they were the first ones.
+    """
+    return parameters.get('engine', PROPHET)
+
+
+def fit_history(
+    engine: str,
+    df: pd.DataFrame,
+    min_days: int,
+    horizon_days: int,
+    previous: Optional[Dict[str, Any]] = None,
+) -> Optional[TrainingResult]:
+    """
+    Fits the history of a single region with the given engine. See `fit_prophet` and `fit_seasonal_many`.
+    """
+    if engine == SEASONAL:
+        return fit_seasonal_many({None: df}, min_days=min_days)[None]
+    if previous is not None and engine_of(previous) != PROPHET:
+        # The previous predictor of the region was trained with another engine.
+        previous = None
+    return fit_prophet(df, min_days=min_days, horizon_days=horizon_days, previous=previous)
+
+
+class EnginePredictor:
+    """
+    Prediction of predictors of any engine. The predictors are grouped by engine, so every group
+    is predicted in a single vectorized call.
+    """
+
+    def __init__(self, parameters: Dict[Hashable, Dict[str, Any]]):
+        by_engine = defaultdict(dict)
+        for key, params in parameters.items():
+            by_engine[engine_of(params)][key] = params
+        self.engine = {key: engine_of(params) for key, params in parameters.items()}
+        self.predictors = {engine: PREDICTOR_CLASSES[engine](params) for engine, params in by_engine.items()}
+
+    def predict(self, keys: Sequence[Hashable], dates: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Predicts the value of every (predictor key, date) pair.
+
+        Returns:
+            tuple: The arrays of yhat, yhat_lower and yhat_upper.
+        """
+        if len(self.predictors) == 1:
+            return next(iter(self.predictors.values())).predict(keys, dates)
+
+        engines = np.array([self.engine[key] for key in keys])
+        keys, dates = np.asarray(keys, dtype=object), np.asarray(dates, dtype=object)
+        yhat, yhat_lower, yhat_upper = (np.empty(len(keys)) for _ in range(3))
+        for engine, predictor in self.predictors.items():
+            mask = engines == engine
+            if mask.any():
+                yhat[mask], yhat_lower[mask], yhat_upper[mask] = predictor.predict(keys[mask], dates[mask])
+        return yhat, yhat_lower, yhat_upper
+
+    def predict_dates(self, key: Hashable, dates: Sequence) -> List[Dict[str, Any]]:
+        """
+        Predicts the values of a single predictor for the specified dates.
+        """
+        return self.predictors[self.engine[key]].predict_dates(key, dates)
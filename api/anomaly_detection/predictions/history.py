@@ -0,0 +1,99 @@
+import io
+from datetime import date as date_type, datetime
+from typing import Dict, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+
+class History(NamedTuple):
+    """
+    The metrics of a region, sorted by date.
+    """
+    dates: np.ndarray  # datetime64[D]
+    values: np.ndarray  # float64, NaN for the missing values
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Returns the history as a DataFrame with the columns `ds` and `y`, as Prophet expects.
+        """
+        return pd.DataFrame({'ds': self.dates.astype('datetime64[ns]'), 'y': self.values})
+
+
+def _to_date(value: Union[date_type, datetime]) -> date_type:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def load_histories(
+    cutoffs: Dict[int, Union[date_type, datetime]], window_days: Optional[int] = None
+) -> Dict[int, History]:
+    """
+    Loads the metrics of several regions, previous to a date (exclusive) for each one, with a single
+    `COPY ... TO STDOUT` query. The rows are parsed at once into NumPy arrays, without building
+    a model instance (nor a Python object) per row.
+
+    Args:
+        cutoffs (dict): The cutoff date (or datetime) for each region id.
+        window_days (int): If given, only the metrics of the last `window_days` days before the cutoff.
+
+    Returns:
+        dict: The history of each region id with metrics before its cutoff.
+    """
+    from anomaly_detection.predictions.models import Metric
+
+    if not cutoffs:
+        return {}
+
+    region_ids = list(cutoffs.keys())
+    cutoff_dates = [_to_date(cutoffs[region_id]) for region_id in region_ids]
+
+    # NOTE: Do not delete the order by date, as it is needed for the Prophet model.
+    query = f"""
+        COPY (
+            SELECT metric.region_id, metric.date, metric.value
+            FROM {Metric._meta.db_table} AS metric
+            JOIN unnest(%s::bigint[], %s::date[]) AS cutoff(region_id, date)
+                ON metric.region_id = cutoff.region_id AND metric.date < cutoff.date
+                    AND (%s::integer IS NULL OR metric.date >= cutoff.date - %s::integer)
+            ORDER BY metric.region_id, metric.date
+        ) TO STDOUT WITH (FORMAT csv)
+    """
+    buffer = io.BytesIO()
+    with connection.cursor() as cursor:
+        with cursor.copy(query, [region_ids, cutoff_dates, window_days, window_days]) as copy:
+            for data in copy:
+                buffer.write(data)
+    buffer.seek(0)
+
+    if not buffer.getbuffer().nbytes:
+        return {}
+
+    df = pd.read_csv(
+        buffer,
+        header=None,
+        names=['region_id', 'date', 'value'],
+        dtype={'region_id': np.int64, 'value': np.float64},
+        parse_dates=['date'],
+        date_format='%Y-%m-%d',
+    )
+    region_column = df['region_id'].to_numpy()
+    dates = df['date'].to_numpy().astype('datetime64[D]')
+    values = df['value'].to_numpy()
+
+    # The rows are sorted by region, so every region is a contiguous slice.
+    unique_ids, starts = np.unique(region_column, return_index=True)
+    ends = np.append(starts[1:], len(region_column))
+    return {
+        int(region_id): History(dates=dates[start:end], values=values[start:end])
+        for region_id, start, end in zip(unique_ids, starts, ends)
+    }
+
+
+def load_history(region_id: int, cutoff: Union[date_type, datetime], window_days: Optional[int] = None) -> History:
+    """
+    Loads the metrics of a region previous to a date (exclusive). See `load_histories`.
+    """
+    return load_histories({region_id: cutoff}, window_days=window_days).get(
+        region_id, History(dates=np.array([], dtype='datetime64[D]'), values=np.array([], dtype=float))
+    )
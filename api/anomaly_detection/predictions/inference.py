@@ -0,0 +1,240 @@
+import json
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+
+
+SECONDS_PER_DAY = 3600 * 24.
+# Changepoints used to pad the predictors with less changepoints. Having no slope change, they never
+# modify the trend.
+_PADDING_CHANGEPOINT = 1e12
+
+
+def _noise_band(interval_width: float, sigma_obs: float, y_scale: float) -> float:
+    """
+    Half width of the uncertainty interval inside the history, where it only depends on the observation noise.
+    """
+    return float(NormalDist().inv_cdf(0.5 + interval_width / 2) * sigma_obs * y_scale)
+
+
+def extract_parameters(model: Prophet, horizon_days: int) -> Dict[str, Any]:
+    """
+    Extracts from a fitted Prophet model the parameters needed to predict with `VectorizedPredictor`.
+
+    The uncertainty intervals are estimated once (Prophet simulates them) for every day of the horizon
+    after the end of the history, and stored as the distance from `yhat` to each band. The first
+    position is the exact interval for the dates inside the history.
+    """
+    if model.seasonality_mode != 'additive' or model.extra_regressors or model.holidays is not None:
+        raise ValueError('Only additive seasonalities without regressors nor holidays are supported.')
+
+    history_end = model.start + model.t_scale
+    future = pd.DataFrame({'ds': pd.date_range(start=history_end, periods=horizon_days + 1, freq='D')})
+    future['cap'] = 1
+    future['floor'] = 0
+    forecast = model.predict(future)
+    sigma_obs = float(np.nanmean(model.params['sigma_obs']))
+    band = _noise_band(model.interval_width, sigma_obs, model.y_scale)
+
+    return {
+        'k': float(np.nanmean(model.params['k'])),
+        'm': float(np.nanmean(model.params['m'])),
+        'delta': np.nanmean(model.params['delta'], axis=0).tolist(),
+        'beta': np.nanmean(model.params['beta'], axis=0).tolist(),
+        'sigma_obs': sigma_obs,
+        'changepoints_t': np.asarray(model.changepoints_t).tolist(),
+        'y_scale': float(model.y_scale),
+        'cap': 1.0,
+        'floor': 0.0,
+        'start': model.start.timestamp(),
+        't_scale': model.t_scale.total_seconds(),
+        'seasonalities': [
+            {'period': float(props['period']), 'fourier_order': int(props['fourier_order'])}
+            for props in model.seasonalities.values()
+        ],
+        'band_lower': [band] + (forecast['yhat'] - forecast['yhat_lower']).iloc[1:].tolist(),
+        'band_upper': [band] + (forecast['yhat_upper'] - forecast['yhat']).iloc[1:].tolist(),
+    }
+
+
+def parameters_from_dict(model: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extracts the parameters from a model serialized as a dictionary (see `prophet.serialize.model_to_dict`
+    and `storage.model_to_payload`), without rebuilding the Prophet model.
+
+    As there are no simulated intervals, the bands only take into account the observation noise,
+    which is the exact interval inside the history.
+    """
+    params = model['params']
+    band = _noise_band(model['interval_width'], float(np.nanmean(params['sigma_obs'])), model['y_scale'])
+    key_list, seasonalities = model['seasonalities']
+
+    return {
+        'k': float(np.nanmean(params['k'])),
+        'm': float(np.nanmean(params['m'])),
+        'delta': np.nanmean(params['delta'], axis=0).tolist(),
+        'beta': np.nanmean(params['beta'], axis=0).tolist(),
+        'sigma_obs': float(np.nanmean(params['sigma_obs'])),
+        'changepoints_t': model['changepoints_t'],
+        'y_scale': float(model['y_scale']),
+        'cap': 1.0,
+        'floor': 0.0,
+        'start': model['start'],
+        't_scale': model['t_scale'],
+        'seasonalities': [
+            {'period': float(seasonalities[key]['period']), 'fourier_order': int(seasonalities[key]['fourier_order'])}
+            for key in key_list
+        ],
+        'band_lower': [band],
+        'band_upper': [band],
+    }
+
+
+def parameters_from_json(weights: str) -> Dict[str, Any]:
+    """
+    Extracts the parameters from a model serialized with `prophet.serialize.model_to_json`.
+    """
+    return parameters_from_dict(json.loads(weights))
+
+
+def _stack(rows: List[Sequence[float]], fill: float) -> np.ndarray:
+    """
+    Stacks the sequences in a matrix, padding them at the end with `fill`.
+    """
+    width = max((len(row) for row in rows), default=0)
+    matrix = np.full((len(rows), max(width, 1)), fill, dtype=float)
+    for i, row in enumerate(rows):
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+def _to_seconds(dates: Sequence) -> np.ndarray:
+    """
+    Converts dates (or datetimes) to seconds since epoch, at midnight.
+    """
+    return np.asarray(
+        [d.date() if isinstance(d, datetime) else d for d in dates], dtype='datetime64[D]'
+    ).astype(np.int64) * SECONDS_PER_DAY
+
+
+class VectorizedPredictor:
+    """
+    Closed-form evaluation of the logistic Prophet models (cap=1, floor=0, additive seasonalities) of
+    several predictors with NumPy, without rebuilding the Prophet models nor calling `Prophet.predict()`.
+
+    The parameters of every predictor are stacked in arrays so any number of (predictor, date) pairs
+    can be predicted in a single call.
+    """
+
+    def __init__(self, parameters: Dict[Hashable, Dict[str, Any]]):
+        keys = list(parameters.keys())
+        params = [parameters[key] for key in keys]
+        self.index = {key: i for i, key in enumerate(keys)}
+
+        self.k = np.array([p['k'] for p in params], dtype=float)
+        self.m = np.array([p['m'] for p in params], dtype=float)
+        self.y_scale = np.array([p['y_scale'] for p in params], dtype=float)
+        self.floor = np.array([p['floor'] for p in params], dtype=float)
+        self.cap_scaled = (np.array([p['cap'] for p in params], dtype=float) - self.floor) / self.y_scale
+        self.start = np.array([p['start'] for p in params], dtype=float)
+        self.t_scale = np.array([p['t_scale'] for p in params], dtype=float)
+        self.history_end = self.start + self.t_scale
+        self.delta = _stack([p['delta'] for p in params], fill=0.)
+        self.changepoints_t = _stack([p['changepoints_t'] for p in params], fill=_PADDING_CHANGEPOINT)
+        self.gamma = self._offsets()
+
+        # Every predictor beta is placed on a common layout of Fourier terms: (period, order, sin/cos).
+        self.periods = sorted({s['period'] for p in params for s in p['seasonalities']})
+        orders = {
+            period: max(s['fourier_order'] for p in params for s in p['seasonalities'] if s['period'] == period)
+            for period in self.periods
+        }
+        self.layout = [(period, order) for period in self.periods for order in range(1, orders[period] + 1)]
+        column = {term: i for i, term in enumerate(self.layout)}
+        self.beta = np.zeros((len(params), 2 * len(self.layout)))
+        for i, p in enumerate(params):
+            offset = 0
+            for s in p['seasonalities']:
+                for order in range(1, s['fourier_order'] + 1):
+                    j = column[(s['period'], order)]
+                    self.beta[i, 2 * j] = p['beta'][offset]
+                    self.beta[i, 2 * j + 1] = p['beta'][offset + 1]
+                    offset += 2
+
+        # The last width of the bands is kept for the days after the horizon.
+        band_lower = [p['band_lower'] for p in params]
+        band_upper = [p['band_upper'] for p in params]
+        self.band_lower = _stack(band_lower, fill=np.nan)
+        self.band_upper = _stack(band_upper, fill=np.nan)
+        self.band_length = np.array([len(b) for b in band_lower], dtype=int)
+
+    def _offsets(self) -> np.ndarray:
+        """
+        Computes the offsets of the piecewise logistic trend that keep it continuous at the changepoints.
+        See `Prophet.piecewise_logistic`.
+        """
+        k_cum = np.concatenate((self.k[:, None], self.k[:, None] + np.cumsum(self.delta, axis=1)), axis=1)
+        gamma = np.zeros_like(self.delta)
+        for i in range(self.delta.shape[1]):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(k_cum[:, i + 1] != 0, k_cum[:, i] / k_cum[:, i + 1], 1.)
+            gamma[:, i] = (self.changepoints_t[:, i] - self.m - gamma[:, :i].sum(axis=1)) * (1 - ratio)
+        return gamma
+
+    def _fourier(self, days: np.ndarray) -> np.ndarray:
+        """
+        Computes the Fourier terms of the common layout. See `Prophet.fourier_series`.
+        """
+        features = np.empty((days.shape[0], 2 * len(self.layout)))
+        for j, (period, order) in enumerate(self.layout):
+            c = 2 * np.pi * days * order / period
+            features[:, 2 * j] = np.sin(c)
+            features[:, 2 * j + 1] = np.cos(c)
+        return features
+
+    def predict(self, keys: Sequence[Hashable], dates: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Predicts the value of every (predictor key, date) pair.
+
+        Returns:
+            tuple: The arrays of yhat, yhat_lower and yhat_upper.
+        """
+        p = np.array([self.index[key] for key in keys], dtype=int)
+        seconds = _to_seconds(dates)
+
+        # Trend
+        t = (seconds - self.start[p]) / self.t_scale[p]
+        passed = t[:, None] >= self.changepoints_t[p]
+        k_t = self.k[p] + (self.delta[p] * passed).sum(axis=1)
+        m_t = self.m[p] + (self.gamma[p] * passed).sum(axis=1)
+        trend = self.cap_scaled[p] / (1 + np.exp(-k_t * (t - m_t))) * self.y_scale[p] + self.floor[p]
+
+        # Seasonalities
+        features = self._fourier(seconds / SECONDS_PER_DAY)
+        seasonal = np.einsum('ij,ij->i', features, self.beta[p]) * self.y_scale[p]
+
+        yhat = trend + seasonal
+
+        # Uncertainty intervals
+        horizon = np.rint((seconds - self.history_end[p]) / SECONDS_PER_DAY).astype(int)
+        horizon = np.clip(horizon, 0, self.band_length[p] - 1)
+        return yhat, yhat - self.band_lower[p, horizon], yhat + self.band_upper[p, horizon]
+
+    def predict_dates(self, key: Hashable, dates: Sequence) -> List[Dict[str, Any]]:
+        """
+        Predicts the values of a single predictor for the specified dates.
+        """
+        yhat, yhat_lower, yhat_upper = self.predict([key] * len(dates), dates)
+        return [
+            {
+                'datetime': d if isinstance(d, datetime) else datetime.combine(d, datetime.min.time()),
+                'yhat': float(yhat[i]),
+                'yhat_lower': float(yhat_lower[i]),
+                'yhat_upper': float(yhat_upper[i]),
+            }
+            for i, d in enumerate(dates)
+        ]
@@ -0,0 +1,140 @@
+import io
+import uuid
+from typing import IO, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.utils import timezone
+
+from anomaly_detection.regions.models import Municipality
+from anomaly_detection.predictions.tile_cache import invalidate_metric_tiles
+
+
+# Columns written by COPY. The rest are null until the metrics are predicted (or generated).
+COPY_COLUMNS = ['id', 'region_id', 'date', 'value', 'created_at', 'updated_at']
+COPY_CHUNK_ROWS = 100_000
+REQUIRED_COLUMNS = {'code', 'est'}
+
+
+def read_metrics_csv(source: Union[bytes, IO], nrows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Reads a CSV file of metrics, with the columns `code` (the region code) and `est` (the value).
+    Raises ValueError if the file can not be read, misses a required column or has no rows.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        df = pd.read_csv(source, dtype={'code': str}, nrows=nrows)
+    except Exception as e:
+        raise ValueError(f"Error reading CSV: {str(e)}")
+
+    if not REQUIRED_COLUMNS.issubset(df.columns):
+        missing = REQUIRED_COLUMNS - set(df.columns)
+        raise ValueError(f'Missing required columns: {", ".join(sorted(missing))}')
+    if df.empty:
+        raise ValueError("The uploaded CSV file is empty — no rows found.")
+    return df
+
+
+def prepare_metrics(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Maps the region codes of the rows (columns `code`, `date` and `est`) to region ids, vectorially.
+
+    Returns:
+        tuple: The metrics (columns `region_id`, `date` and `value`) of the known regions,
+            and the unknown region codes.
+    """
+    codes = df['code'].astype(str)
+    region_ids = pd.Series(
+        dict(Municipality.objects.filter(code__in=codes.unique().tolist()).values_list('code', 'id')),
+        dtype='Int64',
+    )
+    mapped = codes.map(region_ids)
+    unknown = sorted(codes[mapped.isna()].unique().tolist())
+
+    known = mapped.notna().to_numpy()
+    metrics = pd.DataFrame({
+        'region_id': mapped[known].astype(np.int64).to_numpy(),
+        'date': pd.to_datetime(df.loc[known, 'date']).dt.date.to_numpy(),
+        'value': pd.to_numeric(df.loc[known, 'est'], errors='coerce').to_numpy(),
+    })
+    return metrics, unknown
+
+
+def copy_metrics(metrics: pd.DataFrame) -> int:
+    """
+    Inserts the metrics (columns `region_id`, `date` and `value`) with `COPY ... FROM STDIN`.
+    The missing values are stored as null. Raises IntegrityError if a metric already exists.
+
+    Returns:
+        int: The number of metrics inserted.
+    """
+    if metrics.empty:
+        return 0
+
+    from anomaly_detection.predictions.models import Metric
+
+    now = timezone.now().isoformat()
+    rows = metrics[['region_id', 'date', 'value']].copy()
+    rows.insert(0, 'id', [uuid.uuid4() for _ in range(len(rows))])
+    rows['created_at'] = now
+    rows['updated_at'] = now
+
+    query = f"COPY {Metric._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    with connection.cursor() as cursor:
+        with cursor.copy(query) as copy:
+            for start in range(0, len(rows), COPY_CHUNK_ROWS):
+                buffer = io.StringIO()
+                rows.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, header=False, index=False)
+                copy.write(buffer.getvalue())
+    invalidate_metric_tiles(rows['date'].unique())
+    return len(rows)
+
+
+def upsert_metrics(metrics: pd.DataFrame) -> Tuple[int, int]:
+    """
+    Inserts the metrics (columns `region_id`, `date` and `value`), or updates the value of the existing ones,
+    with `INSERT ... ON CONFLICT (region_id, date) DO UPDATE` from a temporary table loaded with `COPY`.
+    Only the metrics whose value changed are updated, so their anomaly degree is the only one recomputed,
+    and the predictions of the existing metrics are kept. If a region is repeated, its last row wins.
+
+    Returns:
+        tuple: The number of metrics inserted and updated.
+    """
+    if metrics.empty:
+        return 0, 0
+
+    from anomaly_detection.predictions.models import Metric
+
+    rows = metrics[['region_id', 'date', 'value']].drop_duplicates(['region_id', 'date'], keep='last')
+    table = Metric._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS pg_temp.metric_upload")
+        cursor.execute(
+            "CREATE TEMPORARY TABLE metric_upload (region_id bigint, date date, value double precision) "
+            "ON COMMIT DROP"
+        )
+        with cursor.copy("COPY metric_upload (region_id, date, value) FROM STDIN WITH (FORMAT csv)") as copy:
+            for start in range(0, len(rows), COPY_CHUNK_ROWS):
+                buffer = io.StringIO()
+                rows.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, header=False, index=False)
+                copy.write(buffer.getvalue())
+        # xmax is 0 for the inserted rows, and the id of the current transaction for the updated ones.
+        cursor.execute(
+            f"""
+            WITH affected AS (
+                INSERT INTO {table} AS metric ({', '.join(COPY_COLUMNS)})
+                SELECT gen_random_uuid(), region_id, date, value, NOW(), NOW() FROM metric_upload
+                ON CONFLICT (region_id, date) DO UPDATE
+                    SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at
+                    WHERE metric.value IS DISTINCT FROM EXCLUDED.value
+                RETURNING xmax = 0 AS inserted
+            )
+            SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM affected
+            """
+        )
+        inserted, updated = cursor.fetchone()
+    if inserted or updated:
+        invalidate_metric_tiles(rows['date'].unique())
+    return inserted, updated
@@ -0,0 +1,97 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from anomaly_detection.predictions.inference import VectorizedPredictor, parameters_from_dict
+from anomaly_detection.predictions.models import Metric, Predictor
+from anomaly_detection.predictions.storage import model_to_payload
+from anomaly_detection.predictions.training import fit_model, load_training_history, prepare_history
+
+
+def _parameters(model):
+    return parameters_from_dict(model_to_payload(model))
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the cold and warm started fits of the predictors. The time of the whole fit
+    is measured (the preprocessing of Prophet and the optimizer), not the loading of the history.
+    Nothing is saved in the database.
+    """
+
+    help = """Benchmark the training of the predictors with and without warm start."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=datetime.now().strftime('%Y-%m-%d'),
+            help='Training date of the new predictors (format: YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--regions',
+            type=int,
+            default=20,
+            help='Number of random regions to benchmark.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to benchmark the training.
+        """
+        date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        previous_date = date - timedelta(days=Predictor.EXPIRY_DAYS)
+        previous_cutoff = pd.Timestamp(previous_date)
+
+        region_ids = list(
+            Metric.objects.filter(date__lt=previous_date, value__gt=0).values('region_id').annotate(
+                days=Count('id')
+            ).filter(days__gte=Predictor.MIN_DAYS_FOR_TRAINING).order_by('?').values_list(
+                'region_id', flat=True
+            )[:options['regions']]
+        )
+        history = load_training_history({region_id: aware_datetime for region_id in region_ids})
+
+        cold_times, warm_times, differences = [], [], []
+        for region_id, df in history.items():
+            df = prepare_history(df, min_days=Predictor.MIN_DAYS_FOR_TRAINING)
+            if df is None or df[df['ds'] < previous_cutoff]['y'].count() < Predictor.MIN_DAYS_FOR_TRAINING:
+                continue
+            # The previous predictor of the region, trained EXPIRY_DAYS before.
+            previous, _ = fit_model(df[df['ds'] < previous_cutoff])
+
+            start = time.monotonic()
+            cold, _ = fit_model(df)
+            cold_times.append(time.monotonic() - start)
+
+            start = time.monotonic()
+            warm, warm_started = fit_model(df, previous=_parameters(previous))
+            warm_times.append(time.monotonic() - start)
+
+            dates = [date + timedelta(days=i) for i in range(Predictor.EXPIRY_DAYS + 1)]
+            vectorized = VectorizedPredictor({'cold': _parameters(cold), 'warm': _parameters(warm)})
+            cold_yhat, _, _ = vectorized.predict(['cold'] * len(dates), dates)
+            warm_yhat, _, _ = vectorized.predict(['warm'] * len(dates), dates)
+            differences.append(np.abs(cold_yhat - warm_yhat).max())
+
+            self.stdout.write(
+                f"Region {region_id}: cold fit {cold_times[-1]:.3f}s, warm fit {warm_times[-1]:.3f}s "
+                f"(warm started: {warm_started}), max |yhat difference| {differences[-1]:.4f}"
+            )
+
+        if not cold_times:
+            self.stdout.write(self.style.WARNING("No region has enough data to be benchmarked."))
+            return
+
+        cold_mean, warm_mean = np.mean(cold_times), np.mean(warm_times)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(cold_times)} regions: cold {cold_mean:.3f}s/fit, warm {warm_mean:.3f}s/fit "
+            f"({cold_mean / warm_mean:.2f}x). Mean max |yhat difference| {np.mean(differences):.4f}, "
+            f"worst {np.max(differences):.4f}."
+        ))
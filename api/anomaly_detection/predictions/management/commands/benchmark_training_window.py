@@ -0,0 +1,93 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from anomaly_detection.predictions.models import Metric, Predictor
+from anomaly_detection.predictions.training import (fit_model, load_training_history, prepare_history,
+                                                    training_window_days)
+
+
+class Command(BaseCommand):
+    """
+    Django command to compare the fit time of the predictors as the history grows, using the whole history
+    or only the training window (see `PREDICTOR_TRAINING_WINDOW_DAYS`). The growth is simulated by truncating
+    the history of every region to its last N years. Nothing is saved in the database.
+    """
+
+    help = """Benchmark the training of the predictors with and without the training window."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=datetime.now().strftime('%Y-%m-%d'),
+            help='Training date of the predictors (format: YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--regions',
+            type=int,
+            default=5,
+            help='Number of regions (with the longest histories) to benchmark.'
+        )
+        parser.add_argument(
+            '--window-days',
+            type=int,
+            default=None,
+            help='Days of the training window (default: PREDICTOR_TRAINING_WINDOW_DAYS)'
+        )
+
+    def _fit_time(self, df):
+        df = prepare_history(df, min_days=Predictor.MIN_DAYS_FOR_TRAINING)
+        if df is None:
+            return None
+        start = time.monotonic()
+        fit_model(df)
+        return time.monotonic() - start
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to benchmark the training window.
+        """
+        date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        window_days = options['window_days'] or training_window_days(Predictor.MIN_DAYS_FOR_TRAINING)
+        if not window_days:
+            self.stdout.write(self.style.WARNING("The training window is disabled, set --window-days."))
+            return
+
+        region_ids = list(
+            Metric.objects.filter(date__lt=date, value__isnull=False).values('region_id').annotate(
+                days=Count('id')
+            ).order_by('-days').values_list('region_id', flat=True)[:options['regions']]
+        )
+        history = load_training_history({region_id: aware_datetime for region_id in region_ids})
+        cutoff = pd.Timestamp(date)
+
+        full_times, window_times = defaultdict(list), defaultdict(list)
+        first_years = int(np.ceil(window_days / 365))
+        for region_id, df in history.items():
+            max_years = int((cutoff - df['ds'].min()).days // 365)
+            for years in range(first_years, max_years + 1):
+                df_years = df[df['ds'] >= cutoff - timedelta(days=365 * years)]
+                full = self._fit_time(df_years)
+                window = self._fit_time(df_years[df_years['ds'] >= cutoff - timedelta(days=window_days)])
+                if full is not None and window is not None:
+                    full_times[years].append(full)
+                    window_times[years].append(window)
+
+        if not full_times:
+            self.stdout.write(self.style.WARNING("No region has enough data to be benchmarked."))
+            return
+
+        self.stdout.write(f"{'History':>8} {'Regions':>8} {'Whole history':>14} {f'Window ({window_days}d)':>14}")
+        for years in sorted(full_times):
+            self.stdout.write(
+                f"{years:>7}y {len(full_times[years]):>8} {np.mean(full_times[years]):>13.3f}s "
+                f"{np.mean(window_times[years]):>13.3f}s"
+            )
@@ -1,13 +1,10 @@
-import math
 import os
 
 import pandas as pd
-from tqdm import tqdm
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from anomaly_detection.regions.models import Municipality
-from anomaly_detection.predictions.models import Metric
+from anomaly_detection.predictions.ingestion import copy_metrics, prepare_metrics, upsert_metrics
 
 
 class Command(BaseCommand):
@@ -27,6 +24,11 @@ class Command(BaseCommand):
             default=os.path.join(self.DATA_DIR),
             help='Path to the input CSV files'
         )
+        parser.add_argument(
+            '--upsert',
+            action='store_true',
+            help='Update the value of the metrics that already exist, instead of failing.'
+        )
 
     def unify_metrics(self, files, *args, **kwargs):
         """
@@ -70,30 +72,18 @@ class Command(BaseCommand):
         print(f"Unified DataFrame shape: {df.shape}")
         print(df.head())
 
-        codes = df['code'].unique()
-        municipality_map = {
-            m.code: m
-            for m in Municipality.objects.filter(code__in=codes)
-        }
-
-        metrics_to_create = []
-        for _, row in tqdm(df.iterrows(), total=len(df)):
-            region = municipality_map.get(row['code'])
-            if not region:
-                continue  # Or log it as an issue
-
-            try:
-                metrics_to_create.append(Metric(
-                    region=region,
-                    date=row['date'],
-                    value=row['est'] if not math.isnan(row['est']) else None,
-                ))
-            except Exception as e:
-                print(f"Error creating Metric for row {row}: {e}")
+        metrics, unknown_codes = prepare_metrics(df)
+        if unknown_codes:
+            self.stdout.write(self.style.WARNING(f"Skipping {len(unknown_codes)} unknown region codes."))
 
-        print(f"Total metrics to create: {len(metrics_to_create)}")
-        print('Creating Metric objects, this may take a while...')
+        print(f"Total metrics to create: {len(metrics)}")
+        print('Copying Metric rows, this may take a while...')
 
         with transaction.atomic():
-            Metric.objects.bulk_create(metrics_to_create, batch_size=5000)
-        self.stdout.write(self.style.SUCCESS("Successfully inserted metrics data into the database."))
+            if options['upsert']:
+                inserted, updated = upsert_metrics(metrics)
+            else:
+                inserted, updated = copy_metrics(metrics), 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully inserted {inserted} and updated {updated} metrics into the database."
+        ))
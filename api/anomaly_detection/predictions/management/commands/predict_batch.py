@@ -2,12 +2,13 @@ from django.core.management.base import BaseCommand
 from datetime import datetime
 
 from anomaly_detection.regions.models import Municipality
-from anomaly_detection.predictions.tasks import predict_batch_task
+from anomaly_detection.predictions.models import BackfillRun
 
 
 class Command(BaseCommand):
     """
     Django command to update the predicted values in the Metric model, given their assigned predictor.
+    The predictions are run as a backfill (see `BackfillRun`), whose progress can be followed in the admin.
     """
 
     help = """Load metrics data into the database."""
@@ -31,19 +32,40 @@ class Command(BaseCommand):
             default=datetime.now().strftime('%Y-%m-%d'),
             help='End date for filtering metrics (format: YYYY-MM-DD)'
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Number of predictors of every task (default: BACKFILL_CHUNK_SIZE)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Maximum number of tasks queued at the same time (default: BACKFILL_CONCURRENCY)'
+        )
 
     def handle(self, *args, **options):
         """
         Handle the command to insert predictions data into the database.
         """
 
-        from_date = options.get('from_date')
-        to_date = options.get('to_date')
+        from_date = datetime.strptime(options.get('from_date'), '%Y-%m-%d').date()
+        to_date = datetime.strptime(options.get('to_date'), '%Y-%m-%d').date()
         region = options.get('region')
 
-        region_qs = Municipality.objects.all()
+        region_id = None
         if region:
-            region_qs = region_qs.filter(code=region)
+            region_id = Municipality.objects.values_list('id', flat=True).get(code=region)
 
-        for region in region_qs.iterator(chunk_size=1000):
-            predict_batch_task.delay(from_date=from_date, to_date=to_date, region_id=region.id)
+        run = BackfillRun.start(
+            from_date=from_date,
+            to_date=to_date,
+            region_id=region_id,
+            chunk_size=options.get('chunk_size'),
+            concurrency=options.get('concurrency'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill {run.id} started: {len(run.predictor_ids)} predictors in {run.total_chunks} chunks, "
+            f"{run.concurrency} at a time."
+        ))
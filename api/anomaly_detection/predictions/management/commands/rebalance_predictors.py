@@ -0,0 +1,97 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from anomaly_detection.predictions.models import Forecast, Predictor
+from anomaly_detection.predictions.training import default_max_workers, train_predictors
+
+
+class Command(BaseCommand):
+    """
+    Django command to move the current predictors onto the staggered retraining schedule
+    (see `Predictor.scheduled_training_date`), so they do not expire all on the same day.
+    The training date of every predictor is moved back to the start of the retraining slot of its region
+    that contains it, so it expires at the end of that slot instead of EXPIRY_DAYS after its training.
+    The moved predictors are trained again with the history up to their new training date (see
+    `training.train_predictors`), so they predict as a predictor created on schedule would.
+    Only for the schedule retraining policy: with the drift policy, no predictor is off schedule.
+    """
+
+    help = """Move the current predictors onto the staggered retraining schedule."""
+
+    BATCH_SIZE = 500
+    # The training of a moved predictor is discarded: it is trained again at its new training date.
+    RESET_FIELDS = [field for field in Predictor.TRAINING_FIELDS if field != 'weights_version']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=datetime.now().strftime('%Y-%m-%d'),
+            help='Date of the current predictors (format: YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=None,
+            help=f'Number of processes used to fit the models (default: {default_max_workers()})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how the retrainings would be spread.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to rebalance the predictors.
+        """
+        date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        expiry = timedelta(days=Predictor.EXPIRY_DAYS)
+
+        predictors = list(
+            Predictor.objects.filter(
+                last_training_date__lte=aware_datetime,
+                last_training_date__gte=aware_datetime - expiry,
+            ).order_by('region_id', '-last_training_date').distinct('region_id').only(
+                'id', 'region_id', 'last_training_date', 'engine', 'parameters'
+            )
+        )
+        existing = set(
+            Predictor.objects.filter(region_id__in=[p.region_id for p in predictors]).values_list(
+                'region_id', 'last_training_date'
+            )
+        )
+
+        before = Counter((p.last_training_date + expiry).date() for p in predictors)
+        moved = []
+        for predictor in predictors:
+            scheduled = Predictor.scheduled_training_date(predictor.region_id, predictor.last_training_date)
+            if scheduled != predictor.last_training_date and (predictor.region_id, scheduled) not in existing:
+                predictor.last_training_date = scheduled
+                for field in self.RESET_FIELDS:
+                    setattr(predictor, field, None)
+                moved.append(predictor)
+        after = Counter((p.last_training_date + expiry).date() for p in predictors)
+
+        self.stdout.write(
+            f"{len(moved)}/{len(predictors)} predictors off schedule. Maximum retrainings in a day: "
+            f"{max(before.values(), default=0)} now, {max(after.values(), default=0)} once rebalanced."
+        )
+        if options['dry_run'] or not moved:
+            return
+
+        for start in range(0, len(moved), self.BATCH_SIZE):
+            batch = moved[start:start + self.BATCH_SIZE]
+            with transaction.atomic():
+                Predictor.objects.bulk_update(batch, fields=['last_training_date'] + self.RESET_FIELDS)
+                Forecast.objects.filter(predictor__in=batch).delete()
+
+        report = train_predictors(date=date, max_workers=options['max_workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebalanced {len(moved)} predictors, and trained {report['trained']} in {report['elapsed']:.1f}s."
+        ))
@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from anomaly_detection.predictions.models import MetricPredictionProgress
+from anomaly_detection.predictions.tasks import seed_tiles_task
+from anomaly_detection.predictions.tile_seeding import seed_tiles
+
+
+class Command(BaseCommand):
+    """
+    Django command to render, in parallel, the metric and region tiles of a date and store them in the tile cache.
+    """
+
+    help = """Seed the tile cache with the tiles of a date."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=None,
+            help='Date of the metric tiles (format: YYYY-MM-DD, default: the last date with its metrics predicted)'
+        )
+        parser.add_argument(
+            '--min-zoom',
+            type=int,
+            default=settings.TILE_SEED_MIN_ZOOM,
+            help=f'Minimum zoom level of the tiles (default: {settings.TILE_SEED_MIN_ZOOM})'
+        )
+        parser.add_argument(
+            '--max-zoom',
+            type=int,
+            default=settings.TILE_SEED_MAX_ZOOM,
+            help=f'Maximum zoom level of the tiles (default: {settings.TILE_SEED_MAX_ZOOM})'
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=None,
+            help=(
+                f'Number of processes used to render the tiles (default: {settings.TILE_SEED_MAX_WORKERS}). '
+                'With --async, the workers of the queue render the batches instead.'
+            )
+        )
+        parser.add_argument(
+            '--no-regions',
+            action='store_false',
+            dest='regions',
+            help='Only seed the metric tiles, not the region tiles.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Render again the tiles already cached.'
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='run_async',
+            help='Enqueue the seeding, its batches rendered in parallel by the workers, instead of running it here.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to seed the tiles.
+        """
+        if options['date']:
+            date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        else:
+            last_complete = MetricPredictionProgress.last_complete()
+            if last_complete is None:
+                self.stderr.write(self.style.ERROR("There is no date with its metrics predicted."))
+                return
+            date = last_complete.date
+
+        if options['min_zoom'] > options['max_zoom']:
+            self.stderr.write(self.style.ERROR("The minimum zoom level is greater than the maximum."))
+            return
+
+        if options['run_async']:
+            seed_tiles_task.delay(
+                date_str=date.isoformat(),
+                min_zoom=options['min_zoom'],
+                max_zoom=options['max_zoom'],
+                regions=options['regions'],
+                force=options['force'],
+            )
+            self.stdout.write(self.style.SUCCESS(f"Seeding of the tiles of {date} enqueued."))
+            return
+
+        report = seed_tiles(
+            date=date,
+            min_zoom=options['min_zoom'],
+            max_zoom=options['max_zoom'],
+            max_workers=options['max_workers'],
+            regions=options['regions'],
+            force=options['force'],
+        )
+        self.stdout.write(
+            f"Rendered {report['rendered']} of {report['tiles']} tiles of {date} ({report['empty']} empty), "
+            f"and skipped {report['skipped']} (already cached)."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished in {report['elapsed']:.1f}s ({report['tiles_per_second']:.1f} tiles/s)."
+        ))
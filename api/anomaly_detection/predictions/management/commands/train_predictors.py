@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from anomaly_detection.predictions.tasks import train_predictors_task
+from anomaly_detection.predictions.training import default_max_workers, train_predictors
+
+
+class Command(BaseCommand):
+    """
+    Django command to create and train, in parallel, every Predictor needed for a given date.
+    """
+
+    help = """Train the predictors of every region for a date."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            type=str,
+            default=datetime.now().strftime('%Y-%m-%d'),
+            help='Date of the metrics to be predicted (format: YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=None,
+            help=f'Number of processes used to fit the models (default: {default_max_workers()})'
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='run_async',
+            help='Enqueue the training in a worker instead of running it in this process.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Handle the command to train the predictors.
+        """
+        date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        max_workers = options.get('max_workers')
+
+        if options['run_async']:
+            train_predictors_task.delay(date_str=date.isoformat(), max_workers=max_workers)
+            self.stdout.write(self.style.SUCCESS(f"Training of the predictors for {date} enqueued."))
+            return
+
+        report = train_predictors(date=date, max_workers=max_workers)
+        self.stdout.write(
+            f"Created {report['created']} predictors, trained {report['trained']} "
+            f"and skipped {report['skipped']} (not enough data)."
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished in {report['elapsed']:.1f}s ({report['fits_per_second']:.2f} fits/s)."
+        ))
@@ -1,7 +1,39 @@
+import time
 from datetime import timedelta
-from django.db.models import Manager, Prefetch
+from typing import Iterable, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (DateTimeField, DurationField, ExpressionWrapper, F, Manager, Prefetch, Q,
+                              Value)
+from django.utils import timezone
 
 from anomaly_detection.regions.models import Municipality
+from anomaly_detection.predictions import retraining
+
+# Seconds between the checks of a predictor trained by another worker.
+TRAINING_POLL_INTERVAL = 0.5
+
+# Adds the residuals of newly scored metrics (a `residuals` relation with the columns predictor_id, scored,
+# abs_error, outside and last_date) to the statistics of their predictors, which are stale from the day after
+# the last date if they cross the drift thresholds (see `retraining.drift_thresholds`).
+ADD_RESIDUALS_SQL = """
+    SET scored_count = predictor.scored_count + residuals.scored,
+        abs_error_sum = predictor.abs_error_sum + residuals.abs_error,
+        outside_count = predictor.outside_count + residuals.outside,
+        stale_at = CASE
+            WHEN predictor.stale_at IS NULL
+                AND predictor.scored_count + residuals.scored >= %(min_scored)s
+                AND (predictor.abs_error_sum + residuals.abs_error
+                        > %(max_error)s * (predictor.scored_count + residuals.scored)
+                     OR predictor.outside_count + residuals.outside
+                        > %(max_outside_rate)s * (predictor.scored_count + residuals.scored))
+            THEN residuals.last_date + 1
+            ELSE predictor.stale_at
+        END
+    FROM residuals
+    WHERE predictor.id = residuals.predictor_id
+"""
 
 
 class RegionSelectedManager(Manager):
@@ -34,12 +66,225 @@ class PredictorManager(Manager):
     Custom manager for the Predictor model.
     """
 
+    def not_expired(self, date):
+        """
+        Get the predictors that are not expired for a given date (see `retraining.policy`).
+        With the schedule policy, the ones trained since the start of the current retraining slot of their
+        region (see `Predictor.scheduled_training_date`).
+        With the drift policy, the ones not stale at the date and younger than the age limit of their region
+        (see `retraining.age_limit_days`).
+        With either policy, the ones that could not be trained with a short history also expire at the first
+        date with enough history (see `Predictor.set_untrainable`).
+        """
+        expiry_days = self.model.EXPIRY_DAYS
+        day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+        trainable = Q(trainable_from__isnull=True) | Q(trainable_from__gt=day_start.date())
+        if retraining.policy() == retraining.DRIFT:
+            days_since_oldest = ExpressionWrapper(
+                (Value(retraining.max_age_days(expiry_days)) - F('region_id') % expiry_days) * Value(timedelta(days=1)),
+                output_field=DurationField()
+            )
+            oldest = ExpressionWrapper(Value(day_start) - days_since_oldest, output_field=DateTimeField())
+            return super().get_queryset().filter(
+                Q(stale_at__isnull=True) | Q(stale_at__gt=day_start.date()),
+                trainable,
+                last_training_date__lte=date,
+                last_training_date__gte=oldest,
+            )
+
+        days_since_slot_start = ExpressionWrapper(
+            (Value(date.toordinal()) - F('region_id') % expiry_days) % expiry_days * Value(timedelta(days=1)),
+            output_field=DurationField()
+        )
+        slot_start = ExpressionWrapper(Value(day_start) - days_since_slot_start, output_field=DateTimeField())
+        return super().get_queryset().filter(
+            trainable,
+            last_training_date__lte=date,
+            last_training_date__gte=slot_start,
+        )
+
     def get_not_expired(self, region_id, date):
         """
         Get the last predictor that is not expired for a given region and date.
         """
+        return self.not_expired(date).filter(region_id=region_id).latest('last_training_date')
+
+    def latest_not_expired(self, date):
+        """
+        Get the last predictor that is not expired of every region for a given date.
+        """
+        return self.not_expired(date).order_by('region_id', '-last_training_date').distinct('region_id')
+
+    def previous_parameters(self, region_ids, date) -> dict:
+        """
+        Get the fitted parameters of the last predictor trained before a given date, for every region.
+        """
+        rows = super().get_queryset().filter(
+            region_id__in=region_ids,
+            last_training_date__lt=date,
+            parameters__isnull=False,
+        ).order_by('region_id', '-last_training_date').distinct('region_id').values_list('region_id', 'parameters')
+        return dict(rows)
+
+    def _training_lease(self) -> timedelta:
+        return timedelta(seconds=settings.PREDICTOR_TRAINING_LEASE_SECONDS)
+
+    def in_training(self, ids: List[int]):
+        """
+        Get the predictors, among the given ones, that a worker is training (their lease is not expired).
+        """
         return super().get_queryset().filter(
-            region_id=region_id,
-            last_training_date__lte=date,
-            last_training_date__gte=(date - timedelta(days=self.model.EXPIRY_DAYS))
-        ).latest('last_training_date')
+            id__in=ids, training_started_at__gte=timezone.now() - self._training_lease()
+        )
+
+    def claim_training(self, ids: List[int], force: bool = False) -> List[int]:
+        """
+        Atomically claims the training of the given predictors (compare-and-set of their training lease),
+        so only one worker fits each one. The predictors already trained or untrainable (unless forced), or being
+        trained by another worker are not claimed. Returns the ids of the predictors claimed.
+        """
+        now = timezone.now()
+        qs = super().get_queryset().filter(
+            Q(training_started_at__isnull=True) | Q(training_started_at__lt=now - self._training_lease()),
+            id__in=ids,
+        )
+        if not force:
+            qs = qs.filter(parameters__isnull=True, untrainable__isnull=True)
+        with transaction.atomic():
+            claimed = list(qs.select_for_update(skip_locked=True).values_list('id', flat=True))
+            super().get_queryset().filter(id__in=claimed).update(training_started_at=now)
+        return claimed
+
+    def release_training(self, ids: List[int]) -> None:
+        """
+        Releases the training lease of the given predictors.
+        """
+        super().get_queryset().filter(id__in=ids, training_started_at__isnull=False).update(training_started_at=None)
+
+    def renew_training(self, ids: List[int]) -> None:
+        """
+        Extends the training lease of the given predictors, claimed by the current worker, so a long training
+        is not taken over by another worker when the lease expires.
+        """
+        super().get_queryset().filter(id__in=ids, training_started_at__isnull=False).update(
+            training_started_at=timezone.now()
+        )
+
+    def wait_training(self, ids: List[int], poll_interval: float = TRAINING_POLL_INTERVAL) -> bool:
+        """
+        Waits until no worker is training any of the given predictors, up to the duration of the lease.
+        Returns whether any of them was being trained.
+        """
+        deadline = time.monotonic() + self._training_lease().total_seconds()
+        waited = False
+        while self.in_training(ids).exists() and time.monotonic() < deadline:
+            waited = True
+            time.sleep(poll_interval)
+        return waited
+
+    def add_residuals(self, metrics: Iterable) -> int:
+        """
+        Adds the residuals of the given metrics, scored for the first time, to the statistics of their
+        predictors with a single UPDATE (see `ADD_RESIDUALS_SQL`). The metrics without value are skipped.
+        Returns the number of predictors updated.
+        """
+        residuals = {}
+        for metric in metrics:
+            if metric.value is None or metric.predicted_value is None:
+                continue
+            scored, abs_error, outside, last_date = residuals.get(metric.predictor_id, (0, 0.0, 0, metric.date))
+            residuals[metric.predictor_id] = (
+                scored + 1,
+                abs_error + abs(metric.value - metric.predicted_value),
+                outside + (metric.value < metric.lower_value or metric.value > metric.upper_value),
+                max(last_date, metric.date),
+            )
+        if not residuals:
+            return 0
+
+        scored, abs_error, outside, last_date = zip(*residuals.values())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH residuals AS (
+                    SELECT * FROM unnest(%(ids)s::bigint[], %(scored)s::integer[], %(abs_error)s::float8[],
+                                         %(outside)s::integer[], %(last_date)s::date[])
+                        AS residuals(predictor_id, scored, abs_error, outside, last_date)
+                )
+                UPDATE {self.model._meta.db_table} AS predictor
+                {ADD_RESIDUALS_SQL}
+                """,
+                {
+                    'ids': list(residuals.keys()), 'scored': list(scored), 'abs_error': list(abs_error),
+                    'outside': list(outside), 'last_date': list(last_date), **retraining.drift_thresholds(),
+                }
+            )
+            return cursor.rowcount
+
+    def create_missing(self, date) -> int:
+        """
+        Create a predictor, trained at its scheduled training date (see `Predictor.scheduled_training_date`),
+        for every region that has not a predictor that is not expired for the given date. Returns the number of predictors created.
+        """
+        from anomaly_detection.predictions.engines import engine_for_region
+
+        missing_regions = Municipality.objects.exclude(
+            id__in=self.not_expired(date).values('region_id')
+        ).values_list('id', 'code')
+
+        objs = self.bulk_create(
+            [
+                self.model(
+                    region_id=region_id,
+                    last_training_date=self.model.scheduled_training_date(region_id, date),
+                    engine=engine_for_region(code)
+                )
+                for region_id, code in missing_regions
+            ],
+            batch_size=2000,
+            ignore_conflicts=True
+        )
+        return len(objs)
+
+
+class ForecastManager(Manager):
+    """
+    Custom manager for the Forecast model.
+    """
+
+    def replace_for(self, predictors) -> int:
+        """
+        Computes the forecasts of every date in which the predictors are not expired, replacing the
+        existing ones. Returns the number of forecasts created.
+        """
+        from anomaly_detection.predictions.engines import EnginePredictor
+
+        predictors = [p for p in predictors if p.is_trained]
+        if not predictors:
+            return 0
+
+        keys, dates = [], []
+        for predictor in predictors:
+            horizon_dates = predictor.get_horizon_dates()
+            keys += [predictor.pk] * len(horizon_dates)
+            dates += horizon_dates
+
+        vectorized = EnginePredictor({p.pk: p.get_parameters() for p in predictors})
+        yhat, yhat_lower, yhat_upper = vectorized.predict(keys, dates)
+
+        with transaction.atomic():
+            self.filter(predictor_id__in=[p.pk for p in predictors]).delete()
+            objs = self.bulk_create(
+                [
+                    self.model(
+                        predictor_id=key,
+                        date=date,
+                        yhat=float(yhat[i]),
+                        yhat_lower=float(yhat_lower[i]),
+                        yhat_upper=float(yhat_upper[i]),
+                    )
+                    for i, (key, date) in enumerate(zip(keys, dates))
+                ],
+                batch_size=5000
+            )
+        return len(objs)
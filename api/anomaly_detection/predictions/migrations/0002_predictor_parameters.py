@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-06-16 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='parameters',
+            field=models.JSONField(blank=True, help_text='The fitted parameters of the model, used to predict without loading the model itself.', null=True, verbose_name='Parameters'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2025-06-18 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0002_predictor_parameters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Forecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='The date of the forecast.', verbose_name='Date')),
+                ('yhat', models.FloatField(help_text='The predicted value for the date.', verbose_name='Predicted value')),
+                ('yhat_lower', models.FloatField(help_text='The predicted lower band value for the date.', verbose_name='Lower value')),
+                ('yhat_upper', models.FloatField(help_text='The predicted upper band value for the date.', verbose_name='Upper value')),
+                ('predictor', models.ForeignKey(help_text='The predictor that computed the forecast.', on_delete=django.db.models.deletion.CASCADE, related_name='forecasts', to='predictions.predictor', verbose_name='Predictor')),
+            ],
+            options={
+                'verbose_name': 'Forecast',
+                'verbose_name_plural': 'Forecasts',
+                'ordering': ['predictor', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('predictor', 'date'), name='unique_forecast')],
+            },
+        ),
+    ]
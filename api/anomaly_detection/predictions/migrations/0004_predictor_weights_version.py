@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-06-20 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0003_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='weights_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented every time the weights are rewritten. Used to invalidate the cached models.', verbose_name='Weights version'),
+        ),
+    ]
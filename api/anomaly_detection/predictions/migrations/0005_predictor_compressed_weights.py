@@ -0,0 +1,183 @@
+# Generated by Django 5.2 on 2025-06-23 08:30
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+
+# The conversion is frozen here, as the format stored by `storage` (and the parameters extracted by
+# `inference`) can evolve after this migration.
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+
+def _model_to_payload(model):
+    import numpy as np
+    import pandas as pd
+    from prophet.serialize import SIMPLE_ATTRIBUTES
+
+    last = model.history.iloc[-1]
+    return {
+        '__format_version': FORMAT_VERSION,
+        **{attribute: getattr(model, attribute) for attribute in SIMPLE_ATTRIBUTES},
+        'start': model.start.timestamp(),
+        't_scale': model.t_scale.total_seconds(),
+        'changepoints': (
+            [pd.Timestamp(value).isoformat() for value in model.changepoints]
+            if model.changepoints is not None else None
+        ),
+        'changepoints_t': np.asarray(model.changepoints_t).tolist(),
+        'seasonalities': [list(model.seasonalities.keys()), model.seasonalities],
+        'train_component_cols': {
+            'columns': model.train_component_cols.columns.tolist(),
+            'data': model.train_component_cols.values.tolist(),
+        },
+        'history': {
+            'ds': pd.Timestamp(last['ds']).isoformat(),
+            **{column: float(last[column]) for column in model.history.columns if column != 'ds'},
+        },
+        'params': {key: np.asarray(value).tolist() for key, value in model.params.items() if key != 'trend'},
+    }
+
+
+def _model_from_payload(payload):
+    from collections import OrderedDict
+
+    import numpy as np
+    import pandas as pd
+    from prophet import Prophet
+    from prophet.serialize import SIMPLE_ATTRIBUTES
+
+    model = Prophet()
+    for attribute in SIMPLE_ATTRIBUTES:
+        setattr(model, attribute, payload[attribute])
+    model.start = pd.Timestamp(payload['start'], unit='s')
+    model.t_scale = pd.Timedelta(seconds=payload['t_scale'])
+    model.changepoints = (
+        pd.Series(pd.to_datetime(payload['changepoints']), name='ds')
+        if payload['changepoints'] is not None else None
+    )
+    model.changepoints_t = np.array(payload['changepoints_t'])
+    key_list, seasonalities = payload['seasonalities']
+    model.seasonalities = OrderedDict((key, seasonalities[key]) for key in key_list)
+    model.extra_regressors = OrderedDict()
+    model.holidays = None
+    model.train_holiday_names = None
+
+    component_cols = pd.DataFrame(payload['train_component_cols']['data'], columns=payload['train_component_cols']['columns'])
+    component_cols.columns.name = 'component'
+    component_cols.index.name = 'col'
+    model.train_component_cols = component_cols
+
+    history = pd.DataFrame([payload['history']])
+    history['ds'] = pd.to_datetime(history['ds'])
+    model.history = history
+    model.history_dates = history['ds']
+
+    model.fit_kwargs = {}
+    model.params = {key: np.array(value) for key, value in payload['params'].items()}
+    model.stan_backend = None
+    model.stan_fit = None
+    return model
+
+
+def _parameters(model):
+    from statistics import NormalDist
+
+    import numpy as np
+
+    params = model['params']
+    sigma_obs = float(np.nanmean(params['sigma_obs']))
+    band = float(NormalDist().inv_cdf(0.5 + model['interval_width'] / 2) * sigma_obs * model['y_scale'])
+    key_list, seasonalities = model['seasonalities']
+
+    return {
+        'k': float(np.nanmean(params['k'])),
+        'm': float(np.nanmean(params['m'])),
+        'delta': np.nanmean(params['delta'], axis=0).tolist(),
+        'beta': np.nanmean(params['beta'], axis=0).tolist(),
+        'sigma_obs': sigma_obs,
+        'changepoints_t': model['changepoints_t'],
+        'y_scale': float(model['y_scale']),
+        'cap': 1.0,
+        'floor': 0.0,
+        'start': model['start'],
+        't_scale': model['t_scale'],
+        'seasonalities': [
+            {'period': float(seasonalities[key]['period']), 'fourier_order': int(seasonalities[key]['fourier_order'])}
+            for key in key_list
+        ],
+        'band_lower': [band],
+        'band_upper': [band],
+    }
+
+
+def compress_weights(apps, schema_editor):
+    from prophet.serialize import model_from_json
+
+    Predictor = apps.get_model('predictions', 'Predictor')
+
+    batch = []
+    qs = Predictor.objects.filter(weights__isnull=False).only('id', 'weights', 'parameters')
+    for predictor in qs.iterator(chunk_size=100):
+        weights = predictor.weights if isinstance(predictor.weights, str) else json.dumps(predictor.weights)
+        payload = _model_to_payload(model_from_json(weights))
+        predictor.compressed_weights = zlib.compress(
+            json.dumps(payload, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL
+        )
+        if predictor.parameters is None:
+            predictor.parameters = _parameters(json.loads(weights))
+        batch.append(predictor)
+        if len(batch) >= 100:
+            Predictor.objects.bulk_update(batch, fields=['compressed_weights', 'parameters'])
+            batch = []
+    Predictor.objects.bulk_update(batch, fields=['compressed_weights', 'parameters'])
+
+
+def expand_weights(apps, schema_editor):
+    from prophet.serialize import model_to_json
+
+    Predictor = apps.get_model('predictions', 'Predictor')
+
+    batch = []
+    qs = Predictor.objects.filter(compressed_weights__isnull=False).only('id', 'compressed_weights')
+    for predictor in qs.iterator(chunk_size=100):
+        payload = json.loads(zlib.decompress(bytes(predictor.compressed_weights)).decode('utf-8'))
+        # NOTE: The training history is not stored anymore, so only its last row is restored.
+        predictor.weights = model_to_json(_model_from_payload(payload))
+        batch.append(predictor)
+        if len(batch) >= 100:
+            Predictor.objects.bulk_update(batch, fields=['weights'])
+            batch = []
+    Predictor.objects.bulk_update(batch, fields=['weights'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0004_predictor_weights_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='compressed_weights',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_weights, expand_weights),
+        migrations.RemoveField(
+            model_name='predictor',
+            name='weights',
+        ),
+        migrations.RenameField(
+            model_name='predictor',
+            old_name='compressed_weights',
+            new_name='weights',
+        ),
+        migrations.AlterField(
+            model_name='predictor',
+            name='weights',
+            field=models.BinaryField(blank=True, help_text='The predictor model itself, compressed. See `storage.serialize_model`.', null=True, verbose_name='Weights'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2025-06-25 10:12
+
+import anomaly_detection.predictions.engines
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0005_predictor_compressed_weights'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='engine',
+            field=models.CharField(choices=[('prophet', 'Prophet'), ('seasonal', 'Seasonal baseline')], default=anomaly_detection.predictions.engines.default_engine, help_text='The engine used to train the predictor and predict the values.', max_length=32, verbose_name='Engine'),
+        ),
+    ]
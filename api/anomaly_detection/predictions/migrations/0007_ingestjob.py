@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2025-06-27 09:41
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0006_predictor_engine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('date', models.DateField(help_text='The date of the metrics of the file.', verbose_name='Date')),
+                ('filename', models.CharField(help_text='The name of the uploaded file.', max_length=255, verbose_name='Filename')),
+                ('content', models.BinaryField(blank=True, help_text='The content of the uploaded file, until it is inserted.', null=True, verbose_name='Content')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('inserting', 'Inserting'), ('predicting', 'Predicting'), ('done', 'Done'), ('failed', 'Failed')], default='pending', help_text='The status of the ingestion.', max_length=16, verbose_name='Status')),
+                ('parsed', models.PositiveIntegerField(default=0, help_text='The number of rows parsed from the file.', verbose_name='Parsed')),
+                ('inserted', models.PositiveIntegerField(default=0, help_text='The number of metrics inserted.', verbose_name='Inserted')),
+                ('predicted', models.PositiveIntegerField(default=0, help_text='The number of inserted metrics with a predicted value.', verbose_name='Predicted')),
+                ('failed', models.PositiveIntegerField(default=0, help_text='The number of rows that could not be inserted, such as rows of unknown regions.', verbose_name='Failed')),
+                ('error', models.TextField(blank=True, default='', help_text='The error that made the ingestion fail.', verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Ingest Job',
+                'verbose_name_plural': 'Ingest Jobs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
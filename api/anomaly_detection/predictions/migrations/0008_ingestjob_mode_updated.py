@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2025-06-30 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0007_ingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='mode',
+            field=models.CharField(choices=[('insert', 'Insert'), ('upsert', 'Upsert')], default='insert', help_text='Whether the existing metrics of the file make it fail (insert) or are updated (upsert).', max_length=16, verbose_name='Mode'),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, help_text='The number of existing metrics whose value changed (upsert mode).', verbose_name='Updated'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2025-07-02 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0008_ingestjob_mode_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metricpredictionprogress',
+            name='predicted',
+            field=models.PositiveIntegerField(default=0, help_text='The number of metrics of the date with a predicted value.', verbose_name='Predicted'),
+        ),
+        migrations.AddField(
+            model_name='metricpredictionprogress',
+            name='total',
+            field=models.PositiveIntegerField(default=0, help_text='The number of metrics of the date.', verbose_name='Total'),
+        ),
+        migrations.AddIndex(
+            model_name='metricpredictionprogress',
+            index=models.Index(condition=models.Q(('success_percentage__gte', 0.95)), fields=['-date'], name='metric_progress_complete_idx'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE predictions_metricpredictionprogress AS progress
+                SET total = counts.total, predicted = counts.predicted
+                FROM (
+                    SELECT date, COUNT(*) AS total, COUNT(predicted_value) AS predicted
+                    FROM predictions_metric
+                    GROUP BY date
+                ) AS counts
+                WHERE counts.date = progress.date
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
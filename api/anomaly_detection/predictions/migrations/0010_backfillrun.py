@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2025-07-04 10:02
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0009_metricpredictionprogress_counters'),
+        ('regions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('from_date', models.DateField(help_text='The first date of the metrics to predict.', verbose_name='From date')),
+                ('to_date', models.DateField(help_text='The last date of the metrics to predict.', verbose_name='To date')),
+                ('predictor_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, help_text='The ids of the predictors to predict the metrics with, in chunk order.', size=None, verbose_name='Predictors')),
+                ('chunk_size', models.PositiveIntegerField(help_text='The number of predictors of every chunk.', verbose_name='Chunk size')),
+                ('concurrency', models.PositiveIntegerField(help_text='The maximum number of chunks queued at the same time.', verbose_name='Concurrency')),
+                ('total_chunks', models.PositiveIntegerField(default=0, verbose_name='Total chunks')),
+                ('queued_chunks', models.PositiveIntegerField(default=0, verbose_name='Queued chunks')),
+                ('done_chunks', models.PositiveIntegerField(default=0, verbose_name='Done chunks')),
+                ('failed_chunks', models.PositiveIntegerField(default=0, verbose_name='Failed chunks')),
+                ('predicted', models.PositiveIntegerField(default=0, help_text='The number of metrics predicted.', verbose_name='Predicted')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done')], default='running', max_length=16, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('region', models.ForeignKey(blank=True, help_text='The only region to predict, if any.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='backfill_runs', to='regions.municipality', verbose_name='Region')),
+            ],
+            options={
+                'verbose_name': 'Backfill Run',
+                'verbose_name_plural': 'Backfill Runs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
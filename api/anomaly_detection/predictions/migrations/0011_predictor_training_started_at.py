@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-07-07 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0010_backfillrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='training_started_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When a worker started to train the predictor, if it is being trained.', null=True, verbose_name='Training started at'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-07-10 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0011_predictor_training_started_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='training_window_days',
+            field=models.PositiveIntegerField(blank=True, help_text='The number of days of history before the training date used to train it (empty for all).', null=True, verbose_name='Training window (days)'),
+        ),
+    ]
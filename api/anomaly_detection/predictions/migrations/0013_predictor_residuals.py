@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2025-07-11 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0012_predictor_training_window_days'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='scored_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of metrics with a value predicted by the predictor.', verbose_name='Scored metrics'),
+        ),
+        migrations.AddField(
+            model_name='predictor',
+            name='abs_error_sum',
+            field=models.FloatField(default=0, editable=False, help_text='The sum of the absolute errors of the values predicted for the scored metrics.', verbose_name='Absolute error sum'),
+        ),
+        migrations.AddField(
+            model_name='predictor',
+            name='outside_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of scored metrics with a value outside the prediction interval.', verbose_name='Anomalies'),
+        ),
+        migrations.AddField(
+            model_name='predictor',
+            name='stale_at',
+            field=models.DateField(blank=True, help_text='The date from which the predictor is expired, as its residuals drifted (drift policy).', null=True, verbose_name='Stale at'),
+        ),
+    ]
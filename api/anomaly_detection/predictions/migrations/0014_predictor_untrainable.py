@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2025-07-11 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0013_predictor_residuals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='predictor',
+            name='untrainable',
+            field=models.CharField(blank=True, choices=[('no_values', 'No values'), ('short_history', 'Short history')], help_text='Why the history before the training date is not enough to train the predictor, if it is not.', max_length=32, null=True, verbose_name='Untrainable'),
+        ),
+        migrations.AddField(
+            model_name='predictor',
+            name='trainable_from',
+            field=models.DateField(blank=True, help_text='The first date with enough history to train a predictor of the region, if it is short.', null=True, verbose_name='Trainable from'),
+        ),
+    ]
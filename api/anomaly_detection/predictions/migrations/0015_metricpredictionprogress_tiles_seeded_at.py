@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-07-14 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0014_predictor_untrainable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metricpredictionprogress',
+            name='tiles_seeded_at',
+            field=models.DateTimeField(blank=True, help_text='When the seeding of the tiles of the date was queued, once its metrics were predicted.', null=True, verbose_name='Tiles seeded at'),
+        ),
+    ]
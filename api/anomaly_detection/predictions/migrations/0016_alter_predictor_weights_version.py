@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2025-07-15 09:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0015_metricpredictionprogress_tiles_seeded_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='predictor',
+            name='weights_version',
+            field=models.PositiveIntegerField(default=0, help_text='Incremented every time the weights are rewritten. Used to tell a new training from a previous one.', verbose_name='Weights version'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2025-07-15 11:47
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0016_alter_predictor_weights_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backfillrun',
+            name='failed_predictor_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, help_text='The ids of the predictors whose metrics could not be predicted.', size=None, verbose_name='Failed predictors'),
+        ),
+    ]
@@ -1,22 +1,28 @@
+import os
 import uuid
 import math
-from datetime import datetime
-from typing import List, Optional, TypedDict
+import time
+from datetime import date as date_type, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
 import pandas as pd
 
 from django.contrib.postgres.fields import ArrayField
-from django.db import models, transaction
-from django.db.models import Case, F, Value, When
+from django.db import DatabaseError, IntegrityError, connection, models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from prophet import Prophet
-from prophet.plot import seasonality_plot_df
-from prophet.serialize import model_to_json as prophet_model_to_json
 from rest_framework.fields import MaxValueValidator, MinValueValidator
 
 
 from anomaly_detection.regions.models import Municipality
-from anomaly_detection.predictions.managers import PredictorManager, RegionSelectedManager
-from anomaly_detection.predictions.tasks import refresh_prediction_task
+from anomaly_detection.predictions.history import load_history
+from anomaly_detection.predictions.managers import (ADD_RESIDUALS_SQL, TRAINING_POLL_INTERVAL, ForecastManager,
+                                                    PredictorManager, RegionSelectedManager)
+from anomaly_detection.predictions import engines, retraining, storage
+from anomaly_detection.predictions.tasks import refresh_prediction_task, seed_tiles_task
+from anomaly_detection.predictions.tile_cache import invalidate_metric_tiles, tile_store
+from anomaly_detection.predictions.training import (TrainingResult, missing_history_days, training_window_days,
+                                                    warm_start_enabled)
 
 
 class PredictionResult(TypedDict):
@@ -26,12 +32,36 @@ class PredictionResult(TypedDict):
     yhat_lower: float
 
 
+class MetricSeries(TypedDict):
+    dates: List[date_type]
+    values: List[Optional[float]]
+    predicted_values: List[Optional[float]]
+    lower_values: List[Optional[float]]
+    upper_values: List[Optional[float]]
+    anomaly_degrees: List[Optional[float]]
+
+
 class Predictor(models.Model):
     """
     Model to store the predictor model and the prediction results.
     """
+    class Engine(models.TextChoices):
+        PROPHET = engines.PROPHET, _('Prophet')
+        SEASONAL = engines.SEASONAL, _('Seasonal baseline')
+
+    class Untrainable(models.TextChoices):
+        NO_VALUES = 'no_values', _('No values')
+        SHORT_HISTORY = 'short_history', _('Short history')
+
     EXPIRY_DAYS = 30
     MIN_DAYS_FOR_TRAINING = int(365*2)  # Prophet needs at least 2.5 cycles for quality training
+    # Fields written when the model is trained.
+    TRAINING_FIELDS = [
+        'weights', 'weights_version', 'parameters', 'trend', 'yearly_seasonality', 'training_window_days',
+        'untrainable', 'trainable_from'
+    ]
+    # Fields written when the history is not enough to train the model.
+    UNTRAINABLE_FIELDS = ['untrainable', 'trainable_from']
 
     region = models.ForeignKey(
         Municipality,
@@ -46,11 +76,29 @@ class Predictor(models.Model):
         verbose_name=_('Trained at'),
         help_text=_('The specified date in which the model was trained.')
     )
-    weights = models.JSONField(
+    engine = models.CharField(
+        max_length=32,
+        choices=Engine.choices,
+        default=engines.default_engine,
+        verbose_name=_('Engine'),
+        help_text=_('The engine used to train the predictor and predict the values.')
+    )
+    weights = models.BinaryField(
         null=True,
         blank=True,
         verbose_name=_('Weights'),
-        help_text=_('The predictor model itself.')
+        help_text=_('The predictor model itself, compressed. See `storage.serialize_model`.')
+    )
+    weights_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Weights version'),
+        help_text=_('Incremented every time the weights are rewritten. Used to tell a new training from a previous one.')
+    )
+    parameters = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name=_('Parameters'),
+        help_text=_('The fitted parameters of the model, used to predict without loading the model itself.')
     )
     # ! CAREFUL: The type ArrayField only works in PostgreSQL
     yearly_seasonality = ArrayField(
@@ -69,14 +117,100 @@ class Predictor(models.Model):
         help_text=_('The predicted serial tendency for the metric.')
     )
 
+    training_window_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Training window (days)'),
+        help_text=_('The number of days of history before the training date used to train it (empty for all).')
+    )
+    # Negative cache of the trainings that failed, so the history is not loaded (and checked) again.
+    untrainable = models.CharField(
+        max_length=32,
+        choices=Untrainable.choices,
+        null=True,
+        blank=True,
+        verbose_name=_('Untrainable'),
+        help_text=_('Why the history before the training date is not enough to train the predictor, if it is not.')
+    )
+    trainable_from = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name=_('Trainable from'),
+        help_text=_('The first date with enough history to train a predictor of the region, if it is short.')
+    )
+    # Residuals of the metrics scored with the forecasts of the predictor (see `Metric.fill_from_forecasts`).
+    scored_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_('Scored metrics'),
+        help_text=_('The number of metrics with a value predicted by the predictor.')
+    )
+    abs_error_sum = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name=_('Absolute error sum'),
+        help_text=_('The sum of the absolute errors of the values predicted for the scored metrics.')
+    )
+    outside_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_('Anomalies'),
+        help_text=_('The number of scored metrics with a value outside the prediction interval.')
+    )
+    stale_at = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name=_('Stale at'),
+        help_text=_('The date from which the predictor is expired, as its residuals drifted (drift policy).')
+    )
+    # Lease of the worker that is fitting the predictor, so no other worker fits it at the same time.
+    training_started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('Training started at'),
+        help_text=_('When a worker started to train the predictor, if it is being trained.')
+    )
+
     objects = PredictorManager()
 
+    @classmethod
+    def scheduled_training_date(cls, region_id: int, date: datetime) -> datetime:
+        """
+        Returns the training date of a new predictor of the region that predicts the date.
+        With the schedule policy, the start of the retraining slot of the region that contains the date: every
+        region is retrained every EXPIRY_DAYS, with an offset given by its id, so the predictors of the regions
+        do not expire (and are retrained) all on the same day. With the drift policy, the date itself.
+        """
+        return retraining.new_training_date(region_id, date, cls.EXPIRY_DAYS)
+
+    @classmethod
+    def horizon_days(cls) -> int:
+        """
+        Returns the number of days, from its training date, in which a predictor can be used.
+        """
+        return retraining.max_age_days(cls.EXPIRY_DAYS) + 1
+
+    @property
+    def mean_abs_error(self) -> Optional[float]:
+        """
+        The mean absolute error of the values predicted for the scored metrics.
+        """
+        return self.abs_error_sum / self.scored_count if self.scored_count else None
+
+    @property
+    def outside_rate(self) -> Optional[float]:
+        """
+        The rate of scored metrics with a value outside the prediction interval.
+        """
+        return self.outside_count / self.scored_count if self.scored_count else None
+
     @property
     def is_trained(self) -> bool:
         """
         Whether the predictor is trained or not.
         """
-        return self.weights is not None
+        return self.parameters is not None
 
     @staticmethod
     def _predict(prophet, df) -> pd.DataFrame:
@@ -86,18 +220,44 @@ class Predictor(models.Model):
 
         return prophet.predict(df_new)
 
+    def get_parameters(self) -> dict:
+        """
+        Returns the fitted parameters of the model, which are enough to predict with any engine.
+        """
+        return self.parameters
+
     def predict(self, dates: List[datetime]) -> Optional[List[PredictionResult]]:
         """
         Predicts the values for the specified data.
+        The values are computed from the fitted parameters (see `engines.EnginePredictor`), which for Prophet
+        gives the same results as `predict_with_prophet` without rebuilding the model nor simulating the
+        uncertainty.
         """
-        from prophet.serialize import model_from_json
         if not self.is_trained:
             self.train()
         if not self.is_trained:
             # This second comprobation is needed for the first iterations (first 30 days)
             return
 
-        prophet = model_from_json(self.weights)
+        # If dates is not an array, convert to arary.
+        if not isinstance(dates, list):
+            dates = [dates, ]
+
+        predictor = engines.EnginePredictor({self.pk: self.get_parameters()})
+        return [PredictionResult(**res) for res in predictor.predict_dates(self.pk, dates)]
+
+    def predict_with_prophet(self, dates: List[datetime]) -> Optional[List[PredictionResult]]:
+        """
+        Predicts the values for the specified data with the full Prophet model.
+        """
+        if not self.is_trained:
+            self.train()
+        if not self.is_trained:
+            return
+
+        if self.engine != self.Engine.PROPHET:
+            raise ValueError(f"The predictors with the engine '{self.engine}' have no Prophet model.")
+        prophet = storage.deserialize_model(self.weights)
 
         # If dates is not an array, convert to arary.
         if not isinstance(dates, list):
@@ -111,69 +271,87 @@ class Predictor(models.Model):
         ]
         return forecast
 
-    def train(self, force: bool = False) -> None:
+    def set_training_result(self, result: TrainingResult, window_days: Optional[int] = None) -> None:
         """
-        Trains the predictor model with past data.
+        Assigns the output of a training, with the window of history it used, to the predictor (without saving it).
         """
-        # We need to set the logger to avoid the warning of the prophet library.
-        import logging
-        logger = logging.getLogger('cmdstanpy')
-        logger.addHandler(logging.NullHandler())
-        logger.propagate = False
-        logger.setLevel(logging.CRITICAL)
+        self.weights = result['weights']
+        self.weights_version += 1
+        self.parameters = result['parameters']
+        self.trend = result['trend']
+        self.yearly_seasonality = result['yearly_seasonality']
+        self.training_window_days = window_days
+        self.untrainable = None
+        self.trainable_from = None
 
-        import warnings
-        warnings.filterwarnings("ignore", category=pd.errors.SettingWithCopyWarning)
+    def set_untrainable(self, df: pd.DataFrame) -> None:
+        """
+        Records (without saving it) that the history in `df` is not enough to train the predictor: whether
+        it has no values, or the date from which a predictor of the region would have enough of them.
+        """
+        missing_days = missing_history_days(df, min_days=self.MIN_DAYS_FOR_TRAINING)
+        if missing_days is None:
+            self.untrainable = self.Untrainable.NO_VALUES
+            self.trainable_from = None
+        else:
+            self.untrainable = self.Untrainable.SHORT_HISTORY
+            self.trainable_from = self.last_training_date.date() + timedelta(days=max(missing_days, 1))
 
-        if self.is_trained and not force:
+    def train(self, force: bool = False) -> None:
+        """
+        Trains the predictor model with past data.
+        Only one worker trains a predictor at the same time (see `PredictorManager.claim_training`):
+        the others wait for it and reuse its result.
+        The predictors whose history was not enough are not trained again, unless forced.
+        """
+        if (self.is_trained or self.untrainable) and not force:
             return
 
-        # NOTE: Do not delete the order by date, as it is needed for the Prophet model.
-        metric_qs = Metric.objects.filter(date__lt=self.last_training_date, region=self.region).order_by('date')
+        version = self.weights_version
+        while not Predictor.objects.claim_training([self.pk], force=force):
+            waited = Predictor.objects.wait_training([self.pk])
+            self.refresh_from_db(fields=self.TRAINING_FIELDS)
+            if (self.is_trained or self.untrainable) and (not force or self.weights_version != version):
+                return
+            if not waited:
+                # The row was locked by a worker claiming it, whose lease is not committed yet: back off
+                # instead of claiming it again right away.
+                time.sleep(TRAINING_POLL_INTERVAL)
 
-        df = pd.DataFrame.from_records(
-            ({'ds': obj.date, 'y': obj.value} for obj in metric_qs.iterator())  # Generator
-        )
-        # TODO: Apply Savitzky-Golay filter with safeguards. Maybe, create a new field in Metric (smoothed_value)
+        try:
+            self._fit(force=force)
+        finally:
+            Predictor.objects.release_training([self.pk])
 
-        if df.empty or df['y'].isna().all() or df['y'].eq(0).all():
-            return
+    def _fit(self, force: bool) -> None:
+        # A predictor trained again keeps its window, so the result is reproducible.
+        window_days = self.training_window_days if self.is_trained else training_window_days(self.MIN_DAYS_FOR_TRAINING)
+        df = load_history(region_id=self.region_id, cutoff=self.last_training_date, window_days=window_days).to_frame()
 
-        first_non_zero = df[df["y"] != 0].iloc[0]
-        # See: https://facebook.github.io/prophet/docs/outliers.html
-        df.loc[df['ds'] < first_non_zero['ds'], "y"] = None
+        previous = Predictor.objects.previous_parameters(
+            region_ids=[self.region_id], date=self.last_training_date
+        ).get(self.region_id) if warm_start_enabled() else None
 
-        if df["y"].count() < self.MIN_DAYS_FOR_TRAINING:
-            # If there are not enough quality data to train the model, do not train it.
-            return
-
-        model = Prophet(
-            growth='logistic',
-            yearly_seasonality=True,
-            weekly_seasonality=False,
-            daily_seasonality=False,
+        result = engines.fit_history(
+            self.engine, df, min_days=self.MIN_DAYS_FOR_TRAINING, horizon_days=self.horizon_days(),
+            previous=previous
         )
-        # Logistic growth and boundaries between 0 and 1 are specifict to the bite risk model, which value is a
-        # probability. If ever needs to use other kind of metric set the boundaries on the MetricType model.
-        df.loc[:, 'cap'] = 1
-        df.loc[:, 'floor'] = 0
-        model.fit(df)
-
-        # Trend
-        future = model.make_future_dataframe(periods=0)
-        future['cap'] = 1  # Ensure the future data has the cap
-        future['floor'] = 0  # Ensure the future data has the floor
-        forecast = model.predict(future)
-
-        # Seasonality
-        df_w = seasonality_plot_df(m=model, ds=pd.date_range(start='2017-01-01', periods=365))
-        seas_df = model.predict_seasonal_components(df_w)
+        if result is None:
+            self.set_untrainable(df)
+            self.save(update_fields=self.UNTRAINABLE_FIELDS)
+            return
 
         # Save
-        self.weights = prophet_model_to_json(model)
-        self.trend = forecast['trend'].to_list()
-        self.yearly_seasonality = seas_df.reset_index(inplace=False)['yearly'].to_list()
-        self.save()
+        self.set_training_result(result, window_days=window_days)
+        self.save(update_fields=self.TRAINING_FIELDS)
+        Forecast.objects.replace_for(predictors=[self])
+
+    def get_horizon_dates(self) -> List[date_type]:
+        """
+        Returns the dates in which the predictor can be used (up to its maximum age).
+        """
+        first_date = self.last_training_date.date()
+        return [first_date + timedelta(days=i) for i in range(self.horizon_days())]
 
     def __str__(self):
         return f"Predictor for the region {self.region.name} for the model predicted in {self.last_training_date}"
@@ -192,10 +370,60 @@ class Predictor(models.Model):
         verbose_name_plural = 'Predictors'
 
 
+class Forecast(models.Model):
+    """
+    Model to store the values predicted by a Predictor for every date in which it is not expired.
+    They are computed at training time, so the metrics can be predicted without loading the predictor.
+    """
+    predictor = models.ForeignKey(
+        Predictor,
+        on_delete=models.CASCADE,
+        related_name='forecasts',
+        verbose_name=_('Predictor'),
+        help_text=_('The predictor that computed the forecast.')
+    )
+    date = models.DateField(
+        null=False,
+        blank=False,
+        verbose_name=_('Date'),
+        help_text=_('The date of the forecast.')
+    )
+    yhat = models.FloatField(
+        verbose_name=_('Predicted value'),
+        help_text=_('The predicted value for the date.')
+    )
+    yhat_lower = models.FloatField(
+        verbose_name=_('Lower value'),
+        help_text=_('The predicted lower band value for the date.')
+    )
+    yhat_upper = models.FloatField(
+        verbose_name=_('Upper value'),
+        help_text=_('The predicted upper band value for the date.')
+    )
+
+    objects = ForecastManager()
+
+    def __str__(self):
+        return f"Forecast of the predictor {self.predictor_id} for {self.date}: {self.yhat}"
+
+    class Meta:
+        ordering = ['predictor', 'date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['predictor', 'date'], name='unique_forecast'
+            )
+        ]
+        verbose_name = 'Forecast'
+        verbose_name_plural = 'Forecasts'
+
+
 class Metric(models.Model):
     """
     Model to store a metric of data, such as a Bites Index.
     """
+    # Periods in which the history of a region can be aggregated (see `series`).
+    SERIES_RESOLUTIONS = ('day', 'week', 'month')
+
     # TODO: Change the name to uuid
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
@@ -289,25 +517,176 @@ class Metric(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # The fields rendered in the tiles of the date of a metric (through the anomaly degree).
+    TILE_FIELDS = ('date', 'value', 'predicted_value', 'lower_value', 'upper_value')
+
     objects = RegionSelectedManager()
 
+    @classmethod
+    def assign_predictors(cls, date) -> int:
+        """
+        Assigns to the metrics of the date without predictor the last predictor of their region that
+        is not expired, with a single UPDATE. Returns the number of metrics updated.
+        """
+        aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+        predictor_qs = Predictor.objects.not_expired(aware_datetime).filter(
+            region_id=OuterRef('region_id')
+        ).order_by('-last_training_date').values('id')[:1]
+
+        return cls.objects.filter(date=date, predictor__isnull=True).update(predictor_id=Subquery(predictor_qs))
+
+    @classmethod
+    def fill_from_forecasts(cls, date) -> int:
+        """
+        Sets the prediction values of the metrics of the date from the forecasts of their predictors,
+        with a single UPDATE ... FROM. The metrics already predicted with the same values are not rewritten,
+        so predicting a date again only costs the new metrics. Returns the number of metrics updated.
+
+        In the same statement, the residuals of the newly scored metrics are added to the statistics of their
+        predictors, which are marked as stale from the next day if their residuals cross the drift thresholds
+        (see `PredictorManager.add_residuals`). If any metric is updated, the cached tiles of the date are invalidated.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH target AS (
+                    SELECT metric.id, metric.predicted_value IS NULL AS newly_scored,
+                           forecast.yhat, forecast.yhat_lower, forecast.yhat_upper
+                    FROM {cls._meta.db_table} AS metric
+                    JOIN {Forecast._meta.db_table} AS forecast
+                        ON forecast.predictor_id = metric.predictor_id AND forecast.date = metric.date
+                    WHERE metric.date = %(date)s
+                        AND (metric.predicted_value IS DISTINCT FROM forecast.yhat
+                             OR metric.lower_value IS DISTINCT FROM forecast.yhat_lower
+                             OR metric.upper_value IS DISTINCT FROM forecast.yhat_upper)
+                ), filled AS (
+                    UPDATE {cls._meta.db_table} AS metric
+                    SET predicted_value = target.yhat,
+                        lower_value = target.yhat_lower,
+                        upper_value = target.yhat_upper,
+                        updated_at = NOW()
+                    FROM target
+                    WHERE metric.id = target.id
+                    RETURNING metric.predictor_id, metric.value, target.newly_scored,
+                              target.yhat, target.yhat_lower, target.yhat_upper
+                ), residuals AS (
+                    SELECT predictor_id,
+                           COUNT(*) AS scored,
+                           SUM(ABS(value - yhat)) AS abs_error,
+                           COUNT(*) FILTER (WHERE value < yhat_lower OR value > yhat_upper) AS outside,
+                           %(date)s::date AS last_date
+                    FROM filled
+                    WHERE newly_scored AND value IS NOT NULL
+                    GROUP BY predictor_id
+                ), stats AS (
+                    UPDATE {Predictor._meta.db_table} AS predictor
+                    {ADD_RESIDUALS_SQL}
+                    RETURNING predictor.id
+                )
+                SELECT (SELECT COUNT(*) FROM filled), (SELECT COUNT(*) FROM stats)
+                """,
+                {'date': date, **retraining.drift_thresholds()}
+            )
+            updated = cursor.fetchone()[0]
+        if updated:
+            invalidate_metric_tiles([date])
+        return updated
+
+    @classmethod
+    def series(cls, region_code: str, date_from=None, date_to=None, resolution: str = 'day') -> MetricSeries:
+        """
+        Returns the history of a region (between the dates, inclusive) as parallel arrays sorted by date,
+        built with a single aggregate query. With the `week` or `month` resolution, the metrics of every week
+        (starting on monday) or month are averaged, and the anomaly degree is the most extreme one of the period.
+        """
+        if resolution not in cls.SERIES_RESOLUTIONS:
+            raise ValueError(f"Invalid resolution '{resolution}'. Must be one of: {', '.join(cls.SERIES_RESOLUTIONS)}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT array_agg(period ORDER BY period),
+                       array_agg(value ORDER BY period),
+                       array_agg(predicted_value ORDER BY period),
+                       array_agg(lower_value ORDER BY period),
+                       array_agg(upper_value ORDER BY period),
+                       array_agg(anomaly_degree ORDER BY period)
+                FROM (
+                    SELECT date_trunc(%(resolution)s, metric.date::timestamp)::date AS period,
+                           AVG(metric.value) AS value,
+                           AVG(metric.predicted_value) AS predicted_value,
+                           AVG(metric.lower_value) AS lower_value,
+                           AVG(metric.upper_value) AS upper_value,
+                           (array_agg(metric.anomaly_degree ORDER BY ABS(metric.anomaly_degree) DESC NULLS LAST))[1]
+                               AS anomaly_degree
+                    FROM {cls._meta.db_table} AS metric
+                    WHERE metric.region_id = (
+                            SELECT id FROM {Municipality._meta.db_table} WHERE code = %(region_code)s
+                        )
+                        AND (%(date_from)s::date IS NULL OR metric.date >= %(date_from)s::date)
+                        AND (%(date_to)s::date IS NULL OR metric.date <= %(date_to)s::date)
+                    GROUP BY 1
+                ) AS periods
+                """,
+                {'resolution': resolution, 'region_code': region_code, 'date_from': date_from, 'date_to': date_to}
+            )
+            columns = cursor.fetchone()
+        return MetricSeries(
+            **{key: column or [] for key, column in zip(MetricSeries.__annotations__, columns)}
+        )
+
     def refresh_prediction(self, refresh_progress: bool = True) -> None:
         """
         (Async) Invokes the predictor and assign the Prediction fields.
         """
         refresh_prediction_task.delay(self.id, refresh_progress=refresh_progress)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tile_values = instance._tile_values()
+        return instance
+
+    def _tile_values(self) -> dict:
+        # The deferred fields are not loaded (nor compared).
+        return {field: self.__dict__[field] for field in self.TILE_FIELDS if field in self.__dict__}
+
+    def _tile_dates(self, update_fields=None) -> set:
+        """
+        Returns the dates whose tiles change if the metric is saved: none if no rendered field changed
+        since it was loaded (or saved).
+        """
+        loaded = getattr(self, '_loaded_tile_values', None)
+        if self._state.adding or loaded is None:
+            return {self.date}
+        current = self._tile_values()
+        fields = current.keys() if update_fields is None else current.keys() & set(update_fields)
+        if all(field in loaded and loaded[field] == current[field] for field in fields):
+            return set()
+        return {self.date, loaded.get('date', self.date)}
+
     def save(self, *args, **kwargs):
         is_adding = self._state.adding  # A new object is being created
 
         if self.value is not None and math.isnan(self.value):
             self.value = None
 
+        # Only the saves that change the rendered fields invalidate the cached tiles.
+        update_fields = kwargs.get('update_fields')
+        tile_dates = self._tile_dates(update_fields)
+
         # Save the initial Metric with the prediction values and the predictor to None.
         super().save(*args, **kwargs)
+        saved = self._tile_values()
+        if update_fields is not None:
+            saved = {field: value for field, value in saved.items() if field in update_fields}
+        self._loaded_tile_values = {**(getattr(self, '_loaded_tile_values', None) or {}), **saved}
+        if tile_dates:
+            invalidate_metric_tiles(tile_dates)
 
         # Assign a preditor to the Metric and set the prediction values.
         if is_adding:
+            MetricPredictionProgress.increment({self.date: (1, 0)})
             self.refresh_prediction()
 
     def __str__(self):
@@ -332,7 +711,18 @@ class MetricPredictionProgress(models.Model):
     """
     Model to store the data prediction progress information.
     Every time the metrics are updated, a prediction will be executed.
+    The progress is tracked with counters per date, which are incremented atomically as the metrics are
+    created and predicted, and recomputed at once with `refresh` when a batch finishes. None of them
+    locks the metrics.
     """
+    # Percentage from which the metrics of a date are considered predicted.
+    COMPLETE_PERCENTAGE = 0.95
+    # Whether no metric of an upserted date is pending and its tiles were not seeded yet, returned by the
+    # counters so only those dates are claimed (see `seed_completed`). A date that is complete with some metrics
+    # still pending is seeded at the end of its prediction (see `predict_date_task`), as predicting them would
+    # invalidate the seeded tiles.
+    _COMPLETED_SQL = 'progress.total > 0 AND progress.predicted >= progress.total AND progress.tiles_seeded_at IS NULL'
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     date = models.DateField(
         unique=True,
@@ -341,6 +731,16 @@ class MetricPredictionProgress(models.Model):
         verbose_name=_('Date'),
         help_text=_('The date of the execution.')
     )
+    total = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Total'),
+        help_text=_('The number of metrics of the date.')
+    )
+    predicted = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Predicted'),
+        help_text=_('The number of metrics of the date with a predicted value.')
+    )
     # Percentage of values successfully predicted and saved.
     success_percentage = models.FloatField(
         null=False,
@@ -350,20 +750,112 @@ class MetricPredictionProgress(models.Model):
         help_text=_('The percentage of success of the execution.'),
         validators=[MinValueValidator(0), MaxValueValidator(1)]
     )
+    tiles_seeded_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Tiles seeded at'),
+        help_text=_('When the seeding of the tiles of the date was queued, once its metrics were predicted.')
+    )
 
     @classmethod
-    def refresh(cls, date: datetime):
-        with transaction.atomic():
-            metrics_qs = Metric.objects.select_for_update().filter(date=date)
-            total = metrics_qs.count()
-            # total_finished = metrics_qs.predicted()
-            total_finished = metrics_qs.filter(predicted_value__isnull=False).count()
+    def increment(cls, counts: Dict[date_type, Tuple[int, int]]) -> None:
+        """
+        Atomically adds the number of created and predicted metrics of every date, with a single
+        INSERT ... ON CONFLICT DO UPDATE. Only the dates it completes are checked for seeding.
+
+        Args:
+            counts (dict): The number of created (total) and predicted metrics of every date.
+        """
+        if not counts:
+            return
+        dates = list(counts.keys())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table} AS progress (id, date, total, predicted, success_percentage)
+                SELECT gen_random_uuid(), delta.date, delta.total, delta.predicted,
+                    LEAST(COALESCE(delta.predicted::float / NULLIF(delta.total, 0), 0), 1)
+                FROM unnest(%s::date[], %s::integer[], %s::integer[]) AS delta(date, total, predicted)
+                ON CONFLICT (date) DO UPDATE
+                SET total = progress.total + EXCLUDED.total,
+                    predicted = progress.predicted + EXCLUDED.predicted,
+                    success_percentage = LEAST(COALESCE(
+                        (progress.predicted + EXCLUDED.predicted)::float
+                        / NULLIF(progress.total + EXCLUDED.total, 0), 0), 1)
+                RETURNING progress.date, {cls._COMPLETED_SQL}
+                """,
+                [dates, [counts[d][0] for d in dates], [counts[d][1] for d in dates]]
+            )
+            completed = [date for date, is_completed in cursor.fetchall() if is_completed]
+        cls.seed_completed(completed)
+
+    @classmethod
+    def refresh_many(cls, dates: List[date_type]) -> None:
+        """
+        Recomputes the counters of the dates from their metrics, with a single aggregate query.
+        """
+        if not dates:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {cls._meta.db_table} AS progress (id, date, total, predicted, success_percentage)
+                SELECT gen_random_uuid(), day.date, COUNT(metric.id), COUNT(metric.predicted_value),
+                    COALESCE(COUNT(metric.predicted_value)::float / NULLIF(COUNT(metric.id), 0), 0)
+                FROM unnest(%s::date[]) AS day(date)
+                LEFT JOIN {Metric._meta.db_table} AS metric ON metric.date = day.date
+                GROUP BY day.date
+                ON CONFLICT (date) DO UPDATE
+                SET total = EXCLUDED.total,
+                    predicted = EXCLUDED.predicted,
+                    success_percentage = EXCLUDED.success_percentage
+                RETURNING progress.date, {cls._COMPLETED_SQL}
+                """,
+                [list(dates)]
+            )
+            completed = [date for date, is_completed in cursor.fetchall() if is_completed]
+        cls.seed_completed(completed)
+
+    @classmethod
+    def seed_completed(cls, dates: List[date_type]) -> List[date_type]:
+        """
+        Queues the seeding of the tiles (see `tile_seeding`) of the dates whose metrics have been predicted
+        (their success percentage reached `COMPLETE_PERCENTAGE`). Every date is claimed with `tiles_seeded_at`
+        in a single UPDATE, so its tiles are only seeded the first time. Called once no metric of the dates
+        is pending, so the predictions do not invalidate the seeded tiles.
+
+        Returns:
+            list: The dates whose seeding was queued.
+        """
+        from django.conf import settings
 
-            perc = 0
-            if total > 0:
-                perc = total_finished / total
+        if not dates or not settings.TILE_SEED_ON_COMPLETE or tile_store() is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {cls._meta.db_table}
+                SET tiles_seeded_at = NOW()
+                WHERE date = ANY(%s::date[]) AND tiles_seeded_at IS NULL AND success_percentage >= %s
+                RETURNING date
+                """,
+                [list(dates), cls.COMPLETE_PERCENTAGE]
+            )
+            completed = sorted(row[0] for row in cursor.fetchall())
+        for date in completed:
+            transaction.on_commit(lambda date=date: seed_tiles_task.delay(date.isoformat()))
+        return completed
 
-            cls.objects.update_or_create(date=date, defaults={'success_percentage': perc})
+    @classmethod
+    def refresh(cls, date: datetime):
+        cls.refresh_many([date])
+
+    @classmethod
+    def last_complete(cls) -> Optional['MetricPredictionProgress']:
+        """
+        The progress of the last date whose metrics are predicted.
+        """
+        return cls.objects.filter(success_percentage__gte=cls.COMPLETE_PERCENTAGE).order_by('-date').first()
 
     def __str__(self):
         return f"Metric Execution of the day {self.date} with result: {self.success_percentage}"
@@ -371,7 +863,364 @@ class MetricPredictionProgress(models.Model):
     class Meta:
         ordering = ['date']
         indexes = [
-            models.Index(fields=['-date'])
+            models.Index(fields=['-date']),
+            models.Index(
+                fields=['-date'],
+                condition=models.Q(success_percentage__gte=0.95),
+                name='metric_progress_complete_idx'
+            ),
         ]
         verbose_name = "Metric Prediction Progress"
         verbose_name_plural = "Metric Prediction Progressses"
+
+
+class IngestJob(models.Model):
+    """
+    Model to store an uploaded file of metrics, which is ingested (and predicted) asynchronously.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        INSERTING = 'inserting', _('Inserting')
+        PREDICTING = 'predicting', _('Predicting')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+
+    class Mode(models.TextChoices):
+        INSERT = 'insert', _('Insert')
+        UPSERT = 'upsert', _('Upsert')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField(
+        null=False,
+        blank=False,
+        verbose_name=_('Date'),
+        help_text=_('The date of the metrics of the file.')
+    )
+    filename = models.CharField(
+        max_length=255,
+        verbose_name=_('Filename'),
+        help_text=_('The name of the uploaded file.')
+    )
+    # The file is stored in the database, so any worker can process it. Cleared once inserted.
+    content = models.BinaryField(
+        null=True,
+        blank=True,
+        verbose_name=_('Content'),
+        help_text=_('The content of the uploaded file, until it is inserted.')
+    )
+    mode = models.CharField(
+        max_length=16,
+        choices=Mode.choices,
+        default=Mode.INSERT,
+        verbose_name=_('Mode'),
+        help_text=_('Whether the existing metrics of the file make it fail (insert) or are updated (upsert).')
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name=_('Status'),
+        help_text=_('The status of the ingestion.')
+    )
+    parsed = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Parsed'),
+        help_text=_('The number of rows parsed from the file.')
+    )
+    inserted = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Inserted'),
+        help_text=_('The number of metrics inserted.')
+    )
+    updated = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Updated'),
+        help_text=_('The number of existing metrics whose value changed (upsert mode).')
+    )
+    predicted = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Predicted'),
+        help_text=_('The number of inserted metrics with a predicted value.')
+    )
+    failed = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Failed'),
+        help_text=_('The number of rows that could not be inserted, such as rows of unknown regions.')
+    )
+    error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_('Error'),
+        help_text=_('The error that made the ingestion fail.')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def fail(self, error: str):
+        """
+        Marks the job as failed with the given error.
+        """
+        self.status = self.Status.FAILED
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished_at'])
+
+    def insert(self) -> bool:
+        """
+        Parses the file and inserts its metrics (see `ingestion`). The rows of unknown regions are counted
+        as failed. The whole file fails if it can not be read, or if any of its metrics already exists
+        in the insert mode. In the upsert mode, the existing metrics whose value changed are updated.
+
+        Returns:
+            bool: Whether the metrics were inserted, so they can be predicted.
+        """
+        from anomaly_detection.predictions.ingestion import (copy_metrics, prepare_metrics, read_metrics_csv,
+                                                             upsert_metrics)
+
+        self.status = self.Status.INSERTING
+        self.started_at = timezone.now()
+        self.save(update_fields=['status', 'started_at'])
+
+        try:
+            df = read_metrics_csv(bytes(self.content))
+        except ValueError as e:
+            self.fail(str(e))
+            return False
+
+        metrics, unknown_codes = prepare_metrics(df.assign(date=self.date))
+        self.parsed = len(df)
+        self.failed = len(df) - len(metrics)
+
+        try:
+            with transaction.atomic():
+                if self.mode == self.Mode.UPSERT:
+                    self.inserted, self.updated = upsert_metrics(metrics)
+                else:
+                    self.inserted = copy_metrics(metrics)
+        except IntegrityError:
+            self.save(update_fields=['parsed', 'failed'])
+            self.fail(f"The file has duplicated regions or the metrics of {self.date} already exist.")
+            return False
+        except DatabaseError as e:
+            # Any other error of the database (such as an invalid value) must not leave the job inserting.
+            self.save(update_fields=['parsed', 'failed'])
+            self.fail(f"The metrics could not be inserted: {e}")
+            return False
+
+        MetricPredictionProgress.increment({self.date: (self.inserted, 0)})
+        self.status = self.Status.PREDICTING
+        self.content = None
+        self.save(update_fields=['status', 'content', 'parsed', 'inserted', 'updated', 'failed'])
+        return True
+
+    def __str__(self):
+        return f"Ingestion of {self.filename} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Ingest Job"
+        verbose_name_plural = "Ingest Jobs"
+
+
+class BackfillRun(models.Model):
+    """
+    Model to store a backfill, which predicts the metrics of a range of dates again.
+    The predictors are split in chunks, and only `concurrency` chunks are queued at the same time:
+    every chunk that finishes queues the next one. The chunk that finishes the last one (fan-in)
+    recomputes the prediction progress of the range once.
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    from_date = models.DateField(
+        verbose_name=_('From date'),
+        help_text=_('The first date of the metrics to predict.')
+    )
+    to_date = models.DateField(
+        verbose_name=_('To date'),
+        help_text=_('The last date of the metrics to predict.')
+    )
+    region = models.ForeignKey(
+        Municipality,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='backfill_runs',
+        verbose_name=_('Region'),
+        help_text=_('The only region to predict, if any.')
+    )
+    predictor_ids = ArrayField(
+        base_field=models.BigIntegerField(),
+        default=list,
+        verbose_name=_('Predictors'),
+        help_text=_('The ids of the predictors to predict the metrics with, in chunk order.')
+    )
+    chunk_size = models.PositiveIntegerField(
+        verbose_name=_('Chunk size'),
+        help_text=_('The number of predictors of every chunk.')
+    )
+    concurrency = models.PositiveIntegerField(
+        verbose_name=_('Concurrency'),
+        help_text=_('The maximum number of chunks queued at the same time.')
+    )
+    total_chunks = models.PositiveIntegerField(default=0, verbose_name=_('Total chunks'))
+    # Number of chunks queued, and number of chunks finished (successfully or not).
+    queued_chunks = models.PositiveIntegerField(default=0, verbose_name=_('Queued chunks'))
+    done_chunks = models.PositiveIntegerField(default=0, verbose_name=_('Done chunks'))
+    failed_chunks = models.PositiveIntegerField(default=0, verbose_name=_('Failed chunks'))
+    failed_predictor_ids = ArrayField(
+        base_field=models.BigIntegerField(),
+        default=list,
+        blank=True,
+        verbose_name=_('Failed predictors'),
+        help_text=_('The ids of the predictors whose metrics could not be predicted.')
+    )
+    predicted = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Predicted'),
+        help_text=_('The number of metrics predicted.')
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.RUNNING,
+        verbose_name=_('Status'),
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def start(cls, from_date, to_date, region_id=None, chunk_size=None, concurrency=None) -> 'BackfillRun':
+        """
+        Creates a backfill of the metrics between the dates (inclusive), and queues its first chunks.
+        The predictors that could not be trained (see `Predictor.untrainable`) are skipped.
+        """
+        from django.conf import settings
+
+        predictor_qs = Predictor.objects.filter(
+            models.Exists(
+                Metric.objects.filter(predictor=OuterRef('pk'), date__gte=from_date, date__lte=to_date)
+            ),
+            untrainable__isnull=True,
+        )
+        if region_id:
+            predictor_qs = predictor_qs.filter(region_id=region_id)
+        predictor_ids = list(predictor_qs.order_by('id').values_list('id', flat=True))
+
+        chunk_size = chunk_size or settings.BACKFILL_CHUNK_SIZE
+        run = cls.objects.create(
+            from_date=from_date,
+            to_date=to_date,
+            region_id=region_id,
+            predictor_ids=predictor_ids,
+            chunk_size=chunk_size,
+            concurrency=concurrency or settings.BACKFILL_CONCURRENCY or os.cpu_count() or 1,
+            total_chunks=math.ceil(len(predictor_ids) / chunk_size),
+        )
+        if not run.total_chunks:
+            run.finish()
+            return run
+
+        transaction.on_commit(run.queue_first_chunks)
+        return run
+
+    def queue_first_chunks(self):
+        """
+        Queues as many chunks as the concurrency allows.
+        """
+        for _ in range(self.concurrency):
+            if self.queue_next_chunk() is None:
+                break
+
+    def chunk(self, index: int) -> List[int]:
+        """
+        The ids of the predictors of a chunk, sliced in the database not to load every id.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT predictor_ids[%s:%s] FROM {self._meta.db_table} WHERE id = %s",
+                [index * self.chunk_size + 1, (index + 1) * self.chunk_size, self.id]
+            )
+            return cursor.fetchone()[0] or []
+
+    def queue_next_chunk(self) -> Optional[int]:
+        """
+        Atomically claims the next chunk not queued yet, and queues it. Returns its index, if any.
+        """
+        from anomaly_detection.predictions.tasks import backfill_chunk_task
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {self._meta.db_table} SET queued_chunks = queued_chunks + 1
+                WHERE id = %s AND queued_chunks < total_chunks
+                RETURNING queued_chunks - 1
+                """,
+                [self.id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        backfill_chunk_task.delay(str(self.id), row[0])
+        return row[0]
+
+    def chunk_done(self, predicted: int, failed_ids: Sequence[int] = ()) -> bool:
+        """
+        Atomically counts a finished chunk, and records the predictors of the chunk that failed (if any, the
+        chunk is counted as failed). Returns whether it was the last one.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {self._meta.db_table}
+                SET done_chunks = done_chunks + 1, failed_chunks = failed_chunks + %s, predicted = predicted + %s,
+                    failed_predictor_ids = failed_predictor_ids || %s::bigint[]
+                WHERE id = %s
+                RETURNING done_chunks = total_chunks
+                """,
+                [int(bool(failed_ids)), predicted, list(failed_ids), self.id]
+            )
+            return cursor.fetchone()[0]
+
+    def finish(self):
+        """
+        Recomputes the prediction progress of every date of the range, and marks the backfill as done.
+        """
+        MetricPredictionProgress.refresh_many(
+            [self.from_date + timedelta(days=i) for i in range((self.to_date - self.from_date).days + 1)]
+        )
+        self.status = self.Status.DONE
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'finished_at'])
+
+    @property
+    def percentage(self) -> float:
+        """
+        The percentage of chunks finished.
+        """
+        return self.done_chunks / self.total_chunks if self.total_chunks else 1.
+
+    @property
+    def eta(self) -> Optional[datetime]:
+        """
+        The estimated time of arrival, from the average time per chunk finished so far.
+        """
+        if self.finished_at:
+            return self.finished_at
+        if not self.done_chunks:
+            return None
+        elapsed = timezone.now() - self.created_at
+        return timezone.now() + elapsed / self.done_chunks * (self.total_chunks - self.done_chunks)
+
+    def __str__(self):
+        return f"Backfill from {self.from_date} to {self.to_date} ({self.percentage:.0%})"
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Backfill Run"
+        verbose_name_plural = "Backfill Runs"
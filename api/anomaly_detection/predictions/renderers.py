@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Iterable, Iterator, Sequence
+
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingRenderer(ABC, BaseRenderer):
+    """
+    Base renderer of the exports, which are streamed row by row (see `stream`) instead of rendered at once.
+    `render` is only used for the responses that are not streamed, such as the errors.
+    """
+    charset = 'utf-8'
+    # Number of rows written in every chunk of the stream.
+    chunk_rows = 1000
+
+    def _to_rows(self, data) -> Sequence[dict]:
+        if data is None:
+            return []
+        return data if isinstance(data, list) else [data]
+
+    @abstractmethod
+    def stream(self, fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[str]:
+        """
+        Yields the rows (tuples of the values of the fields) as chunks of text.
+        """
+
+
+class CSVRenderer(StreamingRenderer):
+    """
+    Renderer of CSV files, with a header row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = self._to_rows(data)
+        if not rows:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+    def stream(self, fields, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        # The header is sent at once, before the first rows are fetched.
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        for i, row in enumerate(rows, start=1):
+            writer.writerow(row)
+            if i % self.chunk_rows == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """
+    Renderer of newline delimited JSON files, with an object per row.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(json.dumps(row, default=str) + '\n' for row in self._to_rows(data)).encode(self.charset)
+
+    def stream(self, fields, rows):
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(fields, row)), default=str))
+            if len(lines) == self.chunk_rows:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
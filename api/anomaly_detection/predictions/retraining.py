@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+
+# Predictors expire at the end of the retraining slot of their region, every EXPIRY_DAYS.
+SCHEDULE = 'schedule'
+# Predictors expire when their residuals drift (see `drift_condition`), or at their maximum age.
+DRIFT = 'drift'
+
+
+def policy() -> str:
+    """
+    The retraining policy of the predictors (see `PREDICTOR_RETRAINING_POLICY`).
+    """
+    return getattr(settings, 'PREDICTOR_RETRAINING_POLICY', SCHEDULE)
+
+
+def max_age_days(expiry_days: int) -> int:
+    """
+    The maximum number of days a predictor is used after its training date.
+    """
+    if policy() == DRIFT:
+        return max(getattr(settings, 'PREDICTOR_MAX_AGE_DAYS', expiry_days), expiry_days)
+    return expiry_days
+
+
+def age_limit_days(region_id: int, expiry_days: int) -> int:
+    """
+    The age at which the predictors of a region expire with the drift policy. The limit is shortened by
+    an offset given by the region id (up to `expiry_days`), so the predictors trained on the same day do
+    not all reach the maximum age (and are retrained) on the same day.
+    """
+    return max_age_days(expiry_days) - region_id % expiry_days
+
+
+def new_training_date(region_id: int, date: datetime, expiry_days: int) -> datetime:
+    """
+    The training date of a new predictor of the region, needed to predict the date.
+    With the schedule policy, the start of the retraining slot of the region that contains the date.
+    With the drift policy, the date itself, so the new predictor is trained with the drifted values.
+    """
+    if policy() == DRIFT:
+        return date
+    return date - timedelta(days=(date.toordinal() - region_id % expiry_days) % expiry_days)
+
+
+def drift_thresholds() -> dict:
+    """
+    The thresholds of the residuals of a predictor from which it is stale:
+        min_scored: The minimum number of scored metrics to evaluate the residuals.
+        max_error: The maximum mean absolute error of the predicted values.
+        max_outside_rate: The maximum rate of values outside the prediction interval (anomalies).
+    """
+    return {
+        'min_scored': getattr(settings, 'PREDICTOR_DRIFT_MIN_SCORED', 14),
+        'max_error': getattr(settings, 'PREDICTOR_DRIFT_MAX_ERROR', 0.1),
+        'max_outside_rate': getattr(settings, 'PREDICTOR_DRIFT_MAX_OUTSIDE_RATE', 0.5),
+    }
@@ -0,0 +1,158 @@
+from datetime import datetime
+from statistics import NormalDist
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from anomaly_detection.predictions.training import TrainingResult
+
+
+ENGINE = 'seasonal'
+DAYS_PER_YEAR = 365
+# Half width, in days, of the window used to smooth the seasonal profile.
+SMOOTHING_DAYS = 7
+# Same coverage as the Prophet uncertainty intervals (interval_width=0.8).
+INTERVAL_WIDTH = 0.8
+# Scale of the MAD to estimate the standard deviation of normally distributed values.
+MAD_TO_STD = 1.4826
+# Decimals kept in the stored profiles.
+DECIMALS = 6
+
+
+def day_of_year(dates) -> np.ndarray:
+    """
+    Day of the year (0 to 364) of the dates. The 29th of February is the same day as the 28th.
+    """
+    index = pd.DatetimeIndex(pd.to_datetime(dates))
+    day = index.dayofyear.to_numpy() - 1
+    return day - (index.is_leap_year & (day >= 59)).astype(int)
+
+
+def _smooth(profiles: np.ndarray) -> np.ndarray:
+    """
+    Circular moving average of the profiles (one per row) ignoring the missing days.
+    """
+    window = 2 * SMOOTHING_DAYS + 1
+    padded = np.concatenate(
+        (profiles[:, -SMOOTHING_DAYS:], profiles, profiles[:, :SMOOTHING_DAYS]), axis=1
+    )
+
+    def moving_sum(values):
+        cumsum = np.concatenate((np.zeros((values.shape[0], 1)), np.cumsum(values, axis=1)), axis=1)
+        return cumsum[:, window:] - cumsum[:, :-window]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return moving_sum(np.nan_to_num(padded)) / moving_sum((~np.isnan(padded)).astype(float))
+
+
+def fit_seasonal_many(
+    histories: Dict[Hashable, pd.DataFrame],
+    min_days: int,
+) -> Dict[Hashable, Optional[TrainingResult]]:
+    """
+    Fits the seasonal baseline of several regions in a single vectorized pass.
+
+    The prediction of a day is the median of the values of the same day of the year in the history,
+    and the bands are built from the median absolute deviation (MAD) of those values. Both profiles
+    are smoothed with a moving window of +-`SMOOTHING_DAYS` days. As with Prophet, the leading zeros
+    of every history are ignored and histories with less than `min_days` values are not trained.
+
+    Args:
+        histories (dict): A DataFrame with the columns `ds` and `y`, sorted by date, for each key.
+        min_days (int): The minimum number of values needed to fit a region.
+
+    Returns:
+        dict: The training result for each key, or None if it could not be trained.
+    """
+    results: Dict[Hashable, Optional[TrainingResult]] = {key: None for key in histories}
+    frames = [df.assign(key=i) for i, df in enumerate(histories.values()) if not df.empty]
+    if not frames:
+        return results
+    keys = list(histories.keys())
+
+    df = pd.concat(frames, ignore_index=True)
+    # Ignore the leading zeros (and the missing values) of every history.
+    started = df['y'].fillna(0).ne(0).groupby(df['key']).cummax()
+    df = df[started & df['y'].notna()]
+    counts = df.groupby('key').size()
+    df = df[df['key'].isin(counts[counts >= min_days].index)]
+    if df.empty:
+        return results
+
+    df = df.assign(day=day_of_year(df['ds']))
+    profile = df.groupby(['key', 'day'])['y'].median().unstack('day').reindex(columns=range(DAYS_PER_YEAR))
+    yhat = _smooth(profile.to_numpy())
+    # The days without values in the whole window get the median of the region.
+    yhat = np.clip(np.where(np.isnan(yhat), np.nanmedian(profile.to_numpy(), axis=1)[:, None], yhat), 0, 1)
+
+    # The deviations are measured from the smoothed profile, not from the median of each day, which
+    # with a few years of history would be one of the values itself.
+    rows = profile.index.get_indexer(df['key'])
+    deviation = np.abs(df['y'].to_numpy() - yhat[rows, df['day'].to_numpy()])
+    mad = pd.Series(deviation).groupby([df['key'].to_numpy(), df['day'].to_numpy()]).median().unstack().reindex(
+        index=profile.index, columns=range(DAYS_PER_YEAR)
+    )
+    band = NormalDist().inv_cdf(0.5 + INTERVAL_WIDTH / 2) * MAD_TO_STD * np.nan_to_num(_smooth(mad.to_numpy()))
+    lower = np.clip(yhat - band, 0, 1)
+    upper = np.clip(yhat + band, 0, 1)
+    # Level of the series, as a yearly centered moving average.
+    trend = df.groupby('key')['y'].transform(lambda y: y.rolling(DAYS_PER_YEAR, center=True, min_periods=1).mean())
+    trends = {key_index: values.to_list() for key_index, values in trend.groupby(df['key'])}
+
+    for row, key_index in enumerate(profile.index):
+        parameters = {
+            'engine': ENGINE,
+            'yhat': yhat[row].round(DECIMALS).tolist(),
+            'lower': lower[row].round(DECIMALS).tolist(),
+            'upper': upper[row].round(DECIMALS).tolist(),
+        }
+        results[keys[key_index]] = TrainingResult(
+            # There is no model to store, the parameters are enough to predict.
+            weights=None,
+            parameters=parameters,
+            trend=trends[key_index],
+            yearly_seasonality=(yhat[row] - np.nanmean(yhat[row])).tolist(),
+            warm_started=False,
+        )
+    return results
+
+
+class SeasonalPredictor:
+    """
+    Prediction of several seasonal baselines (see `fit_seasonal_many`), with the same interface as
+    `VectorizedPredictor`.
+    """
+
+    def __init__(self, parameters: Dict[Hashable, Dict[str, Any]]):
+        keys = list(parameters.keys())
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.yhat = np.array([parameters[key]['yhat'] for key in keys], dtype=float).reshape(-1, DAYS_PER_YEAR)
+        self.lower = np.array([parameters[key]['lower'] for key in keys], dtype=float).reshape(-1, DAYS_PER_YEAR)
+        self.upper = np.array([parameters[key]['upper'] for key in keys], dtype=float).reshape(-1, DAYS_PER_YEAR)
+
+    def predict(self, keys: Sequence[Hashable], dates: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Predicts the value of every (predictor key, date) pair.
+
+        Returns:
+            tuple: The arrays of yhat, yhat_lower and yhat_upper.
+        """
+        p = np.array([self.index[key] for key in keys], dtype=int)
+        day = day_of_year([d.date() if isinstance(d, datetime) else d for d in dates])
+        return self.yhat[p, day], self.lower[p, day], self.upper[p, day]
+
+    def predict_dates(self, key: Hashable, dates: Sequence) -> List[Dict[str, Any]]:
+        """
+        Predicts the values of a single predictor for the specified dates.
+        """
+        yhat, yhat_lower, yhat_upper = self.predict([key] * len(dates), dates)
+        return [
+            {
+                'datetime': d if isinstance(d, datetime) else datetime.combine(d, datetime.min.time()),
+                'yhat': float(yhat[i]),
+                'yhat_lower': float(yhat_lower[i]),
+                'yhat_upper': float(yhat_upper[i]),
+            }
+            for i, d in enumerate(dates)
+        ]
@@ -1,17 +1,17 @@
-import math
 import re
 from datetime import datetime
 
-import pandas as pd
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import (ModelSerializer, Serializer,
                                         SerializerMethodField)
 
-from anomaly_detection.regions.models import Municipality
 from anomaly_detection.regions.serializers import MunicipalitySerializer
 
-from .models import Metric, Predictor
+from .ingestion import read_metrics_csv
+from .models import IngestJob, Metric, Predictor
+from .tasks import ingest_metrics_task
 
 
 class MetricSerializer(ModelSerializer):
@@ -30,15 +30,28 @@ class MetricSerializer(ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'anomaly_degree']
 
 
+class PredictorStatusSerializer(ModelSerializer):
+    """
+    Serializer for the training status of the Predictor of a Metric.
+    """
+    date = serializers.DateTimeField(source='last_training_date', format='%Y-%m-%d')
+    trained = serializers.BooleanField(source='is_trained')
+
+    class Meta:
+        model = Predictor
+        fields = ['date', 'trained', 'untrainable', 'trainable_from']
+
+
 class MetricDetailSerializer(MetricSerializer):
     """
     Serializer for the Metric detail.
     """
     region = MunicipalitySerializer()
+    predictor = PredictorStatusSerializer(allow_null=True)
 
     class Meta(MetricSerializer.Meta):
         fields = ['id', 'date', 'value', 'predicted_value', 'lower_value', 'upper_value',
-                  'anomaly_degree', 'region']
+                  'anomaly_degree', 'region', 'predictor']
 
 
 class MetricSeasonalitySerializer(ModelSerializer):
@@ -64,6 +77,28 @@ class MetricTrendSerializer(ModelSerializer):
         fields = ['date', 'trend']
 
 
+class MetricSeriesQuerySerializer(Serializer):
+    """
+    Serializer for the query parameters of the Metric series.
+    """
+    region_code = serializers.CharField()
+    date_from = serializers.DateField(required=False, default=None)
+    date_to = serializers.DateField(required=False, default=None)
+    resolution = serializers.ChoiceField(choices=Metric.SERIES_RESOLUTIONS, default='day')
+
+
+class MetricSeriesSerializer(Serializer):
+    """
+    Serializer for the history of a region as parallel arrays, sorted by date.
+    """
+    dates = serializers.ListField(child=serializers.DateField())
+    values = serializers.ListField(child=serializers.FloatField(allow_null=True))
+    predicted_values = serializers.ListField(child=serializers.FloatField(allow_null=True))
+    lower_values = serializers.ListField(child=serializers.FloatField(allow_null=True))
+    upper_values = serializers.ListField(child=serializers.FloatField(allow_null=True))
+    anomaly_degrees = serializers.ListField(child=serializers.FloatField(allow_null=True))
+
+
 class LastMetricDateSerializer(Serializer):
     """
     Serializer for the Metric Executions.
@@ -76,6 +111,12 @@ class MetricFileSerializer(Serializer):
     Serializer for uploading a file with a batch of metrics.
     """
     file = serializers.FileField()
+    mode = serializers.ChoiceField(
+        choices=IngestJob.Mode.choices,
+        default=IngestJob.Mode.INSERT,
+        help_text='Whether the existing metrics of the date make the upload fail (insert), '
+                  'or their values are updated (upsert).'
+    )
 
     def validate_file(self, file):
         """
@@ -107,47 +148,40 @@ class MetricFileSerializer(Serializer):
 
         return file
 
+    def validate(self, attrs):
+        """
+        Validate the header of the CSV file. The rows are parsed asynchronously when it is ingested.
+        """
+        file = attrs['file']
+        try:
+            read_metrics_csv(file, nrows=1)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        file.seek(0)
+        return attrs
+
     def create(self, validated_data):
         """
-        Create the metrics contained in the CSV file.
+        Store the CSV file as an ingest job and enqueue its ingestion.
         """
         file = validated_data['file']
-        date = self.context.get('filename_date')
+        job = IngestJob.objects.create(
+            date=self.context.get('filename_date'),
+            filename=file.name,
+            mode=validated_data['mode'],
+            content=file.read(),
+        )
+        transaction.on_commit(lambda: ingest_metrics_task.delay(str(job.id)))
+        return job
 
-        try:
-            df = pd.read_csv(file)
-        except Exception as e:
-            raise ValidationError(f"Error reading CSV: {str(e)}")
-
-        # Validate content
-        required_columns = {'code', 'est'}
-        if not required_columns.issubset(df.columns):
-            missing = required_columns - set(df.columns)
-            raise ValidationError(f'Missing required columns: {", ".join(missing)}')
-        if df.empty:
-            raise ValidationError("The uploaded CSV file is empty — no rows found.")
-
-        region_code_to_id = {obj.code: obj.id for obj in Municipality.objects.all()}
-
-        metrics_to_create = []
-        for idx, row in df.iterrows():
-            metrics_to_create.append(
-                Metric(
-                    region_id=region_code_to_id[row['code']],
-                    date=date,
-                    value=row['est'] if not math.isnan(row['est']) else None,
-                )
-            )
-
-        # Create the metrics without the prediction values
-        objs = Metric.objects.bulk_create(metrics_to_create, batch_size=2000)
-
-        # Perform prediction for each metric
-        for i, metric in enumerate(objs):
-            # An update per metric won't represent a significant delta in progress,
-            # so it will be updated each 10th metric prediction for performance reasons
-            if i % 10 == 0 or i == len(objs) - 1:
-                metric.refresh_prediction(refresh_progress=True)
-            else:
-                metric.refresh_prediction(refresh_progress=False)
-        return objs
+
+class IngestJobSerializer(ModelSerializer):
+    """
+    Serializer for the status of an ingest job.
+    """
+
+    class Meta:
+        model = IngestJob
+        fields = ['id', 'date', 'filename', 'mode', 'status', 'parsed', 'inserted', 'updated', 'predicted', 'failed',
+                  'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,127 @@
+import json
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+from prophet.serialize import SIMPLE_ATTRIBUTES, model_from_json
+
+
+# Version of the format, stored in the payload so it can evolve without breaking the stored weights.
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+
+def _timestamps(values) -> list:
+    return [pd.Timestamp(value).isoformat() for value in values]
+
+
+def model_to_payload(model: Prophet) -> Dict[str, Any]:
+    """
+    Converts a fitted Prophet model to a dictionary with only what is needed to predict.
+
+    Unlike `prophet.serialize.model_to_dict`, the training history (only its last row is kept, as
+    Prophet requires a fitted model to have one), the fitted trend and the fit arguments are left out.
+    The keys shared with `model_to_dict` keep their name and meaning.
+    """
+    if model.history is None:
+        raise ValueError('Only fitted models can be stored.')
+    if model.holidays is not None or model.extra_regressors:
+        raise ValueError('Models with holidays or regressors are not supported.')
+
+    last = model.history.iloc[-1]
+    return {
+        '__format_version': FORMAT_VERSION,
+        **{attribute: getattr(model, attribute) for attribute in SIMPLE_ATTRIBUTES},
+        'start': model.start.timestamp(),
+        't_scale': model.t_scale.total_seconds(),
+        'changepoints': _timestamps(model.changepoints) if model.changepoints is not None else None,
+        'changepoints_t': np.asarray(model.changepoints_t).tolist(),
+        'seasonalities': [list(model.seasonalities.keys()), model.seasonalities],
+        'train_component_cols': {
+            'columns': model.train_component_cols.columns.tolist(),
+            'data': model.train_component_cols.values.tolist(),
+        },
+        'history': {
+            'ds': pd.Timestamp(last['ds']).isoformat(),
+            **{column: float(last[column]) for column in model.history.columns if column != 'ds'},
+        },
+        'params': {key: np.asarray(value).tolist() for key, value in model.params.items() if key != 'trend'},
+    }
+
+
+def model_from_payload(payload: Dict[str, Any]) -> Prophet:
+    """
+    Rebuilds the Prophet model stored with `model_to_payload`.
+    """
+    if payload.get('__format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported weights format: {payload.get('__format_version')}")
+
+    model = Prophet()  # Every attribute set in init is overwritten.
+    for attribute in SIMPLE_ATTRIBUTES:
+        setattr(model, attribute, payload[attribute])
+    model.start = pd.Timestamp(payload['start'], unit='s')
+    model.t_scale = pd.Timedelta(seconds=payload['t_scale'])
+    model.changepoints = (
+        pd.Series(pd.to_datetime(payload['changepoints']), name='ds')
+        if payload['changepoints'] is not None else None
+    )
+    model.changepoints_t = np.array(payload['changepoints_t'])
+    key_list, seasonalities = payload['seasonalities']
+    model.seasonalities = OrderedDict((key, seasonalities[key]) for key in key_list)
+    model.extra_regressors = OrderedDict()
+    model.holidays = None
+    model.train_holiday_names = None
+
+    component_cols = pd.DataFrame(payload['train_component_cols']['data'], columns=payload['train_component_cols']['columns'])
+    component_cols.columns.name = 'component'
+    component_cols.index.name = 'col'
+    model.train_component_cols = component_cols
+
+    history = pd.DataFrame([payload['history']])
+    history['ds'] = pd.to_datetime(history['ds'])
+    model.history = history
+    model.history_dates = history['ds']
+
+    model.fit_kwargs = {}
+    model.params = {key: np.array(value) for key, value in payload['params'].items()}
+    model.stan_backend = None
+    model.stan_fit = None
+    return model
+
+
+def dumps(payload: Dict[str, Any]) -> bytes:
+    """
+    Compresses a payload to be stored in `Predictor.weights`.
+    """
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def loads(data: Union[bytes, memoryview]) -> Dict[str, Any]:
+    """
+    Decompresses the payload stored in `Predictor.weights`.
+    """
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def serialize_model(model: Prophet) -> bytes:
+    """
+    Serializes a fitted Prophet model to the compressed format stored in `Predictor.weights`.
+    """
+    return dumps(model_to_payload(model))
+
+
+def deserialize_model(data: Union[bytes, memoryview]) -> Prophet:
+    """
+    Deserializes a Prophet model stored with `serialize_model`.
+    """
+    return model_from_payload(loads(data))
+
+
+def compact_weights(weights: str) -> bytes:
+    """
+    Converts the weights stored with `prophet.serialize.model_to_json` to the compressed format.
+    """
+    return serialize_model(model_from_json(weights))
@@ -1,9 +1,15 @@
 
-from datetime import datetime
-from celery import shared_task
+import time
+from datetime import date, datetime, timedelta
+from celery import group, shared_task
+from celery.utils.log import get_task_logger
 from django.db import IntegrityError, transaction, models
 from django.utils import timezone
 from anomaly_detection.utils.datetime import generate_date_range
+from anomaly_detection.predictions.tile_cache import invalidate_metric_tiles
+
+
+logger = get_task_logger(__name__)
 
 
 @shared_task
@@ -11,7 +17,8 @@ def refresh_prediction_task(metric_id, refresh_progress=True):
     """
     Invokes the predictor and assign the Prediction fields.
     """
-    from anomaly_detection.predictions.models import Metric, MetricPredictionProgress, Predictor
+    from anomaly_detection.predictions.engines import engine_for_region
+    from anomaly_detection.predictions.models import Forecast, Metric, MetricPredictionProgress, Predictor
 
     try:
         metric = Metric.objects.get(id=metric_id)
@@ -22,7 +29,7 @@ def refresh_prediction_task(metric_id, refresh_progress=True):
         datetime.combine(metric.date, datetime.min.time())
     )
 
-    if not getattr(metric, 'predictor', None):
+    if not metric.predictor_id:
         try:
             metric.predictor = Predictor.objects.get_not_expired(region_id=metric.region, date=aware_datetime)
         except Predictor.DoesNotExist:
@@ -30,7 +37,8 @@ def refresh_prediction_task(metric_id, refresh_progress=True):
                 with transaction.atomic():
                     metric.predictor = Predictor.objects.create(
                         region_id=metric.region_id,
-                        last_training_date=aware_datetime,
+                        last_training_date=Predictor.scheduled_training_date(metric.region_id, aware_datetime),
+                        engine=engine_for_region(metric.region.code),
                     )
             except IntegrityError:
                 # If the IntegrityError is raised, it means that another process has already created the predictor
@@ -39,9 +47,19 @@ def refresh_prediction_task(metric_id, refresh_progress=True):
         finally:
             metric.save(update_fields=['predictor'])
 
-    results = metric.predictor.predict(dates=[metric.date,])
+    if metric.predictor.untrainable:
+        # Its history was not enough to train it: do not load (and check) the history again.
+        return
+
+    # Use the forecast precomputed at training time, if any, not to load the predictor.
+    forecast = Forecast.objects.filter(predictor_id=metric.predictor_id, date=metric.date).first()
+    if forecast:
+        results = [{'yhat': forecast.yhat, 'yhat_upper': forecast.yhat_upper, 'yhat_lower': forecast.yhat_lower}]
+    else:
+        results = metric.predictor.predict(dates=[metric.date,])
     if not results:
         return
+    was_predicted = metric.predicted_value is not None
     try:
         if result := results[0]:
             metric.predicted_value = result['yhat']
@@ -51,48 +69,36 @@ def refresh_prediction_task(metric_id, refresh_progress=True):
     except IndexError:
         pass
 
-    if refresh_progress:
-        MetricPredictionProgress.refresh(date=metric.date)
+    if not was_predicted and metric.predicted_value is not None:
+        Predictor.objects.add_residuals([metric])
+        if refresh_progress:
+            MetricPredictionProgress.increment({metric.date: (0, 1)})
 
 
 @shared_task
 def predict_batch_task(from_date, to_date, region_id=None):
     """
-    Update the predicted values in the Metric model, given their assigned predictor.
+    Update the predicted values in the Metric model, given their assigned predictor, as a backfill run
+    (see `BackfillRun`). Returns the id of the run.
     """
-    from anomaly_detection.predictions.models import Metric, Predictor
+    from anomaly_detection.predictions.models import BackfillRun
 
-    predictor_qs = Predictor.objects.filter(
-        models.Exists(
-            Metric.objects.filter(
-                predictor=models.OuterRef('pk'),
-                date__gte=from_date,
-                date__lte=to_date
-            )
-        )
+    run = BackfillRun.start(
+        from_date=date.fromisoformat(str(from_date)), to_date=date.fromisoformat(str(to_date)), region_id=region_id
     )
-    if region_id:
-        predictor_qs = predictor_qs.filter(region_id=region_id)
-
-    for predictor in predictor_qs.iterator(chunk_size=2000):
-        batch_update_metrics_for_predictor_task.delay(
-            predictor_id=predictor.id,
-            from_date=from_date,
-            to_date=to_date
-        )
+    return str(run.id)
 
 
-@shared_task
-def batch_update_metrics_for_predictor_task(predictor_id, from_date, to_date):
+def _update_metrics_for_predictor(predictor, from_date, to_date):
     """
-    Update the predicted values in the Metric model for a specific predictor
+    Sets the predicted values of the metrics of a predictor between the dates (inclusive), and adds the residuals
+    of the ones predicted for the first time to the predictor (see `PredictorManager.add_residuals`).
+    Returns the number of metrics updated, and the dates of the ones predicted for the first time.
     """
-    from anomaly_detection.predictions.models import Metric, Predictor, MetricPredictionProgress
+    from anomaly_detection.predictions.models import Metric, Predictor
 
-    try:
-        predictor = Predictor.objects.get(id=predictor_id)
-    except Predictor.DoesNotExist:
-        return
+    if predictor.untrainable:
+        return 0, []
 
     date_to_pk = {
         metric.date: metric
@@ -100,8 +106,11 @@ def batch_update_metrics_for_predictor_task(predictor_id, from_date, to_date):
     }
 
     metric_to_update = []
-    for result in predictor.predict(dates=list(generate_date_range(from_date, to_date))):
+    newly_predicted = []
+    for result in predictor.predict(dates=list(generate_date_range(from_date, to_date))) or []:
         if metric := date_to_pk.get(result['datetime'].date(), None):
+            if metric.predicted_value is None:
+                newly_predicted.append(metric)
             metric.predicted_value = result['yhat']
             metric.upper_value = result['yhat_upper']
             metric.lower_value = result['yhat_lower']
@@ -113,7 +122,213 @@ def batch_update_metrics_for_predictor_task(predictor_id, from_date, to_date):
             batch_size=2000,
             fields=['predicted_value', 'upper_value', 'lower_value']
         )
+        Predictor.objects.add_residuals(newly_predicted)
+    return len(metric_to_update), [metric.date for metric in newly_predicted]
+
+
+@shared_task
+def batch_update_metrics_for_predictor_task(predictor_id, from_date, to_date):
+    """
+    Update the predicted values in the Metric model for a specific predictor
+    """
+    from anomaly_detection.predictions.models import Predictor, MetricPredictionProgress
+
+    try:
+        predictor = Predictor.objects.get(id=predictor_id)
+    except Predictor.DoesNotExist:
+        return
+
+    _, newly_predicted = _update_metrics_for_predictor(predictor, from_date, to_date)
+    invalidate_metric_tiles(generate_date_range(from_date, to_date))
+
+    # Count the metrics predicted for the first time, in a single statement for every date
+    MetricPredictionProgress.increment({date: (0, 1) for date in newly_predicted})
+
+
+@shared_task
+def backfill_chunk_task(run_id, index):
+    """
+    Predicts the metrics of a chunk of predictors of a backfill run. Then, queues the next chunk,
+    or finishes the run if it was the last one.
+    """
+    from anomaly_detection.predictions.models import BackfillRun, Predictor
+
+    try:
+        run = BackfillRun.objects.defer('predictor_ids').get(id=run_id)
+    except BackfillRun.DoesNotExist:
+        return
+
+    predicted, failed_ids = 0, []
+    for predictor in Predictor.objects.filter(id__in=run.chunk(index)).iterator(chunk_size=100):
+        # A predictor that fails does not stop the rest of the chunk, and its metrics are left as they were.
+        try:
+            with transaction.atomic():
+                predicted += _update_metrics_for_predictor(
+                    predictor, run.from_date.isoformat(), run.to_date.isoformat()
+                )[0]
+        except Exception:
+            logger.exception("Predictor %d of the chunk %d of the backfill %s failed", predictor.id, index, run_id)
+            failed_ids.append(predictor.id)
+    invalidate_metric_tiles(generate_date_range(run.from_date.isoformat(), run.to_date.isoformat()))
+
+    if run.chunk_done(predicted, failed_ids=failed_ids):
+        run.finish()
+        logger.info("Backfill %s finished", run_id)
+    else:
+        run.queue_next_chunk()
+
+
+@shared_task
+def train_predictors_task(date_str, max_workers=None):
+    """
+    Creates and trains every Predictor needed to predict the metrics of the given date (YYYY-MM-DD).
+    """
+    from anomaly_detection.predictions.training import train_predictors
+
+    report = train_predictors(date=date.fromisoformat(date_str), max_workers=max_workers)
+    report['date'] = date_str
+    return report
+
+
+@shared_task
+def pretrain_predictors_task(date_str=None, max_workers=None):
+    """
+    Trains in advance the predictors needed for the next date to be uploaded (YYYY-MM-DD, by default
+    the day after the last date with metrics), from the history already stored. Scheduled with Celery
+    beat before the expected upload, so the upload only has to score its metrics.
+    """
+    from anomaly_detection.predictions.models import Metric
+    from anomaly_detection.predictions.training import train_predictors
+
+    if date_str is None:
+        last_date = Metric.objects.order_by('-date').values_list('date', flat=True).first()
+        date_obj = last_date + timedelta(days=1) if last_date else timezone.localdate()
+    else:
+        date_obj = date.fromisoformat(date_str)
+
+    report = train_predictors(date=date_obj, max_workers=max_workers)
+    report['date'] = date_obj.isoformat()
+    return report
+
+
+@shared_task
+def seed_tiles_task(date_str, min_zoom=None, max_zoom=None, regions=True, force=False):
+    """
+    Seeds the tile cache with the metric and region tiles of the given date (YYYY-MM-DD) (see `tile_seeding`).
+    Queued once the metrics of the date are predicted. The batches of tiles are rendered in parallel by the
+    workers of the queue, one `seed_tiles_batch_task` each.
+    """
+    from anomaly_detection.predictions.tile_cache import tile_store
+    from anomaly_detection.predictions.tile_seeding import seed_batches
+
+    if tile_store() is None:
+        logger.warning("The tile cache is disabled, there is nothing to seed")
+        return {'date': date_str, 'tiles': 0, 'batches': 0}
+
+    jobs = seed_batches(
+        date=date.fromisoformat(date_str), min_zoom=min_zoom, max_zoom=max_zoom, regions=regions, force=force
+    )
+    group(seed_tiles_batch_task.s(job) for job in jobs).apply_async()
+    logger.info("Queued %d batches of tiles of %s", len(jobs), date_str)
+    return {'date': date_str, 'tiles': sum(len(job[3]) for job in jobs), 'batches': len(jobs)}
+
+
+@shared_task
+def seed_tiles_batch_task(job):
+    """
+    Renders a batch of tiles and stores them in the tile cache (see `tile_seeding.seed_batch`).
+    """
+    from anomaly_detection.predictions.tile_seeding import seed_batch
+
+    kind, namespace, date_str, tiles, force = job
+    rendered, empty, skipped = seed_batch((kind, namespace, date_str, [tuple(tile) for tile in tiles], force))
+    return {'rendered': rendered, 'empty': empty, 'skipped': skipped}
+
+
+@shared_task
+def predict_date_task(date_str, uploaded_at=None, job_id=None, trained=False):
+    """
+    Predicts every metric of the given date (YYYY-MM-DD) in bulk: assigns the predictors to the metrics
+    and fills the prediction values from their forecasts. The metrics whose predictor is already trained
+    are predicted at once, and the training of the missing predictors (see `train_date_task`) is queued
+    apart, as it can take much longer. Once trained, the rest of the metrics are predicted again here.
+    If `uploaded_at` (a timestamp) is given, the time since the metrics were uploaded is reported.
+    If `job_id` is given, the ingest job of the upload is updated with the result.
+    """
+    from anomaly_detection.predictions.models import IngestJob, Metric, MetricPredictionProgress
+
+    start = time.monotonic()
+    date_obj = date.fromisoformat(date_str)
+
+    try:
+        Metric.assign_predictors(date=date_obj)
+        predicted = Metric.fill_from_forecasts(date=date_obj)
+        MetricPredictionProgress.refresh(date=date_obj)
+    except Exception as e:
+        if job_id is not None:
+            IngestJob.objects.get(id=job_id).fail(f"Prediction failed: {e}")
+        raise
+
+    if job_id is not None:
+        IngestJob.objects.filter(id=job_id).update(predicted=models.F('predicted') + predicted)
+
+    pending = Metric.objects.filter(date=date_obj, predicted_value__isnull=True).exists()
+    if pending and not trained:
+        train_date_task.delay(date_str, uploaded_at=uploaded_at, job_id=job_id)
+        logger.info("Predicted %d metrics of %s in %.1fs, training the missing predictors",
+                    predicted, date_str, time.monotonic() - start)
+        return {'date': date_str, 'predicted': predicted, 'pending': True}
+
+    report = {
+        'date': date_str,
+        'metrics': Metric.objects.filter(date=date_obj).count(),
+        'predicted': predicted,
+        'pending': False,
+        'elapsed': time.monotonic() - start,
+        'elapsed_since_upload': time.time() - uploaded_at if uploaded_at is not None else None,
+    }
+    logger.info(
+        "Predicted %d/%d metrics of %s in %.1fs%s",
+        report['predicted'], report['metrics'], date_str, report['elapsed'],
+        f", {report['elapsed_since_upload']:.1f}s since the upload" if uploaded_at is not None else ""
+    )
+    # The metrics left are not predicted by this upload (their history is not enough): seed the tiles now.
+    MetricPredictionProgress.seed_completed([date_obj])
+    if job_id is not None:
+        IngestJob.objects.filter(id=job_id).update(status=IngestJob.Status.DONE, finished_at=timezone.now())
+    return report
+
+
+@shared_task
+def train_date_task(date_str, uploaded_at=None, job_id=None):
+    """
+    Trains every Predictor needed to predict the metrics of the given date (YYYY-MM-DD), and then
+    queues the prediction of the metrics that were waiting for them.
+    """
+    from anomaly_detection.predictions.models import IngestJob
+    from anomaly_detection.predictions.training import train_predictors
+
+    try:
+        train_predictors(date=date.fromisoformat(date_str))
+    except Exception as e:
+        if job_id is not None:
+            IngestJob.objects.get(id=job_id).fail(f"Training failed: {e}")
+        raise
+
+    predict_date_task.delay(date_str, uploaded_at=uploaded_at, job_id=job_id, trained=True)
+
+
+@shared_task
+def ingest_metrics_task(job_id):
+    """
+    Inserts the metrics of an uploaded file (see `IngestJob`), and then predicts its date.
+    """
+    from anomaly_detection.predictions.models import IngestJob
+
+    try:
+        job = IngestJob.objects.get(id=job_id)
+    except IngestJob.DoesNotExist:
+        return
 
-        # Refresh the prediction progress for every date in the range
-        for date in generate_date_range(from_date, to_date):
-            MetricPredictionProgress.refresh(date=date)
+    if job.insert():
+        predict_date_task.delay(job.date.isoformat(), uploaded_at=job.created_at.timestamp(), job_id=job_id)
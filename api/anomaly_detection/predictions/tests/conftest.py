@@ -1,3 +1,5 @@
+from datetime import date
+
 from django.conf import settings
 from django.db import reset_queries, connection as db_connection
 import pytest
@@ -5,7 +7,7 @@ from django.contrib.gis.geos import MultiPolygon, Polygon
 
 from anomaly_detection.regions.models import (AutonomousCommunity, Country,
                                               Municipality, Province)
-from anomaly_detection.predictions.models import Metric, MetricExecution, MetricSeasonality
+from anomaly_detection.predictions.models import Metric, MetricPredictionProgress
 
 
 @pytest.fixture
@@ -17,6 +19,14 @@ def connection():
     return db_connection
 
 
+@pytest.fixture(autouse=True)
+def tile_cache_dir(settings, tmp_path):
+    """Fixture to keep the tile cache of every test in its own temporary directory."""
+    settings.TILE_CACHE_BACKEND = 'filesystem'
+    settings.TILE_CACHE_DIR = str(tmp_path / 'tiles')
+    return settings.TILE_CACHE_DIR
+
+
 @pytest.fixture
 def multipolygon():
     """Fixture to create a MultiPolygon instance."""
@@ -78,7 +88,6 @@ def metrics(municipality):
         predicted_value=0.85,
         lower_value=0.5,
         upper_value=1.0,
-        trend=0.1,
     )
     metric2 = Metric.objects.create(
         region=municipality1,
@@ -87,7 +96,6 @@ def metrics(municipality):
         predicted_value=0.75,
         lower_value=0.6,
         upper_value=0.8,
-        trend=0.2,
     )
     metric3 = Metric.objects.create(
         region=municipality1,
@@ -96,7 +104,6 @@ def metrics(municipality):
         predicted_value=0.75,
         lower_value=0.5,
         upper_value=0.9,
-        trend=0.3,
     )
     metric4 = Metric.objects.create(
         region=municipality2,
@@ -105,46 +112,16 @@ def metrics(municipality):
         predicted_value=0.85,
         lower_value=0.4,
         upper_value=0.9,
-        trend=0.1,
     )
     return metric1, metric2, metric3, metric4
 
 
 @pytest.fixture
-def seasonalities(municipality):
-    """Fixture to create a MetricSeasonality instance."""
-    municipality1, municipality2 = municipality
-    seasonality1 = MetricSeasonality.objects.create(
-        region=municipality1,
-        index=0,
-        yearly_value=0.5
-    )
-    seasonality2 = MetricSeasonality.objects.create(
-        region=municipality1,
-        index=1,
-        yearly_value=0.6
-    )
-    seasonality3 = MetricSeasonality.objects.create(
-        region=municipality2,
-        index=0,
-        yearly_value=0.65
-    )
-    return seasonality1, seasonality2, seasonality3
-
-
-@pytest.fixture
-def metric_executions():
-    """Fixture to create a MetricExecution instance."""
-    metric_execution1 = MetricExecution.objects.create(
-        date='2024-01-31',
-        success_percentage=0.99
-    )
-    metric_execution2 = MetricExecution.objects.create(
-        date='2024-01-30',
-        success_percentage=1
-    )
-    metric_execution3 = MetricExecution.objects.create(
-        date='2025-01-30',
-        success_percentage=0.93
+def progresses():
+    """Fixture to create the prediction progress of some dates."""
+    return tuple(
+        MetricPredictionProgress.objects.create(
+            date=day, total=100, predicted=int(percentage * 100), success_percentage=percentage
+        )
+        for day, percentage in [(date(2024, 1, 31), 0.99), (date(2024, 1, 30), 1), (date(2025, 1, 30), 0.93)]
     )
-    return metric_execution1, metric_execution2, metric_execution3
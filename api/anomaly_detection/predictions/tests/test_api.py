@@ -1,16 +1,19 @@
-
+import base64
+import json
 
 import pytest
 from django.urls import reverse
 from rest_framework import status
 
-from anomaly_detection.predictions.models import Metric, MetricSeasonality
-from anomaly_detection.predictions.serializers import MetricSeasonalitySerializer, MetricSerializer
+from anomaly_detection.predictions.models import Metric, Predictor
+from anomaly_detection.predictions.serializers import MetricSerializer
+from anomaly_detection.predictions.tile_cache import metric_tiles_namespace, tile_store
 
 
 METRICS_URL = reverse('metrics:metrics-list')
 METRICS_LAST_DATE_URL = reverse('metrics:metrics-last-date')
-METRICS_SEASONALITY_URL = reverse('metrics:metrics-seasonality')
+METRICS_EXPORT_URL = reverse('metrics:metrics-export')
+METRICS_SERIES_URL = reverse('metrics:metrics-series')
 
 
 def get_metric_detail_url(id):
@@ -18,6 +21,11 @@ def get_metric_detail_url(id):
     return reverse('metrics:metrics-detail', args=[id])
 
 
+def get_metric_seasonality_url(id):
+    """Create and return the metric seasonality URL."""
+    return reverse('metrics:metrics-seasonality', args=[id])
+
+
 def get_tiles_url(x, y, z):
     """Create and return the tiles URL."""
     return reverse('metrics:metrics-tiles', args=[z, x, y])
@@ -88,6 +96,142 @@ class TestMetricListView:
         _ = res.data[1]['region_code']
         assert len(_get_queries(connection)) == 1
 
+    def test_retrieve_metric_list_cursor(self, metrics, client):
+        """
+        Retrieve the list of Metric instances page by page with the cursor pagination.
+        """
+        res = client.get(METRICS_URL, {'pagination': 'cursor', 'page_size': 3, 'count': 'exact'})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res.data['count'] == 4
+        first_page = [(metric['date'], metric['region_code']) for metric in res.data['results']]
+        assert [date for date, _ in first_page] == ['2023-01-03', '2023-01-03', '2023-01-02']
+
+        res = client.get(res.data['next'])
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res.data['count'] is None
+        assert [metric['id'] for metric in res.data['results']] == [str(metrics[0].id)]
+        assert res.data['next'] is None
+
+    def test_retrieve_metric_list_cursor_estimate(self, metrics, client):
+        """
+        Retrieve the first page of Metric instances with the number of rows estimated by the query planner.
+        """
+        res = client.get(METRICS_URL, {'pagination': 'cursor', 'page_size': 3, 'count': 'estimate'})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert isinstance(res.data['count'], int)
+        assert res.data['count'] >= 0
+        assert len(res.data['results']) == 3
+
+    def test_retrieve_metric_list_cursor_history(self, metrics, client):
+        """
+        Retrieve the history of a region in ascending order with the cursor pagination.
+        """
+        params = {'pagination': 'cursor', 'page_size': 2, 'region_code': 'ESP.1.1.1.1_1', 'ordering': 'date'}
+        res = client.get(METRICS_URL, params)
+        next_res = client.get(res.data['next'])
+
+        assert [metric['date'] for metric in res.data['results']] == ['2023-01-01', '2023-01-02']
+        assert [metric['date'] for metric in next_res.data['results']] == ['2023-01-03']
+
+    def test_retrieve_metric_list_cursor_invalid(self, client):
+        """
+        Retrieve the list of Metric instances with an invalid cursor.
+        """
+        res = client.get(METRICS_URL, {'pagination': 'cursor', 'cursor': 'invalid'})
+
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize('position', [['not-a-date', 1], ['2023-01-01', 'not-an-id'], ['2023-01-01', None], [1]])
+    def test_retrieve_metric_list_cursor_invalid_position(self, client, position):
+        """
+        Retrieve the list of Metric instances with a cursor whose values are not valid for the keyset fields.
+        """
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+        res = client.get(METRICS_URL, {'pagination': 'cursor', 'cursor': cursor})
+
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMetricExportView:
+    """
+    Tests the Metric View for the Export action.
+    """
+
+    def test_export_metrics_csv(self, metrics, client):
+        """
+        Export the history of a region as CSV, sorted by date.
+        """
+        res = client.get(METRICS_EXPORT_URL, {'region_code': 'ESP.1.1.1.1_1'})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res['Content-Type'].startswith('text/csv')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        assert lines[0] == 'date,value,predicted_value,lower_value,upper_value,anomaly_degree'
+        assert [line.split(',')[0] for line in lines[1:]] == ['2023-01-01', '2023-01-02', '2023-01-03']
+
+    def test_export_metrics_ndjson(self, metrics, client):
+        """
+        Export the history of a region as newline delimited JSON, filtered by date.
+        """
+        res = client.get(
+            METRICS_EXPORT_URL, {'region_code': 'ESP.1.1.1.1_1', 'date_from': '2023-01-02', 'format': 'ndjson'}
+        )
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res['Content-Type'].startswith('application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+        assert [row['date'] for row in rows] == ['2023-01-02', '2023-01-03']
+        assert rows[0]['value'] == metrics[1].value
+
+    def test_export_metrics_bad_request(self, client):
+        """
+        Export the history without a region.
+        """
+        res = client.get(METRICS_EXPORT_URL)
+
+        assert res.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db(transaction=True)
+class TestMetricSeriesView:
+    """
+    Tests the Metric View for the Series action.
+    """
+
+    def test_retrieve_metric_series(self, metrics, client):
+        """
+        Retrieve the history of a region as parallel arrays, sorted by date.
+        """
+        res = client.get(METRICS_SERIES_URL, {'region_code': 'ESP.1.1.1.1_1', 'date_to': '2023-01-02'})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res.data['dates'] == ['2023-01-01', '2023-01-02']
+        assert res.data['values'] == [metrics[0].value, metrics[1].value]
+        assert res.data['upper_values'] == [metrics[0].upper_value, metrics[1].upper_value]
+
+    def test_retrieve_metric_series_week(self, metrics, client):
+        """
+        Retrieve the history of a region averaged by week, with the most extreme anomaly of every week.
+        """
+        res = client.get(METRICS_SERIES_URL, {'region_code': 'ESP.1.1.1.1_1', 'resolution': 'week'})
+
+        assert res.status_code == status.HTTP_200_OK
+        assert res.data['dates'] == ['2022-12-26', '2023-01-02']
+        assert res.data['values'] == pytest.approx([0.8, 0.65])
+        assert res.data['anomaly_degrees'] == pytest.approx([0.0, -0.25])
+
+    def test_retrieve_metric_series_bad_request(self, client):
+        """
+        Retrieve the history without a region, or with an invalid resolution.
+        """
+        assert client.get(METRICS_SERIES_URL).status_code == status.HTTP_400_BAD_REQUEST
+        res = client.get(METRICS_SERIES_URL, {'region_code': 'ESP.1.1.1.1_1', 'resolution': 'year'})
+        assert res.status_code == status.HTTP_400_BAD_REQUEST
+
 
 @pytest.mark.django_db(transaction=True)
 class TestMetricTilesView:
@@ -111,6 +255,46 @@ class TestMetricTilesView:
         assert res.status_code == status.HTTP_200_OK
         assert len(_get_queries(connection)) == 1
 
+    def test_retrieve_metric_tiles_cached(self, metrics, client, connection):
+        """
+        Retrieve the same tile twice, the second time from the tile cache, without querying the database.
+        """
+        url = get_tiles_url(0, 0, 1)
+        res = client.get(url, {'date': '2023-01-01'})
+        queries = len(_get_queries(connection))
+        cached_res = client.get(url, {'date': '2023-01-01'})
+
+        assert cached_res.status_code == status.HTTP_200_OK
+        assert cached_res.content == res.content
+        assert len(_get_queries(connection)) == queries
+
+    def test_retrieve_metric_tiles_invalidated(self, metrics, client):
+        """
+        Retrieve a tile again after the predictions of its date are rewritten.
+        """
+        url = get_tiles_url(0, 0, 1)
+        client.get(url, {'date': '2023-01-01'})
+        metrics[0].upper_value = 0.6
+        metrics[0].save()
+
+        namespace = metric_tiles_namespace('2023-01-01')
+        assert tile_store().get(namespace, tile_store().generation(namespace), 1, 0, 0) is None
+        assert client.get(url, {'date': '2023-01-01'}).status_code == status.HTTP_200_OK
+
+    def test_retrieve_metric_tiles_not_invalidated(self, metrics, client):
+        """
+        Retrieve a tile again after a metric of its date is saved without changing its rendered fields.
+        """
+        url = get_tiles_url(0, 0, 1)
+        client.get(url, {'date': '2023-01-01'})
+        metric = Metric.objects.get(id=metrics[0].id)
+        metric.save()
+        metric.upper_value = 0.6
+        metric.save(update_fields=['updated_at'])
+
+        namespace = metric_tiles_namespace('2023-01-01')
+        assert tile_store().get(namespace, tile_store().generation(namespace), 1, 0, 0) is not None
+
     def test_retrieve_metric_tiles_empty(self, metrics, client):
         """
         Retrieve the list of tiles of every municipality, but out of focus.
@@ -168,16 +352,16 @@ class TestMetricDetailView:
 
 @pytest.mark.django_db(transaction=True)
 class TestDateMetricView:
-    def test_retrieve_metric_date(self, metric_executions, client):
+    def test_retrieve_metric_date(self, progresses, client):
         """
-        Retrieve the last date available.
+        Retrieve the last date whose metrics are predicted.
         """
-        metric_execution1, _, _ = metric_executions
+        progress1, _, _ = progresses
 
         res = client.get(METRICS_LAST_DATE_URL)
 
         assert res.status_code == status.HTTP_200_OK
-        assert res.data['date'] == metric_execution1.date
+        assert res.data['date'] == progress1.date.isoformat()
 
     def test_retrieve_metric_date_not_found(self, client):
         """
@@ -190,32 +374,26 @@ class TestDateMetricView:
 
 @pytest.mark.django_db(transaction=True)
 class TestMetricSeasonalityView:
-    def test_retrieve_seasonality(self, seasonalities, client):
+    def test_retrieve_seasonality(self, metrics, client):
         """
-        Retrieve the seasonality for a specific region.
+        Retrieve the yearly seasonality of the predictor of a metric.
         """
-        region_code = seasonalities[0].region.code
-        res = client.get(METRICS_SEASONALITY_URL, {'region_code': region_code})
+        predictor = Predictor.objects.create(
+            region=metrics[0].region, last_training_date='2023-01-01T00:00:00Z', yearly_seasonality=[0.5, 0.6]
+        )
+        Metric.objects.filter(id=metrics[0].id).update(predictor=predictor)
+
+        res = client.get(get_metric_seasonality_url(metrics[0].id))
 
-        seasonality_from_db = MetricSeasonality.objects.filter(region__code=region_code)
-        serialized = MetricSeasonalitySerializer(seasonality_from_db, many=True)
         assert res.status_code == status.HTTP_200_OK
-        assert len(res.data) == 2
-        for res_i in res.data:
-            assert res_i in serialized.data
+        assert res.data == {'yearly': [0.5, 0.6]}
 
-    def test_retrieve_seasonality_bad_request(self, client):
+    def test_retrieve_seasonality_not_found(self, metrics, client):
         """
-        Test that checks that the query param 'region_code' is mandatory.
+        Test that checks the not found error of a metric without predictor.
         """
-        res = client.get(METRICS_SEASONALITY_URL)
+        Metric.objects.filter(id=metrics[0].id).update(predictor=None)
 
-        assert res.status_code == status.HTTP_400_BAD_REQUEST
-
-    def test_retrieve_seasonality_not_found(self, client):
-        """
-        Test that checks the not found error.
-        """
-        res = client.get(METRICS_SEASONALITY_URL, {'region_code': 'not_existing_id'})
+        res = client.get(get_metric_seasonality_url(metrics[0].id))
 
         assert res.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,104 @@
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomaly_detection.predictions.models import BackfillRun, Metric, Predictor
+from anomaly_detection.predictions.seasonal import fit_seasonal_many
+from anomaly_detection.predictions.tasks import backfill_chunk_task
+
+
+@pytest.fixture
+def backfill_run():
+    """Fixture to create a backfill run of 5 predictors in chunks of 2."""
+    return BackfillRun.objects.create(
+        from_date=date(2023, 1, 1), to_date=date(2023, 1, 10), predictor_ids=[1, 2, 3, 4, 5],
+        chunk_size=2, concurrency=2, total_chunks=3
+    )
+
+
+@pytest.mark.django_db
+class TestBackfillRun:
+    """
+    Test the fan-in coordination of the backfills.
+    """
+
+    def test_chunk(self, backfill_run):
+        """
+        Test that the chunks are sliced in order.
+        """
+        assert backfill_run.chunk(0) == [1, 2]
+        assert backfill_run.chunk(2) == [5]
+        assert backfill_run.chunk(3) == []
+
+    def test_chunk_done(self, backfill_run):
+        """
+        Test that only the last chunk finished is reported as the last one.
+        """
+        assert not backfill_run.chunk_done(predicted=20)
+        assert not backfill_run.chunk_done(predicted=0, failed_ids=[3, 4])
+        assert backfill_run.chunk_done(predicted=10)
+
+        backfill_run.refresh_from_db()
+        assert (backfill_run.done_chunks, backfill_run.failed_chunks, backfill_run.predicted) == (3, 1, 30)
+        assert backfill_run.failed_predictor_ids == [3, 4]
+        assert backfill_run.percentage == 1.
+
+    def test_start_without_predictors(self):
+        """
+        Test that a backfill without predictors is finished at once.
+        """
+        run = BackfillRun.start(from_date=date(2023, 1, 1), to_date=date(2023, 1, 2), chunk_size=10, concurrency=1)
+
+        assert run.status == BackfillRun.Status.DONE
+        assert run.total_chunks == 0
+
+
+@pytest.fixture
+def seasonal_parameters():
+    """Fixture to fit the parameters of a seasonal baseline."""
+    t = np.arange(800)
+    df = pd.DataFrame({'ds': [date(2020, 1, 1) + timedelta(days=int(i)) for i in t], 'y': 0.3 + 0.2 * np.sin(t / 58)})
+    return fit_seasonal_many({1: df}, min_days=730)[1]['parameters']
+
+
+@pytest.mark.django_db
+class TestBackfillChunkTask:
+    """
+    Test the prediction of a chunk of a backfill.
+    """
+
+    def test_backfill_chunk(self, municipality, seasonal_parameters):
+        """
+        Test that the chunk predicts the metrics of its predictors, and a predictor that fails is recorded
+        without stopping the rest of the chunk.
+        """
+        trained_at = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        predictor = Predictor.objects.create(
+            region=municipality[0], last_training_date=trained_at, engine=Predictor.Engine.SEASONAL,
+            parameters=seasonal_parameters
+        )
+        broken_predictor = Predictor.objects.create(
+            region=municipality[1], last_training_date=trained_at, engine=Predictor.Engine.SEASONAL,
+            parameters={'engine': 'seasonal'}
+        )
+        Metric.objects.bulk_create([
+            Metric(region=p.region, predictor=p, date=date(2023, 1, day), value=0.5)
+            for p in (predictor, broken_predictor) for day in (1, 2)
+        ])
+        run = BackfillRun.objects.create(
+            from_date=date(2023, 1, 1), to_date=date(2023, 1, 2), predictor_ids=[broken_predictor.id, predictor.id],
+            chunk_size=2, concurrency=1, total_chunks=1, queued_chunks=1
+        )
+
+        backfill_chunk_task(str(run.id), 0)
+
+        run.refresh_from_db()
+        assert run.status == BackfillRun.Status.DONE
+        assert (run.done_chunks, run.failed_chunks, run.predicted) == (1, 1, 2)
+        assert run.failed_predictor_ids == [broken_predictor.id]
+        assert Metric.objects.filter(predictor=predictor, predicted_value__isnull=False).count() == 2
+        assert Metric.objects.filter(predictor=broken_predictor, predicted_value__isnull=True).count() == 2
+        predictor.refresh_from_db()
+        assert predictor.scored_count == 2
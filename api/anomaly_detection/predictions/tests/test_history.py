@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from anomaly_detection.predictions.history import load_histories, load_history
+from anomaly_detection.predictions.models import Metric
+
+
+@pytest.fixture
+def history_metrics(municipality):
+    """Fixture to create 10 days of metrics for two regions, without triggering the predictions."""
+    municipality1, municipality2 = municipality
+    start = date(2023, 1, 1)
+    Metric.objects.bulk_create(
+        [Metric(region=municipality1, date=start + timedelta(days=i), value=i / 10) for i in range(10)]
+        + [Metric(region=municipality2, date=start + timedelta(days=i), value=None if i == 5 else 1.) for i in range(10)]
+    )
+    return municipality1, municipality2
+
+
+@pytest.mark.django_db
+class TestLoadHistories:
+    """
+    Test the columnar loader of the training history.
+    """
+
+    def test_load_histories(self, history_metrics):
+        """
+        Test that every region gets its metrics before its cutoff, sorted by date.
+        """
+        municipality1, municipality2 = history_metrics
+
+        histories = load_histories({municipality1.id: date(2023, 1, 6), municipality2.id: date(2023, 1, 9)})
+
+        assert len(histories[municipality1.id].dates) == 5
+        assert len(histories[municipality2.id].dates) == 8
+        assert histories[municipality1.id].dates[0] == np.datetime64('2023-01-01')
+        np.testing.assert_allclose(histories[municipality1.id].values, [0., 0.1, 0.2, 0.3, 0.4])
+        assert np.isnan(histories[municipality2.id].values[5])
+
+    def test_load_history_to_frame(self, history_metrics):
+        """
+        Test the DataFrame of a single region, as Prophet expects it.
+        """
+        municipality1, _ = history_metrics
+
+        df = load_history(municipality1.id, date(2023, 1, 11)).to_frame()
+
+        assert list(df.columns) == ['ds', 'y']
+        assert len(df) == 10
+        assert df['ds'].is_monotonic_increasing
+
+    def test_load_history_empty(self, history_metrics):
+        """
+        Test that a region without metrics before the cutoff gets an empty history.
+        """
+        municipality1, _ = history_metrics
+
+        assert load_history(municipality1.id, date(2022, 1, 1)).to_frame().empty
+
+    def test_load_histories_window(self, history_metrics):
+        """
+        Test that only the metrics of the last days before the cutoff are loaded with a window.
+        """
+        municipality1, _ = history_metrics
+
+        history = load_history(municipality1.id, date(2023, 1, 11), window_days=3)
+
+        assert list(history.dates) == [np.datetime64('2023-01-08'), np.datetime64('2023-01-09'),
+                                       np.datetime64('2023-01-10')]
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from prophet import Prophet
+from prophet.serialize import model_to_json
+
+from anomaly_detection.predictions.inference import VectorizedPredictor, extract_parameters, parameters_from_json
+
+
+def _fit(days, seed, start=date(2020, 1, 1)):
+    """
+    Fit a Prophet model, as the Predictor does, with a synthetic history.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    y = np.clip(0.3 + 0.2 * np.sin(2 * np.pi * t / 365.25) + 1e-4 * t + rng.normal(0, 0.02, days), 0, 1)
+    df = pd.DataFrame({'ds': pd.date_range(start=start, periods=days), 'y': y, 'cap': 1, 'floor': 0})
+    model = Prophet(growth='logistic', yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
+    return model.fit(df)
+
+
+def _prophet_predict(model, dates):
+    """
+    Predict the dates with the Prophet model itself.
+    """
+    df = pd.DataFrame({'ds': pd.to_datetime(dates)})
+    df['cap'] = 1
+    df['floor'] = 0
+    return model.predict(df)
+
+
+@pytest.fixture(scope='module')
+def models():
+    """Fixture to fit two Prophet models with different histories."""
+    return {1: _fit(800, seed=0), 2: _fit(900, seed=1)}
+
+
+def _dates(model, days_before, days_after):
+    end = (model.start + model.t_scale).date()
+    return [end + timedelta(days=i) for i in range(-days_before, days_after + 1)]
+
+
+class TestVectorizedPredictor:
+    """
+    Test the closed-form prediction against Prophet.predict().
+    """
+
+    def test_predict_same_values_as_prophet(self, models):
+        """
+        Test that yhat is the same and the bands are within the uncertainty sampling error.
+        """
+        predictor = VectorizedPredictor({key: extract_parameters(model, horizon_days=31) for key, model in models.items()})
+
+        for key, model in models.items():
+            dates = _dates(model, days_before=200, days_after=31)
+            expected = _prophet_predict(model, dates)
+            yhat, yhat_lower, yhat_upper = predictor.predict([key] * len(dates), dates)
+
+            np.testing.assert_allclose(yhat, expected['yhat'], atol=1e-9)
+            width = (expected['yhat_upper'] - expected['yhat_lower']).mean()
+            assert np.abs(yhat_lower - expected['yhat_lower']).mean() < 0.1 * width
+            assert np.abs(yhat_upper - expected['yhat_upper']).mean() < 0.1 * width
+
+    def test_predict_many_pairs(self, models):
+        """
+        Test that pairs of different predictors are predicted in a single call.
+        """
+        predictor = VectorizedPredictor({key: extract_parameters(model, horizon_days=31) for key, model in models.items()})
+        dates = _dates(models[1], days_before=10, days_after=10)
+        keys = [1, 2] * len(dates)
+        pairs = [d for d in dates for _ in range(2)]
+
+        yhat, _, _ = predictor.predict(keys, pairs)
+
+        np.testing.assert_allclose(yhat[0::2], predictor.predict([1] * len(dates), dates)[0])
+        np.testing.assert_allclose(yhat[1::2], predictor.predict([2] * len(dates), dates)[0])
+
+    def test_parameters_from_json(self, models):
+        """
+        Test that the parameters of a serialized model give the same yhat.
+        """
+        model = models[1]
+        predictor = VectorizedPredictor({1: parameters_from_json(model_to_json(model))})
+        dates = _dates(model, days_before=100, days_after=0)
+
+        yhat, _, _ = predictor.predict([1] * len(dates), dates)
+
+        np.testing.assert_allclose(yhat, _prophet_predict(model, dates)['yhat'], atol=1e-9)
@@ -0,0 +1,130 @@
+from datetime import date
+
+import pytest
+from django.db import DataError
+
+from anomaly_detection.predictions.models import IngestJob, Metric, MetricPredictionProgress
+
+
+@pytest.fixture
+def ingest_job(municipality):
+    """Fixture to create an ingest job with a row of each municipality and a row of an unknown region."""
+    municipality1, municipality2 = municipality
+    content = f"code,est\n{municipality1.code},0.5\n{municipality2.code},\nUNKNOWN,0.1\n"
+    return IngestJob.objects.create(date=date(2023, 1, 1), filename='bites_2023-01-01.csv', content=content.encode())
+
+
+@pytest.mark.django_db
+class TestIngestJob:
+    """
+    Test the asynchronous ingestion of an uploaded file.
+    """
+
+    def test_insert(self, ingest_job):
+        """
+        Test that the metrics are inserted and the rows of unknown regions are counted as failed.
+        """
+        assert ingest_job.insert()
+
+        ingest_job.refresh_from_db()
+        assert ingest_job.status == IngestJob.Status.PREDICTING
+        assert (ingest_job.parsed, ingest_job.inserted, ingest_job.failed) == (3, 2, 1)
+        assert ingest_job.content is None
+        assert Metric.objects.filter(date=date(2023, 1, 1)).count() == 2
+        assert Metric.objects.filter(date=date(2023, 1, 1), value__isnull=True).count() == 1
+
+    def test_insert_existing_metrics(self, ingest_job, municipality):
+        """
+        Test that the job fails if the metrics of the date already exist.
+        """
+        Metric.objects.bulk_create([Metric(region=municipality[0], date=date(2023, 1, 1), value=1.)])
+
+        assert not ingest_job.insert()
+
+        ingest_job.refresh_from_db()
+        assert ingest_job.status == IngestJob.Status.FAILED
+        assert ingest_job.inserted == 0
+        assert 'already exist' in ingest_job.error
+
+    def test_insert_invalid_file(self, municipality):
+        """
+        Test that the job fails if the file misses a required column.
+        """
+        job = IngestJob.objects.create(date=date(2023, 1, 1), filename='bites_2023-01-01.csv', content=b"code\nX\n")
+
+        assert not job.insert()
+        assert job.status == IngestJob.Status.FAILED
+        assert 'Missing required columns: est' in job.error
+
+    def test_insert_database_error(self, ingest_job, monkeypatch):
+        """
+        Test that the job fails, instead of staying in the inserting status, on any other database error.
+        """
+        def copy_metrics(metrics):
+            raise DataError('value out of range')
+
+        monkeypatch.setattr('anomaly_detection.predictions.ingestion.copy_metrics', copy_metrics)
+
+        assert not ingest_job.insert()
+
+        ingest_job.refresh_from_db()
+        assert ingest_job.status == IngestJob.Status.FAILED
+        assert 'value out of range' in ingest_job.error
+        assert Metric.objects.filter(date=date(2023, 1, 1)).count() == 0
+
+    def test_upsert(self, ingest_job, municipality):
+        """
+        Test that the existing metrics are updated only if their value changed, keeping their predictions.
+        """
+        municipality1, municipality2 = municipality
+        Metric.objects.bulk_create([
+            Metric(region=municipality1, date=date(2023, 1, 1), value=0.2, predicted_value=0.3),
+        ])
+        ingest_job.mode = IngestJob.Mode.UPSERT
+
+        assert ingest_job.insert()
+        assert (ingest_job.inserted, ingest_job.updated) == (1, 1)
+        metric = Metric.objects.get(region=municipality1, date=date(2023, 1, 1))
+        assert (metric.value, metric.predicted_value) == (0.5, 0.3)
+
+        # Uploading the same file again changes nothing
+        job = IngestJob.objects.create(
+            date=date(2023, 1, 1), filename='bites_2023-01-01.csv', mode=IngestJob.Mode.UPSERT,
+            content=f"code,est\n{municipality1.code},0.5\n{municipality2.code},\n".encode()
+        )
+        assert job.insert()
+        assert (job.inserted, job.updated) == (0, 0)
+
+
+@pytest.mark.django_db
+class TestMetricPredictionProgress:
+    """
+    Test the counters of the prediction progress.
+    """
+
+    def test_increment(self):
+        """
+        Test that the counters are added and the success percentage is updated.
+        """
+        MetricPredictionProgress.increment({date(2023, 1, 1): (4, 0), date(2023, 1, 2): (2, 2)})
+        MetricPredictionProgress.increment({date(2023, 1, 1): (0, 3)})
+
+        progress = MetricPredictionProgress.objects.get(date=date(2023, 1, 1))
+        assert (progress.total, progress.predicted, progress.success_percentage) == (4, 3, 0.75)
+        assert MetricPredictionProgress.last_complete().date == date(2023, 1, 2)
+
+    def test_refresh(self, municipality):
+        """
+        Test that the counters are recomputed from the metrics.
+        """
+        municipality1, municipality2 = municipality
+        Metric.objects.bulk_create([
+            Metric(region=municipality1, date=date(2023, 1, 1), value=0.2, predicted_value=0.3),
+            Metric(region=municipality2, date=date(2023, 1, 1), value=0.2),
+        ])
+        MetricPredictionProgress.increment({date(2023, 1, 1): (10, 0)})
+
+        MetricPredictionProgress.refresh(date=date(2023, 1, 1))
+
+        progress = MetricPredictionProgress.objects.get(date=date(2023, 1, 1))
+        assert (progress.total, progress.predicted, progress.success_percentage) == (2, 1, 0.5)
@@ -0,0 +1,229 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from anomaly_detection.predictions import retraining
+from anomaly_detection.predictions.models import Forecast, Metric, Predictor
+
+
+@pytest.fixture
+def predictors(municipality):
+    """Fixture to create an untrained predictor for each municipality."""
+    return [
+        Predictor.objects.create(region=region, last_training_date=datetime(2023, 1, 1, tzinfo=timezone.utc))
+        for region in municipality
+    ]
+
+
+@pytest.mark.django_db
+class TestPredictorTrainingLease:
+    """
+    Test the single-flight training of the predictors.
+    """
+
+    def test_claim_training(self, predictors):
+        """
+        Test that a predictor can only be claimed by a worker until it is released.
+        """
+        ids = [predictor.id for predictor in predictors]
+
+        assert sorted(Predictor.objects.claim_training(ids)) == sorted(ids)
+        assert Predictor.objects.claim_training(ids) == []
+        assert Predictor.objects.in_training(ids).count() == 2
+
+        Predictor.objects.release_training(ids[:1])
+        assert Predictor.objects.claim_training(ids) == ids[:1]
+
+    def test_claim_expired_lease(self, predictors, settings):
+        """
+        Test that the lease of a worker that did not release it expires.
+        """
+        predictor = predictors[0]
+        expired = datetime.now(timezone.utc) - timedelta(seconds=settings.PREDICTOR_TRAINING_LEASE_SECONDS + 1)
+        Predictor.objects.filter(id=predictor.id).update(training_started_at=expired)
+
+        assert Predictor.objects.claim_training([predictor.id]) == [predictor.id]
+
+    def test_claim_trained(self, predictors):
+        """
+        Test that the trained predictors are only claimed if forced.
+        """
+        predictor = predictors[0]
+        Predictor.objects.filter(id=predictor.id).update(parameters={'engine': 'seasonal'})
+
+        assert Predictor.objects.claim_training([predictor.id]) == []
+        assert Predictor.objects.claim_training([predictor.id], force=True) == [predictor.id]
+
+    def test_renew_training(self, predictors, settings):
+        """
+        Test that a renewed lease does not expire, and only the claimed predictors are renewed.
+        """
+        claimed, unclaimed = predictors
+        expiring = datetime.now(timezone.utc) - timedelta(seconds=settings.PREDICTOR_TRAINING_LEASE_SECONDS - 1)
+        Predictor.objects.filter(id=claimed.id).update(training_started_at=expiring)
+
+        Predictor.objects.renew_training([claimed.id, unclaimed.id])
+
+        claimed.refresh_from_db()
+        unclaimed.refresh_from_db()
+        assert claimed.training_started_at > expiring
+        assert unclaimed.training_started_at is None
+
+    def test_wait_training(self, predictors, settings):
+        """
+        Test that waiting returns whether any of the predictors was being trained.
+        """
+        ids = [predictor.id for predictor in predictors]
+        assert not Predictor.objects.wait_training(ids)
+
+        settings.PREDICTOR_TRAINING_LEASE_SECONDS = 1
+        Predictor.objects.claim_training(ids[:1])
+        assert Predictor.objects.wait_training(ids, poll_interval=0.1)
+
+
+@pytest.mark.django_db
+class TestPredictorSchedule:
+    """
+    Test the staggered retraining schedule of the predictors.
+    """
+
+    @pytest.fixture(autouse=True)
+    def schedule_policy(self, settings):
+        settings.PREDICTOR_RETRAINING_POLICY = retraining.SCHEDULE
+
+    def test_scheduled_training_date(self):
+        """
+        Test that the slots of every region start on a different day, every EXPIRY_DAYS.
+        """
+        day = datetime(2023, 3, 15, tzinfo=timezone.utc)
+
+        scheduled = {Predictor.scheduled_training_date(region_id, day) for region_id in range(Predictor.EXPIRY_DAYS)}
+
+        assert len(scheduled) == Predictor.EXPIRY_DAYS
+        assert all(day - timedelta(days=Predictor.EXPIRY_DAYS) < date <= day for date in scheduled)
+        for region_id in range(3):
+            slot_start = Predictor.scheduled_training_date(region_id, day)
+            assert Predictor.scheduled_training_date(region_id, slot_start + timedelta(days=1)) == slot_start
+            next_slot = slot_start + timedelta(days=Predictor.EXPIRY_DAYS)
+            assert Predictor.scheduled_training_date(region_id, next_slot) == next_slot
+
+    def test_not_expired(self, predictors):
+        """
+        Test that a predictor expires at the end of the retraining slot of its region.
+        """
+        predictor = predictors[0]
+        slot_start = Predictor.scheduled_training_date(predictor.region_id, predictor.last_training_date)
+        Predictor.objects.filter(id=predictor.id).update(last_training_date=slot_start)
+
+        last_day = slot_start + timedelta(days=Predictor.EXPIRY_DAYS - 1)
+        assert Predictor.objects.not_expired(last_day).filter(id=predictor.id).exists()
+        assert not Predictor.objects.not_expired(last_day + timedelta(days=1)).filter(id=predictor.id).exists()
+
+    def test_not_expired_trainable(self, predictors):
+        """
+        Test that a predictor trained with a short history expires at the first date with enough history.
+        """
+        predictor = predictors[0]
+        slot_start = Predictor.scheduled_training_date(predictor.region_id, predictor.last_training_date)
+        trainable_from = slot_start + timedelta(days=2)
+        Predictor.objects.filter(id=predictor.id).update(
+            last_training_date=slot_start, trainable_from=trainable_from.date()
+        )
+
+        assert Predictor.objects.not_expired(trainable_from - timedelta(days=1)).filter(id=predictor.id).exists()
+        assert not Predictor.objects.not_expired(trainable_from).filter(id=predictor.id).exists()
+
+
+@pytest.mark.django_db
+class TestPredictorDrift:
+    """
+    Test the drift-triggered retraining of the predictors.
+    """
+
+    @pytest.fixture(autouse=True)
+    def drift_policy(self, settings):
+        settings.PREDICTOR_RETRAINING_POLICY = retraining.DRIFT
+        settings.PREDICTOR_MAX_AGE_DAYS = 90
+        settings.PREDICTOR_DRIFT_MIN_SCORED = 2
+        settings.PREDICTOR_DRIFT_MAX_ERROR = 0.1
+        settings.PREDICTOR_DRIFT_MAX_OUTSIDE_RATE = 0.5
+
+    def test_scheduled_training_date(self):
+        """
+        Test that a new predictor is trained at the date it is needed for.
+        """
+        day = datetime(2023, 3, 15, tzinfo=timezone.utc)
+
+        assert Predictor.scheduled_training_date(7, day) == day
+        assert Predictor.horizon_days() == 91
+
+    def test_not_expired_max_age(self, predictors):
+        """
+        Test that a predictor that does not drift expires at the age limit of its region.
+        """
+        predictor = predictors[0]
+        last_day = predictor.last_training_date + timedelta(
+            days=retraining.age_limit_days(predictor.region_id, Predictor.EXPIRY_DAYS)
+        )
+
+        assert last_day - predictor.last_training_date > timedelta(days=Predictor.EXPIRY_DAYS)
+        assert Predictor.objects.not_expired(last_day).filter(id=predictor.id).exists()
+        assert not Predictor.objects.not_expired(last_day + timedelta(days=1)).filter(id=predictor.id).exists()
+
+    def test_not_expired_stale(self, predictors):
+        """
+        Test that a stale predictor expires from the date it is stale.
+        """
+        predictor = predictors[0]
+        stale_at = predictor.last_training_date + timedelta(days=5)
+        Predictor.objects.filter(id=predictor.id).update(stale_at=stale_at.date())
+
+        assert Predictor.objects.not_expired(stale_at - timedelta(days=1)).filter(id=predictor.id).exists()
+        assert not Predictor.objects.not_expired(stale_at).filter(id=predictor.id).exists()
+
+    @pytest.mark.parametrize('value, stale', [(0.52, False), (0.9, True)])
+    def test_fill_from_forecasts_residuals(self, predictors, value, stale):
+        """
+        Test that the residuals of the scored metrics are added once to their predictor, which is stale
+        from the next day if they drift.
+        """
+        predictor = predictors[0]
+        day = predictor.last_training_date.date()
+        for i in range(2):
+            date = day + timedelta(days=i)
+            Forecast.objects.create(predictor=predictor, date=date, yhat=0.5, yhat_lower=0.4, yhat_upper=0.6)
+            Metric.objects.bulk_create([Metric(region=predictor.region, predictor=predictor, date=date, value=value)])
+            assert Metric.fill_from_forecasts(date) == 1
+        assert Metric.fill_from_forecasts(day) == 0
+
+        predictor.refresh_from_db()
+        assert predictor.scored_count == 2
+        assert predictor.mean_abs_error == pytest.approx(abs(value - 0.5))
+        assert predictor.outside_rate == (1.0 if stale else 0.0)
+        assert predictor.stale_at == (day + timedelta(days=2) if stale else None)
+
+    @pytest.mark.parametrize('value, stale', [(0.52, False), (0.9, True)])
+    def test_add_residuals(self, predictors, value, stale):
+        """
+        Test that the residuals of the metrics scored outside the forecasts are added to their predictor,
+        which is stale from the day after the last metric if they drift.
+        """
+        predictor = predictors[0]
+        day = predictor.last_training_date.date()
+        metrics = [
+            Metric(
+                region=predictor.region, predictor=predictor, date=day + timedelta(days=i), value=value,
+                predicted_value=0.5, lower_value=0.4, upper_value=0.6
+            )
+            for i in range(2)
+        ]
+        metrics.append(Metric(region=predictor.region, predictor=predictor, date=day + timedelta(days=5)))
+
+        assert Predictor.objects.add_residuals(metrics) == 1
+        assert Predictor.objects.add_residuals([]) == 0
+
+        predictor.refresh_from_db()
+        assert predictor.scored_count == 2
+        assert predictor.mean_abs_error == pytest.approx(abs(value - 0.5))
+        assert predictor.outside_rate == (1.0 if stale else 0.0)
+        assert predictor.stale_at == (day + timedelta(days=2) if stale else None)
@@ -1,7 +1,9 @@
+from datetime import date, datetime, timedelta, timezone
+
 import pytest
 
 from anomaly_detection.regions.models import Municipality
-from anomaly_detection.predictions.models import Metric, MetricExecution, MetricSeasonality
+from anomaly_detection.predictions.models import Metric, MetricPredictionProgress, Predictor
 
 
 @pytest.mark.django_db
@@ -95,109 +97,118 @@ class TestMetricModel:
 
 
 @pytest.mark.django_db
-class TestMetricSeasonalityModel:
+class TestMetricPredictionProgress:
     """
-    Test the MetricSeasonality model.
+    Test the MetricPredictionProgress model.
     """
 
-    def test_metric_seasonality_creation(self, seasonalities, municipality):
+    def test_metric_prediction_progress_str(self, progresses):
         """
-        Test the creation of a MetricSeasonality instance.
+        Test the string representation of a MetricPredictionProgress instance.
         """
-        municipality1, _ = municipality
-        seasonality1, seasonality2, _ = seasonalities
-        assert isinstance(seasonality1, MetricSeasonality)
-        assert seasonality1.region.code == 'ESP.1.1.1.1_1'
-        assert seasonality2.yearly_value == 0.6
-        assert seasonality1.region == municipality1
+        progress1, _, _ = progresses
+        assert str(progress1) == (
+            f"Metric Execution of the day {progress1.date} with result: {progress1.success_percentage}"
+        )
 
-    def test_metric_seasonality_str(self, seasonalities):
+    def test_last_complete(self, progresses):
         """
-        Test the string representation of a MetricSeasonality instance.
+        Test that the last complete date is the last one whose metrics are predicted.
         """
-        seasonality1, _, _ = seasonalities
-        assert str(
-            seasonality1) == (
-                f"Bites Index Metric Seasonality for {seasonality1.region.name} on day {seasonality1.index + 1}: "
-                f"{seasonality1.yearly_value}"
+        progress1, _, _ = progresses
+        assert MetricPredictionProgress.last_complete() == progress1
+
+
+@pytest.mark.django_db
+class TestPredictorUntrainable:
+    """
+    Test the negative cache of the predictors whose history is not enough to train them.
+    """
+
+    @pytest.fixture
+    def predictor(self, municipality):
+        """Fixture to create an untrained predictor with 10 days of history."""
+        start = date(2023, 1, 1)
+        Metric.objects.bulk_create(
+            [Metric(region=municipality[0], date=start + timedelta(days=i), value=i / 10) for i in range(10)]
+        )
+        return Predictor.objects.create(
+            region=municipality[0],
+            last_training_date=datetime(2023, 1, 11, tzinfo=timezone.utc),
+            engine=Predictor.Engine.SEASONAL,
         )
 
-    def test_metric_seasonality_meta(self):
+    def test_train_short_history(self, predictor):
         """
-        Test the Meta class of the MetricSeasonality model.
+        Test that a short history is recorded with the first date in which it would be enough.
         """
-        assert MetricSeasonality._meta.verbose_name == 'Seasonality for metric'
-        assert MetricSeasonality._meta.verbose_name_plural == 'Seasonalities for metric'
-        assert MetricSeasonality._meta.ordering == ['region', 'index']
-        assert MetricSeasonality._meta.indexes[0].fields == ['index']
-        assert MetricSeasonality._meta.unique_together is not None
+        predictor.train()
+        predictor.refresh_from_db()
 
-    def test_metric_seasonality_region(self, seasonalities, multipolygon):
-        """
-        Test the region field of the MetricSeasonality model.
-        """
-        seasonality1, _, _ = seasonalities
-        assert seasonality1.region is not None
-        assert isinstance(seasonality1.region, Municipality)
-        assert seasonality1.region.code == 'ESP.1.1.1.1_1'
-        assert seasonality1.region.name == 'Test Municipality'
-        assert seasonality1.region.geometry == multipolygon
+        assert not predictor.is_trained
+        assert predictor.untrainable == Predictor.Untrainable.SHORT_HISTORY
+        # The first value is 0, so 9 of the 10 values are counted.
+        assert predictor.trainable_from == date(2023, 1, 11) + timedelta(days=Predictor.MIN_DAYS_FOR_TRAINING - 9)
 
-    def test_metric_seasonality_region_geometry_deferred_by_default(self, seasonalities, connection):
+    def test_predict_untrainable(self, predictor, connection):
         """
-        Test that the geometry field is deferred by default.
+        Test that an untrainable predictor does not load the history again, unless forced.
         """
-        # Get the first MetricSeasonality instance
-        seasonality1 = MetricSeasonality.objects.first()
+        predictor.train()
+        queries = len(connection.queries)
 
-        # Accessing region should NOT trigger additional query
-        _ = seasonality1.region
-        queries_after_region = len(connection.queries)
+        assert predictor.predict(dates=[datetime(2023, 1, 12, tzinfo=timezone.utc)]) is None
+        assert len(connection.queries) == queries
+        assert Predictor.objects.claim_training([predictor.id]) == []
+        assert Predictor.objects.claim_training([predictor.id], force=True) == [predictor.id]
 
-        # Accessing geometry SHOULD trigger additional query (deferred)
-        _ = seasonality1.region.geometry
-        queries_after_geometry = len(connection.queries)
 
-        assert queries_after_region == 1
-        assert queries_after_geometry == 2
+@pytest.mark.django_db
+class TestMetricPredictionProgressSeeding:
+    """
+    Test the seeding of the tiles of the dates whose metrics are predicted.
+    """
 
-    def test_metric_seasonality_region_with_geometry(self, seasonalities, connection):
+    def test_seed_completed(self, django_capture_on_commit_callbacks):
         """
-        Test that the region field with geometry is not deferred.
+        Test that the seeding is queued once, when no metric of the date is pending.
         """
-        # Get the first MetricSeasonality instance
-        seasonality1 = MetricSeasonality.objects.with_geometry().first()
+        MetricPredictionProgress.increment({date(2023, 1, 1): (100, 90), date(2023, 1, 2): (100, 50)})
+        assert MetricPredictionProgress.seed_completed([date(2023, 1, 2)]) == []
 
-        # Accessing region with geometry should NOT trigger additional query
-        _ = seasonality1.region.geometry
-        queries_after_geometry = len(connection.queries)
+        with django_capture_on_commit_callbacks() as callbacks:
+            MetricPredictionProgress.increment({date(2023, 1, 1): (0, 6)})
+        assert not callbacks
 
-        assert queries_after_geometry == 1
+        with django_capture_on_commit_callbacks() as callbacks:
+            MetricPredictionProgress.increment({date(2023, 1, 1): (0, 4)})
+        assert len(callbacks) == 1
+        assert MetricPredictionProgress.objects.get(date=date(2023, 1, 1)).tiles_seeded_at is not None
+        assert MetricPredictionProgress.seed_completed([date(2023, 1, 1)]) == []
 
+    def test_seed_completed_pending(self):
+        """
+        Test that a complete date with pending metrics is seeded when its prediction ends.
+        """
+        MetricPredictionProgress.increment({date(2023, 1, 1): (100, 96)})
 
-@pytest.mark.django_db
-class TestMetricExecution:
-    """
-    Test the MetricExecution model.
-    """
+        assert MetricPredictionProgress.objects.get(date=date(2023, 1, 1)).tiles_seeded_at is None
+        assert MetricPredictionProgress.seed_completed([date(2023, 1, 1)]) == [date(2023, 1, 1)]
 
-    def test_metric_execution_creation(self, metric_executions):
+    def test_increment_incomplete(self, django_assert_num_queries):
         """
-        Test the creation of a MetricExecution instance.
+        Test that the counters of the dates not predicted yet are updated without claiming their seeding.
         """
-        metric_execution1, metric_execution2, _ = metric_executions
-        assert isinstance(metric_execution1, MetricExecution)
-        assert metric_execution1.date == '2024-01-31'
-        assert metric_execution1.success_percentage == 0.99
-        assert metric_execution2.date == '2024-01-30'
+        with django_assert_num_queries(1):
+            MetricPredictionProgress.increment({date(2023, 1, 1): (100, 50)})
+        with django_assert_num_queries(1):
+            MetricPredictionProgress.refresh_many([date(2023, 1, 1)])
 
-    def test_metric_execution_str(self, metric_executions):
+    def test_seed_completed_disabled(self, settings):
         """
-        Test the string representation of a MetricExecution instance.
+        Test that the seeding is not queued if it is disabled.
         """
-        metric_execution1, _, _ = metric_executions
-        assert str(
-            metric_execution1) == (
-                f"Metric Execution of the day {metric_execution1.date} with result: "
-                f"{metric_execution1.success_percentage}"
-        )
+        settings.TILE_SEED_ON_COMPLETE = False
+        MetricPredictionProgress.objects.create(date=date(2023, 1, 1), total=100, predicted=100, success_percentage=1)
+
+        assert MetricPredictionProgress.seed_completed([date(2023, 1, 1)]) == []
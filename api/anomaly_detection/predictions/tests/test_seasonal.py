@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from prophet import Prophet
+
+from anomaly_detection.predictions.engines import EnginePredictor
+from anomaly_detection.predictions.inference import VectorizedPredictor, extract_parameters
+from anomaly_detection.predictions.seasonal import SeasonalPredictor, day_of_year, fit_seasonal_many
+
+
+def _history(days, seed, start=date(2020, 1, 1)):
+    """
+    Create a synthetic history with a yearly seasonality bounded between 0 and 1.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(days)
+    y = np.clip(0.3 + 0.2 * np.sin(2 * np.pi * t / 365.25) + rng.normal(0, 0.02, days), 0, 1)
+    return pd.DataFrame({'ds': [start + timedelta(days=int(i)) for i in t], 'y': y})
+
+
+@pytest.fixture(scope='module')
+def results():
+    """Fixture to fit the seasonal baseline of two regions with enough data and one without."""
+    histories = {1: _history(1200, seed=0), 2: _history(1000, seed=1), 3: _history(300, seed=2)}
+    return fit_seasonal_many(histories, min_days=730)
+
+
+class TestFitSeasonalMany:
+    """
+    Test the batched fit of the seasonal baseline.
+    """
+
+    def test_not_enough_data(self, results):
+        """
+        Test that a history shorter than the minimum is not trained.
+        """
+        assert results[3] is None
+
+    def test_outputs(self, results):
+        """
+        Test that the outputs have the same shape as the Prophet ones.
+        """
+        assert results[1]['weights'] is None
+        assert len(results[1]['trend']) == 1200
+        assert len(results[1]['yearly_seasonality']) == 365
+        assert len(results[2]['trend']) == 1000
+
+    def test_bands_cover_the_history(self, results):
+        """
+        Test that the bands contain around 80% of the values of the history, as the Prophet ones.
+        """
+        df = _history(1200, seed=0)
+        predictor = SeasonalPredictor({1: results[1]['parameters']})
+
+        yhat, lower, upper = predictor.predict([1] * len(df), list(df['ds']))
+
+        assert np.all(lower <= yhat) and np.all(yhat <= upper)
+        assert 0.7 < np.mean((df['y'] >= lower) & (df['y'] <= upper)) < 0.95
+
+    def test_leap_day(self):
+        """
+        Test that the 29th of February is predicted as the 28th.
+        """
+        assert list(day_of_year([date(2024, 2, 28), date(2024, 2, 29), date(2024, 3, 1), date(2023, 3, 1)])) == [58, 58, 59, 59]
+
+
+class TestEnginePredictor:
+    """
+    Test the prediction of predictors of different engines in a single call.
+    """
+
+    def test_predict_mixed_engines(self, results):
+        """
+        Test that every pair is predicted by the predictor of its engine.
+        """
+        df = _history(800, seed=0)
+        df['cap'] = 1
+        df['floor'] = 0
+        model = Prophet(growth='logistic', yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
+        prophet_parameters = extract_parameters(model.fit(df), horizon_days=31)
+        predictor = EnginePredictor({'prophet': prophet_parameters, 'seasonal': results[1]['parameters']})
+        dates = [date(2022, 3, 1) + timedelta(days=i) for i in range(10)]
+
+        yhat, _, _ = predictor.predict(['prophet', 'seasonal'] * 5, dates)
+
+        expected_prophet, _, _ = VectorizedPredictor({'p': prophet_parameters}).predict(['p'] * 5, dates[0::2])
+        expected_seasonal, _, _ = SeasonalPredictor({'s': results[1]['parameters']}).predict(['s'] * 5, dates[1::2])
+        np.testing.assert_allclose(yhat[0::2], expected_prophet)
+        np.testing.assert_allclose(yhat[1::2], expected_seasonal)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from prophet import Prophet
+from prophet.serialize import model_to_json
+
+from anomaly_detection.predictions.inference import parameters_from_dict, parameters_from_json
+from anomaly_detection.predictions.storage import compact_weights, deserialize_model, loads, serialize_model
+
+
+@pytest.fixture(scope='module')
+def model():
+    """Fixture to fit a Prophet model, as the Predictor does, with a synthetic history."""
+    rng = np.random.default_rng(0)
+    t = np.arange(1000)
+    y = np.clip(0.3 + 0.2 * np.sin(2 * np.pi * t / 365.25) + rng.normal(0, 0.02, len(t)), 0, 1)
+    df = pd.DataFrame({'ds': pd.date_range(start='2020-01-01', periods=len(t)), 'y': y, 'cap': 1, 'floor': 0})
+    model = Prophet(growth='logistic', yearly_seasonality=True, weekly_seasonality=False, daily_seasonality=False)
+    return model.fit(df)
+
+
+def _predict(model):
+    df = pd.DataFrame({'ds': pd.date_range(start='2022-06-01', periods=60)})
+    df['cap'] = 1
+    df['floor'] = 0
+    return model.predict(df)
+
+
+class TestStorage:
+    """
+    Test the compressed storage of the Prophet models.
+    """
+
+    def test_roundtrip_predicts_the_same(self, model):
+        """
+        Test that the deserialized model predicts the same values.
+        """
+        expected = _predict(model)
+        result = _predict(deserialize_model(serialize_model(model)))
+
+        np.testing.assert_allclose(result['yhat'], expected['yhat'])
+        width = (expected['yhat_upper'] - expected['yhat_lower']).mean()
+        assert np.abs(result['yhat_upper'] - expected['yhat_upper']).mean() < 0.1 * width
+
+    def test_smaller_than_json(self, model):
+        """
+        Test that the compressed weights are an order of magnitude smaller than the Prophet JSON.
+        """
+        assert len(serialize_model(model)) * 10 < len(model_to_json(model))
+
+    def test_compact_weights(self, model):
+        """
+        Test the conversion of the weights stored with `model_to_json`.
+        """
+        weights = compact_weights(model_to_json(model))
+
+        np.testing.assert_allclose(_predict(deserialize_model(weights))['yhat'], _predict(model)['yhat'])
+        assert parameters_from_dict(loads(weights)) == parameters_from_json(model_to_json(model))
@@ -0,0 +1,161 @@
+import os
+from datetime import date, datetime
+
+import pytest
+from celery import current_app
+
+from anomaly_detection.predictions.tile_cache import FileSystemTileStore, metric_tiles_namespace, tile_store
+from anomaly_detection.predictions.tasks import seed_tiles_task
+from anomaly_detection.predictions.tile_seeding import METRICS, pyramid, seed_batch, tile_range
+
+
+class TestFileSystemTileStore:
+    """
+    Test the filesystem store of the tile cache.
+    """
+
+    def test_get_set(self, tmp_path):
+        """
+        Test that a stored tile is read back, including the empty ones.
+        """
+        store = FileSystemTileStore(str(tmp_path))
+        generation = store.generation('metrics/2023-01-01')
+
+        assert store.generation('metrics/2023-01-01') == generation
+        assert store.get('metrics/2023-01-01', generation, 1, 0, 0) is None
+        assert store.set('metrics/2023-01-01', generation, 1, 0, 0, b'tile')
+        assert store.set('metrics/2023-01-01', generation, 5, 250, 250, b'')
+
+        assert store.get('metrics/2023-01-01', generation, 1, 0, 0) == b'tile'
+        assert store.get('metrics/2023-01-01', generation, 5, 250, 250) == b''
+        assert not list(tmp_path.rglob('*.tmp'))
+
+    def test_invalidate(self, tmp_path):
+        """
+        Test that only the tiles of the invalidated namespaces are deleted.
+        """
+        store = FileSystemTileStore(str(tmp_path))
+        first, second = store.generation('metrics/2023-01-01'), store.generation('metrics/2023-01-02')
+        store.set('metrics/2023-01-01', first, 1, 0, 0, b'first')
+        store.set('metrics/2023-01-02', second, 1, 0, 0, b'second')
+
+        store.invalidate(['metrics/2023-01-01', 'metrics/2023-01-05'])
+
+        assert store.generation('metrics/2023-01-01') != first
+        assert store.get('metrics/2023-01-01', store.generation('metrics/2023-01-01'), 1, 0, 0) is None
+        assert not (tmp_path / 'metrics' / '2023-01-01' / first).exists()
+        assert store.get('metrics/2023-01-02', second, 1, 0, 0) == b'second'
+
+    def test_set_invalidated(self, tmp_path):
+        """
+        Test that a tile rendered before an invalidation, and stored after it, is discarded.
+        """
+        store = FileSystemTileStore(str(tmp_path))
+        generation = store.generation('metrics/2023-01-01')
+
+        store.invalidate(['metrics/2023-01-01'])
+
+        assert not store.set('metrics/2023-01-01', generation, 1, 0, 0, b'stale')
+        assert store.get('metrics/2023-01-01', store.generation('metrics/2023-01-01'), 1, 0, 0) is None
+        assert not (tmp_path / 'metrics' / '2023-01-01' / generation).exists()
+
+    def test_evict(self, tmp_path):
+        """
+        Test that only the namespaces written most recently are kept.
+        """
+        store = FileSystemTileStore(str(tmp_path), max_namespaces=2)
+        for i, namespace in enumerate(['metrics/2023-01-01', 'metrics/2023-01-02']):
+            generation = store.generation(namespace)
+            store.set(namespace, generation, 1, 0, 0, b'tile')
+            os.utime(tmp_path / namespace / generation, (1000 * (i + 1), 1000 * (i + 1)))
+        store.set('regions', store.generation('regions'), 1, 0, 0, b'tile')
+
+        assert not (tmp_path / 'metrics' / '2023-01-01').exists()
+        assert store.get('metrics/2023-01-02', store.generation('metrics/2023-01-02'), 1, 0, 0) == b'tile'
+        assert store.get('regions', store.generation('regions'), 1, 0, 0) == b'tile'
+
+
+class TestMetricTilesNamespace:
+    """
+    Test the namespace of the metric tiles of a date.
+    """
+
+    def test_metric_tiles_namespace(self):
+        """
+        Test that dates, datetimes and valid strings share the namespace, and invalid dates have none.
+        """
+        assert metric_tiles_namespace(date(2023, 1, 1)) == 'metrics/2023-01-01'
+        assert metric_tiles_namespace(datetime(2023, 1, 1, 12)) == 'metrics/2023-01-01'
+        assert metric_tiles_namespace('2023-01-01') == 'metrics/2023-01-01'
+        assert metric_tiles_namespace('2023-13-01') is None
+        assert metric_tiles_namespace('../etc') is None
+        assert metric_tiles_namespace(None) is None
+
+
+class TestPyramid:
+    """
+    Test the tiles covering a bounding box.
+    """
+
+    def test_tile_range(self):
+        """
+        Test that the whole world is covered by every tile, and a box by the tiles that contain it.
+        """
+        assert tile_range((-180, -90, 180, 90), 0) == (range(0, 1), range(0, 1))
+        assert tile_range((-180, -90, 180, 90), 2) == (range(0, 4), range(0, 4))
+        # The y axis grows southwards, so the northern hemisphere is the first row.
+        assert tile_range((0.1, 0.1, 0.9, 0.9), 1) == (range(1, 2), range(0, 1))
+
+    def test_pyramid(self):
+        """
+        Test that the pyramid has the tiles of every zoom level of the range.
+        """
+        tiles = pyramid((0.1, 0.1, 0.9, 0.9), 1, 3)
+
+        assert tiles == [(1, 1, 0), (2, 2, 1), (3, 4, 3)]
+        assert pyramid((0.1, 0.1, 0.9, 0.9), 3, 1) == []
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSeedBatch:
+    """
+    Test the rendering of a batch of tiles into the tile cache.
+    """
+
+    def test_seed_batch(self, metrics):
+        """
+        Test that the tiles are rendered and stored, and only rendered again if forced.
+        """
+        namespace = metric_tiles_namespace('2023-01-01')
+        job = (METRICS, namespace, '2023-01-01', [(1, 1, 0), (2, 0, 0)], False)
+
+        assert seed_batch(job) == (2, 1, 0)
+        generation = tile_store().generation(namespace)
+        assert tile_store().get(namespace, generation, 1, 1, 0)
+        assert tile_store().get(namespace, generation, 2, 0, 0) == b''
+        assert seed_batch(job) == (0, 0, 2)
+        assert seed_batch(job[:-1] + (True,)) == (2, 1, 0)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestSeedTilesTask:
+    """
+    Test the seeding task, which fans the batches of tiles out as tasks.
+    """
+
+    def test_seed_tiles(self, metrics, settings, monkeypatch):
+        """
+        Test that the task queues a task for every batch, which renders its tiles into the tile cache.
+        """
+        monkeypatch.setitem(current_app.conf, 'task_always_eager', True)
+        settings.TILE_SEED_BATCH_SIZE = 2
+
+        report = seed_tiles_task('2023-01-01', min_zoom=0, max_zoom=2, regions=False)
+
+        assert report == {'date': '2023-01-01', 'tiles': 5, 'batches': 3}
+        namespace = metric_tiles_namespace('2023-01-01')
+        generation = tile_store().generation(namespace)
+        assert all(
+            tile_store().get(namespace, generation, *tile) is not None
+            for tile in pyramid((0, 0, 1, 1), 0, 2)
+        )
@@ -0,0 +1,193 @@
+import multiprocessing
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from django.db import connections
+
+from anomaly_detection.predictions.training import (_fit_job, fit_prophet, missing_history_days,
+                                                    training_window_days)
+from anomaly_detection.utils.processes import run_in_processes
+
+
+def _history(days, start=date(2020, 1, 1)):
+    """
+    Create a synthetic history with a yearly seasonality bounded between 0 and 1.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(days)
+    y = np.clip(0.3 + 0.2 * np.sin(2 * np.pi * t / 365.25) + rng.normal(0, 0.02, days), 0, 1)
+    return pd.DataFrame({'ds': [start + timedelta(days=int(i)) for i in t], 'y': y})
+
+
+def _run_in_daemonic_process(target, *args) -> int:
+    """
+    Runs the target in a daemonic process, as the child processes of a Celery prefork worker are.
+    Returns its exit code (not 0 if it raised).
+    """
+    connections.close_all()
+    process = multiprocessing.get_context('fork').Process(target=target, args=args, daemon=True)
+    process.start()
+    process.join()
+    return process.exitcode
+
+
+def _fit_in_processes(jobs):
+    results = dict(run_in_processes(_fit_job, jobs, max_workers=2))
+    assert sorted(results) == [1, 2]
+    assert all(result is not None for result in results.values())
+
+
+def _train_predictors(date_str):
+    from anomaly_detection.predictions.tasks import train_predictors_task
+
+    train_predictors_task(date_str)
+
+
+class TestFitProphet:
+    """
+    Test the fit of the Prophet models outside of the Predictor model.
+    """
+
+    def test_fit_prophet(self):
+        """
+        Test that a history long enough returns the weights, trend and seasonality.
+        """
+        result = fit_prophet(_history(800), min_days=730, horizon_days=31)
+
+        assert result is not None
+        assert isinstance(result['weights'], bytes)
+        assert len(result['parameters']['band_upper']) == 32
+        assert len(result['trend']) == 800
+        assert len(result['yearly_seasonality']) == 365
+
+    def test_fit_prophet_not_enough_data(self):
+        """
+        Test that a history shorter than the minimum is not trained.
+        """
+        assert fit_prophet(_history(300), min_days=730, horizon_days=31) is None
+
+    def test_fit_prophet_all_zeros(self):
+        """
+        Test that a history without signal is not trained.
+        """
+        df = _history(800)
+        df['y'] = 0.0
+
+        assert fit_prophet(df, min_days=730, horizon_days=31) is None
+
+    def test_fit_prophet_warm_start(self):
+        """
+        Test that the fit starts from the parameters of a previous fit and gives a close trend.
+        """
+        df = _history(800)
+        previous = fit_prophet(df.iloc[:770], min_days=730, horizon_days=31)
+
+        cold = fit_prophet(df, min_days=730, horizon_days=31)
+        warm = fit_prophet(df, min_days=730, horizon_days=31, previous=previous['parameters'])
+
+        assert warm['warm_started']
+        assert not cold['warm_started']
+        assert np.abs(np.array(warm['trend']) - np.array(cold['trend'])).max() < 0.05
+
+    def test_fit_prophet_warm_start_fallback(self):
+        """
+        Test that invalid previous parameters fall back to a cold start.
+        """
+        result = fit_prophet(_history(800), min_days=730, horizon_days=31, previous={'k': 0.1})
+
+        assert result is not None
+        assert not result['warm_started']
+
+
+class TestMissingHistoryDays:
+    """
+    Test the number of values that a history misses to be trained.
+    """
+
+    def test_missing_history_days(self):
+        """
+        Test that the values are counted from the first non-zero value, without the missing ones.
+        """
+        df = _history(10)
+        df.loc[:2, 'y'] = 0
+        df.loc[5, 'y'] = np.nan
+
+        assert missing_history_days(df, min_days=10) == 4
+        assert missing_history_days(_history(800), min_days=730) == 0
+
+    def test_missing_history_days_no_values(self):
+        """
+        Test that a history without non-zero values can never be trained.
+        """
+        df = _history(10).assign(y=0.)
+
+        assert missing_history_days(df, min_days=10) is None
+        assert missing_history_days(df.iloc[:0], min_days=10) is None
+
+
+class TestTrainingWindow:
+    """
+    Test the window of history used to train the predictors.
+    """
+
+    def test_training_window_days(self, settings):
+        """
+        Test that the window is never shorter than the minimum days of training, and can be disabled.
+        """
+        settings.PREDICTOR_TRAINING_WINDOW_DAYS = 1000
+        assert training_window_days(min_days=730) == 1000
+        settings.PREDICTOR_TRAINING_WINDOW_DAYS = 365
+        assert training_window_days(min_days=730) == 730
+        settings.PREDICTOR_TRAINING_WINDOW_DAYS = 0
+        assert training_window_days(min_days=730) is None
+
+
+class TestRunInProcesses:
+    """
+    Test the fit of the Prophet models in parallel processes.
+    """
+
+    def test_run_in_processes(self):
+        """
+        Test that every job is fitted in a pool of processes.
+        """
+        jobs = [(i, _history(800), 730, 31, None) for i in (1, 2)]
+
+        results = dict(run_in_processes(_fit_job, jobs, max_workers=2))
+
+        assert sorted(results) == [1, 2]
+
+    def test_run_in_daemonic_process(self):
+        """
+        Test that the jobs are fitted in the process itself when it can not start processes.
+        """
+        jobs = [(i, _history(800), 730, 31, None) for i in (1, 2)]
+
+        assert _run_in_daemonic_process(_fit_in_processes, jobs) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTrainPredictorsTask:
+    """
+    Test the training task as a Celery prefork worker runs it.
+    """
+
+    def test_train_predictors_in_daemonic_process(self, municipality):
+        """
+        Test that the task trains the Prophet predictors from a daemonic process.
+        """
+        from anomaly_detection.predictions.models import Metric, Predictor
+
+        history = _history(800)
+        Metric.objects.bulk_create([
+            Metric(region=municipality[0], date=ds, value=y) for ds, y in zip(history['ds'], history['y'])
+        ])
+        date_str = (history['ds'].iloc[-1] + timedelta(days=1)).isoformat()
+
+        assert _run_in_daemonic_process(_train_predictors, date_str) == 0
+
+        predictor = Predictor.objects.get(region=municipality[0])
+        assert predictor.engine == Predictor.Engine.PROPHET
+        assert predictor.is_trained
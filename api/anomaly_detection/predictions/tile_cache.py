@@ -0,0 +1,257 @@
+import glob
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import date as date_type, datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+
+FILESYSTEM = 'filesystem'
+REDIS = 'redis'
+
+# Namespace of the region tiles, which do not depend on the date.
+REGION_TILES_NAMESPACE = 'regions'
+
+# Name of the current generation of the tiles of a namespace.
+GENERATION = 'generation'
+
+
+class FileSystemTileStore:
+    """
+    Stores the tiles as files, in `<root>/<namespace>/<generation>/<z>/<x>/<y>.mvt`, where the current generation
+    of a namespace is a token in `<root>/<namespace>/generation`, replaced by every invalidation. So a tile rendered
+    before an invalidation, and stored after it, is never read.
+    The files are written to a temporary file first, so a tile is never read half written.
+    Only the `max_namespaces` namespaces written most recently are kept (if given).
+    """
+
+    def __init__(self, root: str, max_namespaces: Optional[int] = None):
+        self.root = root
+        self.max_namespaces = max_namespaces
+
+    def _generation_path(self, namespace: str) -> str:
+        return os.path.join(self.root, namespace, GENERATION)
+
+    def _generation_dir(self, namespace: str, generation: str) -> str:
+        return os.path.join(self.root, namespace, generation)
+
+    def _path(self, namespace: str, generation: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self._generation_dir(namespace, generation), str(z), str(x), f'{y}.mvt')
+
+    @staticmethod
+    def _write(path: str, content: bytes, replace: bool = True) -> None:
+        """
+        Writes a file atomically. If not `replace`, an existing file is kept.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        if replace:
+            os.replace(tmp_path, path)
+            return
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def generation(self, namespace: str) -> str:
+        path = self._generation_path(namespace)
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, uuid.uuid4().hex.encode(), replace=False)
+        with open(path) as f:
+            return f.read()
+
+    def get(self, namespace: str, generation: str, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            with open(self._path(namespace, generation, z, x, y), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, namespace: str, generation: str, z: int, x: int, y: int, content: bytes) -> bool:
+        generation_dir = self._generation_dir(namespace, generation)
+        new_generation = not os.path.isdir(generation_dir)
+        path = self._path(namespace, generation, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, content)
+        if self.generation(namespace) != generation:
+            # The namespace was invalidated while the tile was rendered.
+            shutil.rmtree(generation_dir, ignore_errors=True)
+            return False
+        os.utime(generation_dir)
+        if new_generation:
+            self.evict()
+        return True
+
+    def invalidate(self, namespaces: Iterable[str]) -> None:
+        for namespace in namespaces:
+            namespace_dir = os.path.join(self.root, namespace)
+            if not os.path.isdir(namespace_dir):
+                continue
+            generation = uuid.uuid4().hex
+            self._write(self._generation_path(namespace), generation.encode())
+            for name in os.listdir(namespace_dir):
+                if name != generation and os.path.isdir(os.path.join(namespace_dir, name)):
+                    shutil.rmtree(os.path.join(namespace_dir, name), ignore_errors=True)
+
+    def evict(self) -> None:
+        """
+        Deletes the namespaces written least recently, beyond the `max_namespaces` ones.
+        """
+        if not self.max_namespaces:
+            return
+        # The namespaces are a directory ('regions') or two ('metrics/<date>') deep.
+        generation_paths = glob.glob(os.path.join(glob.escape(self.root), '*', GENERATION))
+        generation_paths += glob.glob(os.path.join(glob.escape(self.root), '*', '*', GENERATION))
+        if len(generation_paths) <= self.max_namespaces:
+            return
+        written_at = {}
+        for path in generation_paths:
+            try:
+                with open(path) as f:
+                    generation_dir = os.path.join(os.path.dirname(path), f.read())
+                written_at[os.path.dirname(path)] = os.stat(
+                    generation_dir if os.path.isdir(generation_dir) else path
+                ).st_mtime
+            except FileNotFoundError:
+                continue
+        for namespace_dir in sorted(written_at, key=written_at.get)[:-self.max_namespaces]:
+            shutil.rmtree(namespace_dir, ignore_errors=True)
+
+
+class RedisTileStore:
+    """
+    Stores the tiles in a Redis-compatible server, in a hash per generation of a namespace. The current
+    generation of a namespace is a token, replaced by every invalidation (which deletes the hash of the previous
+    one with a single command), so a tile rendered before an invalidation, and stored after it, is never read.
+    The memory is bounded by the server (e.g. `maxmemory` with an LRU eviction policy).
+    """
+
+    def __init__(self, url: str):
+        # Optional dependency, only needed by this backend.
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _generation_key(namespace: str) -> str:
+        return f'tiles:{namespace}:{GENERATION}'
+
+    @staticmethod
+    def _key(namespace: str, generation: str) -> str:
+        return f'tiles:{namespace}:{generation}'
+
+    def generation(self, namespace: str) -> str:
+        pipeline = self.client.pipeline()
+        pipeline.set(self._generation_key(namespace), uuid.uuid4().hex, nx=True)
+        pipeline.get(self._generation_key(namespace))
+        return pipeline.execute()[1].decode()
+
+    def get(self, namespace: str, generation: str, z: int, x: int, y: int) -> Optional[bytes]:
+        return self.client.hget(self._key(namespace, generation), f'{z}/{x}/{y}')
+
+    def set(self, namespace: str, generation: str, z: int, x: int, y: int, content: bytes) -> bool:
+        self.client.hset(self._key(namespace, generation), f'{z}/{x}/{y}', content)
+        if self.generation(namespace) != generation:
+            # The namespace was invalidated while the tile was rendered.
+            self.client.delete(self._key(namespace, generation))
+            return False
+        return True
+
+    def invalidate(self, namespaces: Iterable[str]) -> None:
+        for namespace in namespaces:
+            pipeline = self.client.pipeline()
+            pipeline.get(self._generation_key(namespace))
+            pipeline.set(self._generation_key(namespace), uuid.uuid4().hex)
+            previous = pipeline.execute()[0]
+            if previous is not None:
+                self.client.delete(self._key(namespace, previous.decode()))
+
+
+_stores: Dict[Tuple[str, str], object] = {}
+
+
+def tile_store():
+    """
+    Returns the store of the tile cache of the process (see `TILE_CACHE_BACKEND`), or None if it is disabled.
+    """
+    backend = getattr(settings, 'TILE_CACHE_BACKEND', '')
+    if backend == FILESYSTEM:
+        location = settings.TILE_CACHE_DIR
+    elif backend == REDIS:
+        location = settings.TILE_CACHE_REDIS_URL
+    elif not backend:
+        return None
+    else:
+        raise ValueError(f"Invalid tile cache backend '{backend}'. Must be one of: {FILESYSTEM}, {REDIS}")
+
+    if (backend, location) not in _stores:
+        _stores[(backend, location)] = FileSystemTileStore(
+            location, max_namespaces=getattr(settings, 'TILE_CACHE_MAX_NAMESPACES', 0)
+        ) if backend == FILESYSTEM else RedisTileStore(location)
+    return _stores[(backend, location)]
+
+
+def cached_tile(namespace: Optional[str], z: int, x: int, y: int, render: Callable[[], bytes]) -> bytes:
+    """
+    Returns a tile from the tile cache, or renders it with `render` and stores it if it is not cached.
+    The tile is stored in the generation of the namespace read before rendering it, so it is discarded if the
+    namespace is invalidated meanwhile. The tile is rendered without the cache if it is disabled or the namespace
+    is None.
+    """
+    store = tile_store()
+    if store is None or namespace is None:
+        return render()
+    generation = store.generation(namespace)
+    content = store.get(namespace, generation, z, x, y)
+    if content is None:
+        content = render()
+        store.set(namespace, generation, z, x, y, content)
+    return content
+
+
+def metric_tiles_namespace(date) -> Optional[str]:
+    """
+    Returns the namespace of the metric tiles of a date (a date, or a string in the format YYYY-MM-DD),
+    or None if it is not a valid date.
+    """
+    if isinstance(date, datetime):
+        date = date.date()
+    elif isinstance(date, str):
+        try:
+            date = date_type.fromisoformat(date)
+        except ValueError:
+            return None
+    return f'metrics/{date.isoformat()}' if isinstance(date, date_type) else None
+
+
+def invalidate_metric_tiles(dates: Iterable) -> None:
+    """
+    Invalidates the cached metric tiles of the dates, once the current transaction (if any) is committed.
+    """
+    store = tile_store()
+    if store is None:
+        return
+    namespaces = {metric_tiles_namespace(date) for date in dates} - {None}
+    if namespaces:
+        transaction.on_commit(lambda: store.invalidate(sorted(namespaces)))
+
+
+def invalidate_region_tiles() -> None:
+    """
+    Invalidates the cached region tiles, once the current transaction (if any) is committed.
+    """
+    store = tile_store()
+    if store is not None:
+        transaction.on_commit(lambda: store.invalidate([REGION_TILES_NAMESPACE]))
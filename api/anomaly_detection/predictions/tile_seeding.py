@@ -0,0 +1,182 @@
+import logging
+import math
+import time
+from datetime import date as date_type
+from typing import List, Optional, Tuple, TypedDict
+
+from django.conf import settings
+
+from anomaly_detection.predictions.tile_cache import REGION_TILES_NAMESPACE, metric_tiles_namespace, tile_store
+from anomaly_detection.utils.processes import run_in_processes
+
+
+logger = logging.getLogger(__name__)
+
+METRICS = 'metrics'
+REGIONS = 'regions'
+
+# Web Mercator is only defined up to this latitude.
+MAX_LATITUDE = 85.0511287798
+
+
+class SeedReport(TypedDict):
+    date: date_type
+    tiles: int
+    rendered: int
+    empty: int
+    skipped: int
+    elapsed: float
+    tiles_per_second: float
+
+
+def tile_range(bbox: Tuple[float, float, float, float], z: int) -> Tuple[range, range]:
+    """
+    Returns the x and y ranges of the tiles of a zoom level covering a bounding box
+    (min longitude, min latitude, max longitude, max latitude).
+    """
+    n = 2 ** z
+
+    def tile_x(lon: float) -> int:
+        return min(max(math.floor((lon + 180) / 360 * n), 0), n - 1)
+
+    def tile_y(lat: float) -> int:
+        lat = math.radians(min(max(lat, -MAX_LATITUDE), MAX_LATITUDE))
+        return min(max(math.floor((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n), 0), n - 1)
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    # The y axis of the tiles grows southwards.
+    return range(tile_x(min_lon), tile_x(max_lon) + 1), range(tile_y(max_lat), tile_y(min_lat) + 1)
+
+
+def pyramid(bbox: Tuple[float, float, float, float], min_zoom: int, max_zoom: int) -> List[Tuple[int, int, int]]:
+    """
+    Returns every tile (z, x, y) covering a bounding box, from the minimum to the maximum zoom level.
+    """
+    tiles = []
+    for z in range(min_zoom, max_zoom + 1):
+        xs, ys = tile_range(bbox, z)
+        tiles.extend((z, x, y) for x in xs for y in ys)
+    return tiles
+
+
+def _layers(kind: str, date: Optional[str]):
+    """
+    Returns the layers of the tiles of a kind, as the views build them.
+    """
+    if kind == METRICS:
+        from anomaly_detection.predictions.vector_layers import MetricMunicipalityVectorLayer
+
+        return [MetricMunicipalityVectorLayer(date=date)]
+    from anomaly_detection.regions.vector_layers import MunicipalityVectorLayer, ProvinceVectorLayer
+
+    return [MunicipalityVectorLayer(), ProvinceVectorLayer()]
+
+
+def seed_batch(job: Tuple[str, str, Optional[str], List[Tuple[int, int, int]], bool]) -> Tuple[int, int, int]:
+    """
+    Renders a batch of tiles (see `seed_batches`) and stores them in the tile cache. Run in a worker process,
+    or in a Celery task (see `seed_tiles_batch_task`).
+
+    Returns:
+        tuple: The number of rendered, empty and skipped (already cached) tiles.
+    """
+    kind, namespace, date, tiles, force = job
+    store = tile_store()
+    generation = store.generation(namespace)
+    layers = _layers(kind, date)
+    rendered, empty, skipped = 0, 0, 0
+    for z, x, y in tiles:
+        if not force and store.get(namespace, generation, z, x, y) is not None:
+            skipped += 1
+            continue
+        content = b''.join(layer.get_tile(x, y, z) for layer in layers)
+        if not store.set(namespace, generation, z, x, y, content):
+            # The tiles were invalidated meanwhile: the rest of the batch would be stale too.
+            break
+        rendered += 1
+        empty += not content
+    return rendered, empty, skipped
+
+
+def seed_batches(
+    date: date_type,
+    min_zoom: Optional[int] = None,
+    max_zoom: Optional[int] = None,
+    regions: bool = True,
+    force: bool = False,
+) -> List[Tuple[str, str, Optional[str], List[Tuple[int, int, int]], bool]]:
+    """
+    Returns the batches of `TILE_SEED_BATCH_SIZE` tiles to render to seed the tiles of a date (see `seed_tiles`),
+    each one rendered with `seed_batch`.
+    """
+    from django.contrib.gis.db.models import Extent
+
+    from anomaly_detection.regions.models import Municipality
+
+    bbox = Municipality.objects.aggregate(extent=Extent('geometry'))['extent']
+    tiles = pyramid(
+        bbox,
+        settings.TILE_SEED_MIN_ZOOM if min_zoom is None else min_zoom,
+        settings.TILE_SEED_MAX_ZOOM if max_zoom is None else max_zoom,
+    ) if bbox is not None else []
+    kinds = [(METRICS, metric_tiles_namespace(date), date.isoformat())]
+    if regions:
+        kinds.append((REGIONS, REGION_TILES_NAMESPACE, None))
+
+    batch_size = settings.TILE_SEED_BATCH_SIZE
+    return [
+        (kind, namespace, date_str, tiles[i:i + batch_size], force)
+        for kind, namespace, date_str in kinds
+        for i in range(0, len(tiles), batch_size)
+    ]
+
+
+def seed_tiles(
+    date: date_type,
+    min_zoom: Optional[int] = None,
+    max_zoom: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    regions: bool = True,
+    force: bool = False,
+) -> SeedReport:
+    """
+    Renders the metric tiles of a date (and the region tiles, if `regions`) covering the municipalities,
+    from the minimum to the maximum zoom level, and stores them in the tile cache, so the first request of
+    every tile is already cached. The tiles are rendered in batches, in parallel processes (or one after
+    another in a daemonic process, see `run_in_processes`; the workers fan the batches out as tasks instead,
+    see `seed_tiles_task`). The tiles already cached are skipped, unless `force`.
+
+    Args:
+        date (date): The date of the metric tiles.
+        min_zoom (int): The minimum zoom level (default: `TILE_SEED_MIN_ZOOM`).
+        max_zoom (int): The maximum zoom level (default: `TILE_SEED_MAX_ZOOM`).
+        max_workers (int): The number of processes (default: `TILE_SEED_MAX_WORKERS`).
+        regions (bool): Whether to seed the region tiles too.
+        force (bool): Whether to render again the tiles already cached.
+
+    Returns:
+        SeedReport: The number of tiles rendered and skipped, and the time spent.
+    """
+    start = time.monotonic()
+    report = SeedReport(date=date, tiles=0, rendered=0, empty=0, skipped=0, elapsed=0.0, tiles_per_second=0.0)
+    if tile_store() is None:
+        logger.warning("The tile cache is disabled, there is nothing to seed")
+        return report
+
+    jobs = seed_batches(date, min_zoom=min_zoom, max_zoom=max_zoom, regions=regions, force=force)
+    report['tiles'] = sum(len(job[3]) for job in jobs)
+
+    for rendered, empty, skipped in run_in_processes(
+        seed_batch, jobs, max_workers=max_workers or settings.TILE_SEED_MAX_WORKERS
+    ):
+        report['rendered'] += rendered
+        report['empty'] += empty
+        report['skipped'] += skipped
+
+    report['elapsed'] = time.monotonic() - start
+    report['tiles_per_second'] = report['rendered'] / report['elapsed'] if report['elapsed'] else 0.0
+    logger.info(
+        "Seeded %d tiles of %s (%d empty, %d already cached) in %.1fs (%.1f tiles/s)",
+        report['rendered'], date, report['empty'], report['skipped'], report['elapsed'], report['tiles_per_second']
+    )
+    return report
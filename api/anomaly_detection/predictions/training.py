@@ -0,0 +1,398 @@
+import logging
+import math
+import os
+import time
+import warnings
+from datetime import date as date_type, datetime
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import numpy as np
+import pandas as pd
+from prophet import Prophet
+from prophet.plot import seasonality_plot_df
+
+from anomaly_detection.predictions.inference import extract_parameters
+from anomaly_detection.predictions.storage import serialize_model
+from anomaly_detection.utils.processes import run_in_processes
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingResult(TypedDict):
+    weights: Optional[bytes]
+    parameters: Dict[str, Any]
+    trend: List[float]
+    yearly_seasonality: List[float]
+    warm_started: bool
+
+
+class TrainingReport(TypedDict):
+    date: date_type
+    created: int
+    trained: int
+    warm_started: int
+    skipped: int
+    elapsed: float
+    fits_per_second: float
+
+
+def default_max_workers() -> int:
+    """
+    Number of processes used to fit models in parallel (80% of the cores, at least one).
+    """
+    return math.floor(max(os.cpu_count() * 0.8, 1))
+
+
+def _silence_prophet_logs() -> None:
+    """
+    Set the loggers and warnings to avoid the noise of the prophet library.
+    """
+    logger = logging.getLogger('cmdstanpy')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logger.setLevel(logging.CRITICAL)
+
+    warnings.filterwarnings("ignore", category=pd.errors.SettingWithCopyWarning)
+
+
+def warm_start_enabled() -> bool:
+    """
+    Whether the models are fitted starting from the parameters of the previous predictor of the region.
+    """
+    from django.conf import settings
+
+    return getattr(settings, 'PREDICTOR_WARM_START', True)
+
+
+def training_window_days(min_days: int) -> Optional[int]:
+    """
+    The number of days of history used to train the new predictors (see `PREDICTOR_TRAINING_WINDOW_DAYS`),
+    never less than `min_days`. None to use the whole history.
+    """
+    from django.conf import settings
+
+    window_days = getattr(settings, 'PREDICTOR_TRAINING_WINDOW_DAYS', 0)
+    return max(window_days, min_days) if window_days else None
+
+
+def _new_model() -> Prophet:
+    return Prophet(
+        growth='logistic',
+        yearly_seasonality=True,
+        weekly_seasonality=False,
+        daily_seasonality=False,
+    )
+
+
+def warm_start_init(model: Prophet, previous: Dict[str, Any], df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Builds the initial values of the Stan optimizer from the parameters of a previous fit (see
+    `inference.extract_parameters`), for a model that is going to be fitted with `df`.
+
+    The parameters are rescaled to the time and value scales of the new history, and the slope changes
+    are moved to the changepoints of the new history, which are placed as Prophet does.
+    """
+    history = df[df['y'].notnull()]
+    ds = pd.to_datetime(history['ds'])
+    start = ds.iloc[0].timestamp()
+    t_scale = (ds.iloc[-1] - ds.iloc[0]).total_seconds()
+    y_scale = float((history['y'] - history['floor']).abs().max()) or 1.
+
+    # Changepoints of the new history, in the time scale of the previous fit.
+    hist_size = int(np.floor(len(history) * model.changepoint_range))
+    n_changepoints = min(model.n_changepoints, hist_size - 1)
+    indexes = np.linspace(0, hist_size - 1, n_changepoints + 1).round().astype(int)[1:]
+
+    def to_previous_t(seconds):
+        return (seconds - previous['start']) / previous['t_scale']
+
+    changepoints_t = to_previous_t(np.array([ds.iloc[i].timestamp() for i in indexes]))
+
+    # Slope of the previous trend at the start of the history and at every new changepoint.
+    previous_changepoints_t = np.asarray(previous['changepoints_t'])
+    previous_delta = np.asarray(previous['delta'])
+    rates = np.array([
+        previous['k'] + previous_delta[previous_changepoints_t <= t].sum()
+        for t in np.concatenate(([to_previous_t(start)], changepoints_t))
+    ])
+
+    time_ratio = t_scale / previous['t_scale']
+    value_ratio = previous['y_scale'] / y_scale
+    return {
+        'k': float(rates[0] * time_ratio),
+        'm': float((previous['m'] * previous['t_scale'] + previous['start'] - start) / t_scale),
+        'delta': np.diff(rates) * time_ratio,
+        'beta': np.asarray(previous['beta']) * value_ratio,
+        'sigma_obs': float(previous['sigma_obs'] * value_ratio),
+    }
+
+
+def prepare_history(df: pd.DataFrame, min_days: int) -> Optional[pd.DataFrame]:
+    """
+    Prepares the history in `df` (columns `ds` and `y`, sorted by date) to fit a Prophet model.
+    Returns None if there is not enough quality data to train the model.
+    """
+    # TODO: Apply Savitzky-Golay filter with safeguards. Maybe, create a new field in Metric (smoothed_value)
+    if df.empty or df['y'].isna().all() or df['y'].eq(0).all():
+        return None
+
+    df = df.copy()
+    first_non_zero = df[df["y"] != 0].iloc[0]
+    # See: https://facebook.github.io/prophet/docs/outliers.html
+    df.loc[df['ds'] < first_non_zero['ds'], "y"] = None
+
+    if df["y"].count() < min_days:
+        # If there are not enough quality data to train the model, do not train it.
+        return None
+
+    # Logistic growth and boundaries between 0 and 1 are specifict to the bite risk model, which value is a
+    # probability. If ever needs to use other kind of metric set the boundaries on the MetricType model.
+    df.loc[:, 'cap'] = 1
+    df.loc[:, 'floor'] = 0
+    return df
+
+
+def missing_history_days(df: pd.DataFrame, min_days: int) -> Optional[int]:
+    """
+    Returns the number of values that the history in `df` (columns `ds` and `y`) misses to be trained,
+    counted from its first non-zero value as `prepare_history` does (0 if it has enough values).
+    None if the history has no non-zero value, as no number of days would be enough.
+    """
+    values = df['y'].to_numpy(dtype=float)
+    non_zero = np.flatnonzero(np.nan_to_num(values) != 0)
+    if not len(non_zero):
+        return None
+    return max(min_days - int(np.count_nonzero(~np.isnan(values[non_zero[0]:]))), 0)
+
+
+def fit_model(df: pd.DataFrame, previous: Optional[Dict[str, Any]] = None) -> Tuple[Prophet, bool]:
+    """
+    Fits a Prophet model with a history prepared with `prepare_history`.
+    If the parameters of a `previous` fit of the same region are given, the optimizer starts from
+    them, falling back to a cold start if it fails.
+
+    Returns:
+        tuple: The fitted model and whether it was warm started.
+    """
+    if previous is not None:
+        model = _new_model()
+        try:
+            return model.fit(df, init=warm_start_init(model, previous=previous, df=df)), True
+        except Exception:
+            logger.warning("Warm start failed, fitting the model from scratch.", exc_info=True)
+    return _new_model().fit(df), False
+
+
+def fit_prophet(
+    df: pd.DataFrame,
+    min_days: int,
+    horizon_days: int,
+    previous: Optional[Dict[str, Any]] = None,
+) -> Optional[TrainingResult]:
+    """
+    Fits a Prophet model with the history in `df` (columns `ds` and `y`, sorted by date).
+    The uncertainty intervals are precomputed for `horizon_days` days after the history.
+    See `fit_model` for the warm start from the `previous` parameters.
+    Returns None if there is not enough quality data to train the model.
+    """
+    _silence_prophet_logs()
+
+    df = prepare_history(df, min_days=min_days)
+    if df is None:
+        return None
+
+    model, warm_started = fit_model(df, previous=previous)
+
+    # Trend
+    future = model.make_future_dataframe(periods=0)
+    future['cap'] = 1  # Ensure the future data has the cap
+    future['floor'] = 0  # Ensure the future data has the floor
+    forecast = model.predict(future)
+
+    # Seasonality
+    df_w = seasonality_plot_df(m=model, ds=pd.date_range(start='2017-01-01', periods=365))
+    seas_df = model.predict_seasonal_components(df_w)
+
+    return TrainingResult(
+        weights=serialize_model(model),
+        parameters=extract_parameters(model, horizon_days=horizon_days),
+        trend=forecast['trend'].to_list(),
+        yearly_seasonality=seas_df.reset_index(inplace=False)['yearly'].to_list(),
+        warm_started=warm_started,
+    )
+
+
+def _fit_job(
+    job: Tuple[int, pd.DataFrame, int, int, Optional[Dict[str, Any]]]
+) -> Tuple[int, Optional[TrainingResult]]:
+    """
+    Entrypoint of the worker processes. It must be a module level function so it can be pickled.
+    """
+    predictor_id, df, min_days, horizon_days, previous = job
+    return predictor_id, fit_prophet(df, min_days=min_days, horizon_days=horizon_days, previous=previous)
+
+
+def load_training_history(
+    cutoffs: Dict[int, datetime], window_days: Optional[int] = None
+) -> Dict[int, pd.DataFrame]:
+    """
+    Loads the training history of several regions with a single query (see `history.load_histories`).
+
+    Args:
+        cutoffs (dict): The training date (exclusive upper bound) for each region id.
+        window_days (int): If given, only the last `window_days` days of history are loaded.
+
+    Returns:
+        dict: A DataFrame with the columns `ds` and `y`, sorted by date, for each region id.
+    """
+    from anomaly_detection.predictions.history import load_histories
+
+    return {
+        region_id: history.to_frame()
+        for region_id, history in load_histories(cutoffs, window_days=window_days).items()
+    }
+
+
+def train_predictors(date: date_type, max_workers: Optional[int] = None) -> TrainingReport:
+    """
+    Trains every Predictor needed to predict the metrics of the given date.
+
+    Missing predictors are created and the history of every region is loaded at once. The Prophet
+    models are fitted in a pool of processes (or one after another in a daemonic process, such as a Celery
+    prefork worker, see `run_in_processes`), and the seasonal baselines in a single vectorized pass.
+    """
+    from django.utils import timezone
+
+    from anomaly_detection.predictions.models import Forecast, Predictor
+
+    start = time.monotonic()
+    aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+
+    created = Predictor.objects.create_missing(date=aware_datetime)
+    untrained_ids = list(
+        Predictor.objects.filter(
+            id__in=Predictor.objects.latest_not_expired(date=aware_datetime).values('id'),
+            parameters__isnull=True,
+            untrainable__isnull=True,
+        ).values_list('id', flat=True)
+    )
+    # Only fit the predictors that no other worker is fitting, and wait for the others at the end.
+    claimed_ids = Predictor.objects.claim_training(untrained_ids)
+    try:
+        trained, warm_started, fits, fit_elapsed = _train_claimed(date, claimed_ids, max_workers)
+    finally:
+        Predictor.objects.release_training(claimed_ids)
+    Predictor.objects.wait_training(list(set(untrained_ids) - set(claimed_ids)))
+    # The predictors trained with a shorter horizon (before a longer maximum age) have no forecast for the date.
+    Forecast.objects.replace_for(
+        Predictor.objects.filter(
+            id__in=Predictor.objects.latest_not_expired(date=aware_datetime).values('id'),
+            parameters__isnull=False,
+        ).exclude(forecasts__date=date).defer('weights', 'trend', 'yearly_seasonality')
+    )
+
+    elapsed = time.monotonic() - start
+    report = TrainingReport(
+        date=date,
+        created=created,
+        trained=trained,
+        warm_started=warm_started,
+        skipped=len(claimed_ids) - trained,
+        elapsed=elapsed,
+        fits_per_second=fits / fit_elapsed if fit_elapsed > 0 else 0.0,
+    )
+    logger.info(
+        "Trained %d predictors (%d warm started) for %s in %.1fs (%.2f fits/s, %d skipped, %d trained by others)",
+        report['trained'], report['warm_started'], date, elapsed, report['fits_per_second'], report['skipped'],
+        len(untrained_ids) - len(claimed_ids)
+    )
+    return report
+
+
+def _train_claimed(
+    date: date_type, predictor_ids: List[int], max_workers: Optional[int]
+) -> Tuple[int, int, int, float]:
+    """
+    Fits and saves the given predictors (see `train_predictors`). The ones whose history is not enough
+    are recorded as untrainable, so they are not fitted again (see `Predictor.set_untrainable`).
+
+    Returns:
+        tuple: The number of predictors trained, of them warm started, of fits, and the time spent fitting.
+    """
+    from django.conf import settings
+    from django.utils import timezone
+
+    from anomaly_detection.predictions.engines import PROPHET, SEASONAL, engine_of
+    from anomaly_detection.predictions.models import Forecast, Predictor
+    from anomaly_detection.predictions.seasonal import fit_seasonal_many
+
+    predictors = list(
+        Predictor.objects.filter(id__in=predictor_ids).only(
+            'id', 'region_id', 'last_training_date', 'engine', 'weights_version'
+        )
+    )
+    if not predictors:
+        return 0, 0, 0, 0.0
+    aware_datetime = timezone.make_aware(datetime.combine(date, datetime.min.time()))
+    window_days = training_window_days(Predictor.MIN_DAYS_FOR_TRAINING)
+    history = load_training_history({p.region_id: p.last_training_date for p in predictors}, window_days=window_days)
+    previous = Predictor.objects.previous_parameters(
+        region_ids=list(history.keys()), date=aware_datetime
+    ) if warm_start_enabled() else {}
+    previous = {
+        region_id: parameters for region_id, parameters in previous.items() if engine_of(parameters) == PROPHET
+    }
+    jobs = [
+        (
+            p.id,
+            history[p.region_id],
+            Predictor.MIN_DAYS_FOR_TRAINING,
+            Predictor.horizon_days(),
+            previous.get(p.region_id),
+        )
+        for p in predictors if p.region_id in history and p.engine != SEASONAL
+    ]
+    seasonal_histories = {
+        p.id: history[p.region_id] for p in predictors if p.region_id in history and p.engine == SEASONAL
+    }
+    predictor_by_id = {p.id: p for p in predictors}
+
+    trained = []
+    warm_started = 0
+    fit_start = time.monotonic()
+    seasonal_results = fit_seasonal_many(seasonal_histories, min_days=Predictor.MIN_DAYS_FOR_TRAINING)
+    for predictor_id, result in seasonal_results.items():
+        if result is not None:
+            predictor = predictor_by_id[predictor_id]
+            predictor.set_training_result(result, window_days=window_days)
+            trained.append(predictor)
+    # In a Celery prefork worker (a daemonic process), the models are fitted in the worker process itself.
+    fits = run_in_processes(_fit_job, jobs, max_workers=max_workers or default_max_workers())
+    # The predictors are only saved at the end, so their leases are extended while the fits complete.
+    renew_interval = settings.PREDICTOR_TRAINING_LEASE_SECONDS / 4
+    renewed_at = time.monotonic()
+    for i, (predictor_id, result) in enumerate(fits, start=1):
+        if time.monotonic() - renewed_at > renew_interval:
+            Predictor.objects.renew_training(predictor_ids)
+            renewed_at = time.monotonic()
+        if result is not None:
+            predictor = predictor_by_id[predictor_id]
+            predictor.set_training_result(result, window_days=window_days)
+            trained.append(predictor)
+            warm_started += result['warm_started']
+        if i % 500 == 0:
+            logger.info("Fitted %d/%d predictors for %s", i, len(jobs), date)
+
+    fit_elapsed = time.monotonic() - fit_start
+
+    Predictor.objects.bulk_update(trained, fields=Predictor.TRAINING_FIELDS, batch_size=100)
+    Forecast.objects.replace_for(predictors=trained)
+
+    trained_ids = {p.id for p in trained}
+    untrainable = [p for p in predictors if p.id not in trained_ids]
+    for predictor in untrainable:
+        predictor.set_untrainable(history.get(predictor.region_id, pd.DataFrame({'ds': [], 'y': []})))
+    Predictor.objects.bulk_update(untrainable, fields=Predictor.UNTRAINABLE_FIELDS, batch_size=1000)
+
+    return len(trained), warm_started, len(jobs) + len(seasonal_histories), fit_elapsed
@@ -1,4 +1,6 @@
 from datetime import datetime
+
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (OpenApiParameter, OpenApiResponse, extend_schema,
@@ -14,12 +16,16 @@ from rest_framework.viewsets import GenericViewSet
 from vectortiles.mixins import BaseVectorTileView
 from vectortiles.rest_framework.renderers import MVTRenderer
 
-from anomaly_detection.predictions.models import Metric, MetricPredictionProgress
+from anomaly_detection.predictions.models import IngestJob, Metric, MetricPredictionProgress
+from anomaly_detection.predictions.renderers import CSVRenderer, NDJSONRenderer
+from anomaly_detection.predictions.tile_cache import cached_tile, metric_tiles_namespace
 from anomaly_detection.predictions.serializers import (
-    LastMetricDateSerializer, MetricDetailSerializer, MetricFileSerializer,
-    MetricSeasonalitySerializer, MetricSerializer, MetricTrendSerializer)
+    IngestJobSerializer, LastMetricDateSerializer, MetricDetailSerializer, MetricFileSerializer,
+    MetricSeasonalitySerializer, MetricSerializer, MetricSeriesQuerySerializer, MetricSeriesSerializer,
+    MetricTrendSerializer)
 from anomaly_detection.predictions.vector_layers import \
     MetricMunicipalityVectorLayer
+from anomaly_detection.utils.pagination import KeysetPagination
 
 
 @extend_schema_view(
@@ -50,6 +56,28 @@ from anomaly_detection.predictions.vector_layers import \
                 enum=['date', '-date'],
                 description='Order by `date` (asc) or `-date` (desc)',
             ),
+            OpenApiParameter(
+                name='pagination',
+                type=OpenApiTypes.STR,
+                enum=['page', 'cursor'],
+                description='Paginate by page number (default), or by cursor: every page is requested with the '
+                            '`next` link of the previous one, and costs the same however deep it is.',
+                required=False,
+            ),
+            OpenApiParameter(
+                name='cursor',
+                type=OpenApiTypes.STR,
+                description='Position of the page (with `pagination=cursor`), taken from the `next` link.',
+                required=False,
+            ),
+            OpenApiParameter(
+                name='count',
+                type=OpenApiTypes.STR,
+                enum=['exact', 'estimate'],
+                description='Whether the total number of results is counted (with `pagination=cursor`), '
+                            'or estimated by the query planner. Not counted by default.',
+                required=False,
+            ),
         ]
     ),
     get_tiles=extend_schema(
@@ -62,8 +90,43 @@ from anomaly_detection.predictions.vector_layers import \
             ),
         ],
     ),
+    get_export=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='region_code',
+                type=OpenApiTypes.STR,
+                description='Region of the history to export.',
+                required=True,
+            ),
+            OpenApiParameter(
+                name='date_from',
+                type=OpenApiTypes.DATE,
+                description='Starting date from which the history will be exported.',
+                required=False,
+            ),
+            OpenApiParameter(
+                name='date_to',
+                type=OpenApiTypes.DATE,
+                description='Ending date which to the history will be exported.',
+                required=False,
+            ),
+            OpenApiParameter(
+                name='format',
+                type=OpenApiTypes.STR,
+                enum=['csv', 'ndjson'],
+                description='Format of the export: CSV (default) or newline delimited JSON.',
+                required=False,
+            ),
+        ],
+        responses={
+            (200, CSVRenderer.media_type): OpenApiTypes.STR,
+            (200, NDJSONRenderer.media_type): OpenApiTypes.STR,
+        },
+    ),
+    get_series=extend_schema(parameters=[MetricSeriesQuerySerializer]),
     get_last_date=extend_schema(operation_id="metrics_last_date_retrieve"),
-    post_batch_create=extend_schema(responses={201: OpenApiResponse(description='File processes successfully.')})
+    post_batch_create=extend_schema(responses={202: IngestJobSerializer}),
+    get_batch_job=extend_schema(responses={200: IngestJobSerializer, 404: OpenApiResponse(description='Not found.')}),
 )
 class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, RetrieveModelMixin):
     """
@@ -78,10 +141,28 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
     ]
     ordering_fields = ['date']
     ordering = ['-date']
+    # Fields of the keyset of the cursor pagination, unique together (see `KeysetPagination`).
+    keyset_fields = ('date', 'region_id')
 
     id = "features"
     tile_fields = ('anomaly_degree', )
 
+    # Columns of the exported history, and number of rows fetched at once by its server-side cursor.
+    EXPORT_FIELDS = ('date', 'value', 'predicted_value', 'lower_value', 'upper_value', 'anomaly_degree')
+    EXPORT_CHUNK_ROWS = 2000
+
+    @property
+    def paginator(self):
+        """
+        The list is paginated by cursor (see `KeysetPagination`) instead of by page number
+        if the `pagination=cursor` query parameter is given.
+        """
+        if self.action == 'list' and self.request.query_params.get('pagination') == 'cursor':
+            if not isinstance(getattr(self, '_paginator', None), KeysetPagination):
+                self._paginator = KeysetPagination()
+            return self._paginator
+        return super().paginator
+
     def get_layer_class_kwargs(self):
         return {'date': self.request.query_params.get('date')}
 
@@ -99,11 +180,64 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
         url_name='tiles')
     def get_tiles(self, request, z, x, y, *args, **kwargs):
         """
-        Action that returns the tiles of a specified area and zoom
+        Action that returns the tiles of a specified area and zoom.
+        The tiles are cached by date (see `tile_cache`), so they are rendered only once until the
+        predictions of the date are rewritten.
         """
         z, x, y = int(z), int(x), int(y)
-        content, status = self.get_content_status(z, x, y)
-        return Response(content, status=status)
+        namespace = metric_tiles_namespace(request.query_params.get('date'))
+        content = cached_tile(namespace, z, x, y, lambda: self.get_layer_tiles(z, x, y))
+        return Response(content, status=200 if content else 204)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='export',
+        url_name='export',
+        renderer_classes=(CSVRenderer, NDJSONRenderer),
+        pagination_class=None,
+    )
+    def get_export(self, request, *args, **kwargs):
+        """
+        Action that streams the whole history of a region, sorted by date, without paginating it.\n
+        The metrics are read with a server-side cursor and written as they are read, so the memory used
+        does not depend on the length of the history.
+        """
+        region_code = request.query_params.get('region_code')
+        if not region_code:
+            raise ValidationError({'region_code': 'This parameter is required.'})
+
+        rows = self.get_queryset().order_by('date').values_list(*self.EXPORT_FIELDS).iterator(
+            chunk_size=self.EXPORT_CHUNK_ROWS
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(self.EXPORT_FIELDS, rows),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="metrics_{region_code}.{renderer.format}"'
+        return response
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path='series',
+        url_name='series',
+        serializer_class=MetricSeriesSerializer,
+        pagination_class=None,
+    )
+    def get_series(self, request, *args, **kwargs):
+        """
+        Action that returns the history of a region as parallel arrays (dates, values, predictions,
+        bands and anomaly degrees) sorted by date, to be charted.\n
+        With **resolution=week** or **resolution=month**, the metrics are averaged by period (and the
+        anomaly degree is the most extreme one of the period), for long ranges of dates.
+        """
+        query = MetricSeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        serializer = self.get_serializer(Metric.series(**query.validated_data))
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         methods=['GET'],
@@ -116,7 +250,7 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
         """
         Action that returns the last date in which there are metrics available.
         """
-        last_execution = MetricPredictionProgress.objects.filter(success_percentage__gte=0.95).order_by("-date").first()
+        last_execution = MetricPredictionProgress.last_complete()
         if last_execution:
             serializer = self.get_serializer({"date": last_execution.date})
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -178,20 +312,43 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
     )
     def post_batch_create(self, request, *args, **kwargs):
         """
-        Action that creates a batch of metrics, and calls a Predictor model to predict values.\n
+        Action that uploads a batch of metrics, which are inserted and predicted asynchronously.\n
         The endpoint accepts a **CSV file** with the following filename format: **"bites_YYYY-MM-DD.csv**",
         and with the following columns: **[code, est]**.\n
         The CSV should contain every region for a specific day (specified in the filename), where
-        the "code" is the region code and the "est" is the value.
+        the "code" is the region code and the "est" is the value.\n
+        With **mode=upsert**, the metrics that already exist are updated instead of failing the upload,
+        and only the ones whose value changed are rewritten.\n
+        The response is the ingest job of the file, whose status can be retrieved from **batch/{job_id}**.
         """
-        serializer = self.get_serializer(data=request.FILES)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        created_metrics = serializer.save()
+        job = serializer.save()
+
+        return Response(IngestJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
+    @action(
+        methods=['GET'],
+        detail=False,
+        url_path=r'batch/(?P<job_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})',
+        url_name='batch-job',
+        serializer_class=IngestJobSerializer,
+        authentication_classes=[TokenAuthentication],
+        permission_classes=[IsAuthenticated]
+    )
+    def get_batch_job(self, request, job_id, *args, **kwargs):
+        """
+        Action that returns the status of an ingest job, with the number of parsed, inserted,
+        predicted and failed rows.
+        """
+        job = IngestJob.objects.filter(id=job_id).defer('content').first()
+        if job:
+            serializer = self.get_serializer(job)
+            return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(
-            {"detail": f"File processed successfully. {len(created_metrics)} metrics created"},
-            status=status.HTTP_201_CREATED
+            {"detail": f'No ingest job {job_id} found.'},
+            status=status.HTTP_404_NOT_FOUND
         )
 
     def get_queryset(self):
@@ -201,7 +358,7 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
         """
         queryset = super().get_queryset()
 
-        if self.action == 'list':
+        if self.action in ('list', 'get_export'):
             date_from = self.request.query_params.get('date_from')
             date_to = self.request.query_params.get('date_to')
             region_code = self.request.query_params.get('region_code')
@@ -211,6 +368,11 @@ class MetricViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
                 queryset = queryset.filter(date__lte=date_to)
             if region_code:
                 queryset = queryset.filter(region__code=region_code)
+        elif self.action == 'retrieve':
+            # Only the training status of the predictor is serialized, not its model.
+            queryset = queryset.select_related('predictor').defer(
+                'predictor__weights', 'predictor__trend', 'predictor__yearly_seasonality'
+            )
 
         return queryset.all()
 
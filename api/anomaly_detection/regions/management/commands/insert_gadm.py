@@ -3,6 +3,7 @@ from django.contrib.gis.utils import LayerMapping
 import geopandas as gpd
 from django.core.management.base import BaseCommand
 
+from anomaly_detection.predictions.tile_cache import invalidate_region_tiles
 from anomaly_detection.regions.models import (AutonomousCommunity, Country,
                                               Municipality, Province)
 
@@ -231,6 +232,8 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR(f"Error inserting data: {e}"))
             return
         print("\nInserted data into the database")
+        # The cached tiles have the old geometries.
+        invalidate_region_tiles()
 
         # Clean up the temporary files
         os.remove(municipalities_path)
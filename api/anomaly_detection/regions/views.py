@@ -7,6 +7,7 @@ from rest_framework.viewsets import GenericViewSet
 from vectortiles.mixins import BaseVectorTileView
 from vectortiles.rest_framework.renderers import MVTRenderer
 
+from anomaly_detection.predictions.tile_cache import REGION_TILES_NAMESPACE, cached_tile
 from anomaly_detection.regions.models import Municipality
 from anomaly_detection.regions.serializers import MunicipalityRetrieveSerializer, MunicipalitySerializer
 from anomaly_detection.regions.vector_layers import MunicipalityVectorLayer, ProvinceVectorLayer
@@ -49,11 +50,12 @@ class RegionViewSet(BaseVectorTileView, GenericViewSet, ListModelMixin, Retrieve
         url_name='tiles')
     def get_tiles(self, request, z, x, y, *args, **kwargs):
         """
-        Action that returns the tiles of a specified area and zoom
+        Action that returns the tiles of a specified area and zoom.
+        The tiles are cached (see `tile_cache`) until the regions are loaded again.
         """
         z, x, y = int(z), int(x), int(y)
-        content, status = self.get_content_status(z, x, y)
-        return Response(content, status=status)
+        content = cached_tile(REGION_TILES_NAMESPACE, z, x, y, lambda: self.get_layer_tiles(z, x, y))
+        return Response(content, status=200 if content else 204)
 
     def get_queryset(self):
         """
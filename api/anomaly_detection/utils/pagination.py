@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
@@ -8,3 +18,146 @@ class StandardPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     page_query_param = 'page'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination class for the API. Every page starts after the last row of the previous one,
+    filtering by the values of the `keyset_fields` of the view instead of skipping the previous rows with an
+    OFFSET, so every page costs the same. The fields must be unique together, and indexed (leading with the
+    first one) for the filter to be efficient. The rows are sorted by them, in the direction of the first
+    field of the ordering of the queryset.
+    The total number of rows is only counted if asked: exactly (`count=exact`) or estimated by the query
+    planner (`count=estimate`).
+    """
+    page_size = StandardPagination.page_size
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keyset_fields = view.keyset_fields
+        self.count = self.get_count(queryset, request)
+
+        ordering = queryset.query.order_by
+        self.descending = bool(ordering) and str(ordering[0]).startswith('-')
+        prefix = '-' if self.descending else ''
+        queryset = queryset.order_by(*(prefix + field for field in self.keyset_fields))
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.next_position = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_position = [self._to_json(getattr(rows[-1], field)) for field in self.keyset_fields]
+        return rows
+
+    def after(self, position) -> Q:
+        """
+        Returns the filter of the rows after the position (the values of the keyset fields of a row).
+        The first field is also bounded on its own, so the filter can be used as an index condition.
+        """
+        lookup = 'lt' if self.descending else 'gt'
+        first_field, first_value = self.keyset_fields[0], position[0]
+        condition = Q()
+        for i, (field, value) in enumerate(zip(self.keyset_fields, position)):
+            equal = {f: v for f, v in zip(self.keyset_fields[:i], position[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+        return Q(**{f'{first_field}__{lookup}e': first_value}) & condition
+
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return self.estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def estimate_count(queryset) -> int:
+        """
+        Returns the number of rows of the queryset estimated by the query planner, without running it.
+        """
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        # The plan is a JSON array with the plan of the query.
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        """
+        Returns the position of the cursor of the request, with the value of every keyset field of the model
+        parsed, or None if there is no cursor. A cursor that can not be parsed is not found.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            if not isinstance(position, list) or len(position) != len(self.keyset_fields):
+                raise ValueError(cursor)
+            position = [
+                model._meta.get_field(field).to_python(value) for field, value in zip(self.keyset_fields, position)
+            ]
+            if any(value is None for value in position):
+                raise ValueError(cursor)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position) -> str:
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    @staticmethod
+    def _to_json(value):
+        return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        # The rows are only counted for the first page.
+        url = remove_query_param(self.request.build_absolute_uri(), self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['count', 'next', 'results'],
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                    'example': 123,
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
@@ -0,0 +1,37 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator
+
+from django.db import connections
+
+
+def can_start_processes() -> bool:
+    """
+    Whether the current process can start child processes. The daemonic ones, such as the child processes
+    of a Celery prefork worker, can not.
+    """
+    return not multiprocessing.current_process().daemon
+
+
+def run_in_processes(fn: Callable[[Any], Any], jobs: Iterable[Any], max_workers: int) -> Iterator[Any]:
+    """
+    Yields the result of `fn` for every job, as they are completed, computed in a pool of up to `max_workers`
+    processes. If only one worker is asked, or the current process can not start processes (see
+    `can_start_processes`), the jobs are run in the current process, one after another.
+    `fn` must be a module level function, so it can be pickled.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    if max_workers <= 1 or len(jobs) == 1 or not can_start_processes():
+        for job in jobs:
+            yield fn(job)
+        return
+
+    # The forked processes must not share the connection of the parent process.
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = [executor.submit(fn, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
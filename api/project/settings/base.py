@@ -6,6 +6,8 @@ Base settings to build other settings files upon.
 import os
 from pathlib import Path
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -203,3 +205,92 @@ SPECTACULAR_SETTINGS = {
 
 # django-lb-health-check settings
 ALIVENESS_URL = "/ping/"
+
+
+# * CELERY
+# ------------------------------------------------------------------------------
+# The tasks are split in queues, so the CPU-heavy trainings do not delay the scoring nor the bookkeeping
+# (see scripts/start_worker for the worker of each queue).
+CELERY_TASK_DEFAULT_QUEUE = 'bookkeeping'
+CELERY_TASK_ROUTES = {
+    # Fit the Prophet models of a date in a pool of processes (minutes per run).
+    'anomaly_detection.predictions.tasks.train_predictors_task': {'queue': 'training'},
+    'anomaly_detection.predictions.tasks.train_date_task': {'queue': 'training'},
+    'anomaly_detection.predictions.tasks.pretrain_predictors_task': {'queue': 'training'},
+    # Fit a single model or render a batch of tiles in the worker process (seconds), not behind the bulk
+    # trainings. The batches of a date are rendered in parallel by the processes of the queue.
+    'anomaly_detection.predictions.tasks.refresh_prediction_task': {'queue': 'refresh'},
+    'anomaly_detection.predictions.tasks.seed_tiles_task': {'queue': 'refresh'},
+    'anomaly_detection.predictions.tasks.seed_tiles_batch_task': {'queue': 'refresh'},
+    # Predict metrics from trained predictors (milliseconds per predictor).
+    'anomaly_detection.predictions.tasks.predict_date_task': {'queue': 'scoring'},
+    'anomaly_detection.predictions.tasks.backfill_chunk_task': {'queue': 'scoring'},
+    'anomaly_detection.predictions.tasks.batch_update_metrics_for_predictor_task': {'queue': 'scoring'},
+    # The rest (ingestion, backfill set-up) go to the default queue: bookkeeping.
+}
+# Long tasks must not hold prefetched messages that idle workers could run.
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1))
+# Periodic tasks, run by the beat (see scripts/start_beat).
+CELERY_BEAT_SCHEDULE = {
+    # Train the predictors of the next upload before it arrives, so the upload only scores its metrics.
+    'pretrain-predictors': {
+        'task': 'anomaly_detection.predictions.tasks.pretrain_predictors_task',
+        'schedule': crontab(
+            hour=int(os.environ.get("PRETRAINING_HOUR", 2)),
+            minute=int(os.environ.get("PRETRAINING_MINUTE", 0)),
+        ),
+    },
+}
+
+
+# * PREDICTIONS
+# ------------------------------------------------------------------------------
+# Whether the predictors are fitted starting from the parameters of the previous predictor of the region.
+# The optimizer may stop at a slightly different optimum: in the benchmark (see `benchmark_training`), the
+# forecasts of the warm started fits differed from the cold ones by up to ~0.013.
+PREDICTOR_WARM_START = os.environ.get("PREDICTOR_WARM_START", "True").lower() == 'true'
+# Days of history before the training date used to train the predictors. By default (0), the whole history.
+# Opt in with a number of days (e.g. 1095, three years) so the fit cost does not grow with every year of data,
+# after comparing the fit times and forecasts with `benchmark_training_window`. Never less than
+# Predictor.MIN_DAYS_FOR_TRAINING.
+PREDICTOR_TRAINING_WINDOW_DAYS = int(os.environ.get("PREDICTOR_TRAINING_WINDOW_DAYS", 0))
+# Engine used to train the new predictors: 'prophet' or 'seasonal' (a day-of-year median baseline).
+PREDICTOR_ENGINE = os.environ.get("PREDICTOR_ENGINE", "prophet")
+# Engine of the new predictors of specific regions, by the code of the municipality.
+PREDICTOR_ENGINE_BY_REGION = {}
+# Seconds after which the training lease of a predictor expires, if its worker did not release it.
+PREDICTOR_TRAINING_LEASE_SECONDS = int(os.environ.get("PREDICTOR_TRAINING_LEASE_SECONDS", 30 * 60))
+# When the predictors are retrained: 'schedule' (every Predictor.EXPIRY_DAYS, staggered by region, the default),
+# or 'drift' (opt-in: when the residuals of their predictions cross the thresholds below, or at their maximum age).
+PREDICTOR_RETRAINING_POLICY = os.environ.get("PREDICTOR_RETRAINING_POLICY", "schedule")
+# Maximum days a predictor is used with the drift policy, shortened by up to Predictor.EXPIRY_DAYS by region.
+PREDICTOR_MAX_AGE_DAYS = int(os.environ.get("PREDICTOR_MAX_AGE_DAYS", 90))
+# Residuals of a predictor from which it is stale with the drift policy: the minimum number of metrics
+# scored, and the maximum mean absolute error and rate of values outside the prediction interval.
+PREDICTOR_DRIFT_MIN_SCORED = int(os.environ.get("PREDICTOR_DRIFT_MIN_SCORED", 14))
+PREDICTOR_DRIFT_MAX_ERROR = float(os.environ.get("PREDICTOR_DRIFT_MAX_ERROR", 0.1))
+PREDICTOR_DRIFT_MAX_OUTSIDE_RATE = float(os.environ.get("PREDICTOR_DRIFT_MAX_OUTSIDE_RATE", 0.5))
+# Number of predictors predicted by every task of a backfill (predict_batch), and maximum number of
+# those tasks queued at the same time (0 to use the number of CPUs).
+BACKFILL_CHUNK_SIZE = int(os.environ.get("BACKFILL_CHUNK_SIZE", 100))
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", 0))
+
+
+# * TILES
+# ------------------------------------------------------------------------------
+# Cache of the metric tiles by date: 'filesystem', 'redis' (any Redis-compatible server, it needs the
+# `redis` package) or '' to disable it. The tiles of a date are invalidated when its predictions are rewritten.
+TILE_CACHE_BACKEND = os.environ.get("TILE_CACHE_BACKEND", "filesystem")
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", str(BASE_DIR / '../tiles'))
+TILE_CACHE_REDIS_URL = os.environ.get("TILE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Maximum number of namespaces (the tiles of a date, or of the regions) kept by the filesystem cache: the ones
+# written least recently are deleted (0 for no limit). The Redis one is bounded by the server (`maxmemory`).
+TILE_CACHE_MAX_NAMESPACES = int(os.environ.get("TILE_CACHE_MAX_NAMESPACES", 400))
+# Seeding of the tile cache (see the `seed_tiles` command): the metric and region tiles of a date are rendered
+# in advance, from the minimum to the maximum zoom level, as soon as its metrics are predicted.
+TILE_SEED_ON_COMPLETE = os.environ.get("TILE_SEED_ON_COMPLETE", "True").lower() == 'true'
+TILE_SEED_MIN_ZOOM = int(os.environ.get("TILE_SEED_MIN_ZOOM", 0))
+TILE_SEED_MAX_ZOOM = int(os.environ.get("TILE_SEED_MAX_ZOOM", 9))
+TILE_SEED_MAX_WORKERS = int(os.environ.get("TILE_SEED_MAX_WORKERS", 4))
+# Number of tiles rendered by every job of a worker process (or every task of the `refresh` queue).
+TILE_SEED_BATCH_SIZE = int(os.environ.get("TILE_SEED_BATCH_SIZE", 100))